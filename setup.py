@@ -460,7 +460,8 @@ class TestCommand(TestBaseCommand):
         testfiles = []
         for t in glob.glob(os.path.join(self._dir, 'tests', '*.py')):
             if (t.endswith("__init__.py") or
-                t.endswith("urltest.py")):
+                t.endswith("urltest.py") or
+                t.endswith("xmlbench.py")):
                 continue
 
             base = os.path.basename(t)
@@ -515,6 +516,59 @@ class TestURLFetch(TestBaseCommand):
         TestBaseCommand.run(self)
 
 
+class BenchXML(Command):
+    description = "Benchmark virtinst XML parsing and generation"
+
+    user_options = [
+        ("iterations=", "n", "Times to run over the XML corpus "
+                             "[default: 20]"),
+        ("baseline=", None, "Compare against this saved baseline file, "
+                            "fail on regressions"),
+        ("save-baseline=", None, "Save the results to this baseline file"),
+        ("tolerance=", None, "Allowed ops/sec drop against the baseline "
+                             "in percent [default: 15]"),
+    ]
+
+    def initialize_options(self):
+        self.iterations = 20
+        self.baseline = None
+        self.save_baseline = None
+        self.tolerance = None
+
+    def finalize_options(self):
+        self.iterations = int(self.iterations)
+        if self.tolerance is not None:
+            self.tolerance = float(self.tolerance)
+
+    def run(self):
+        import tests
+        ignore = tests
+        from tests import xmlbench
+
+        baseline = None
+        if self.baseline:
+            baseline = xmlbench.load_baseline(self.baseline)
+
+        results = xmlbench.run_benchmark(self.iterations)
+        print xmlbench.format_results(results, baseline)
+
+        if self.save_baseline:
+            xmlbench.save_baseline(self.save_baseline, results)
+            print "Saved baseline to %s" % self.save_baseline
+
+        if baseline:
+            tolerance = self.tolerance
+            if tolerance is None:
+                tolerance = xmlbench.DEFAULT_TOLERANCE
+            regressions = xmlbench.compare_baseline(results, baseline,
+                                                    tolerance)
+            for phase, change in regressions:
+                print "Regression: %s is %.1f%% slower than baseline" % (
+                    phase, -change)
+            if regressions:
+                sys.exit(1)
+
+
 class CheckPylint(Command):
     user_options = []
     description = "Check code using pylint and pep8"
@@ -604,5 +658,6 @@ setup(
         'rpm': my_rpm,
         'test': TestCommand,
         'test_urls' : TestURLFetch,
+        'bench_xml': BenchXML,
     }
 )
@@ -0,0 +1,110 @@
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free  Software Foundation; either version 2 of the License, or
+# (at your option)  any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+import unittest
+
+from virtManager.statsrecord import vmmStatsRecord
+
+
+def _fill(record, values):
+    for val in values:
+        record.append({"cpu": val, "rx": val * 10, "tx": val * 20})
+
+
+class TestStatsRecord(unittest.TestCase):
+
+    def _make_record(self, capacity=4):
+        return vmmStatsRecord(["cpu", "rx", "tx"], capacity,
+                              percent_fields=["cpu"])
+
+    def testAppend(self):
+        """
+        Newest sample first, unused slots read as 0
+        """
+        record = self._make_record()
+        self.assertEquals(len(record), 0)
+        self.assertRaises(IndexError, record.get, "cpu")
+
+        _fill(record, [1, 2])
+        self.assertEquals(len(record), 2)
+        self.assertEquals(record.get("cpu"), 2)
+        self.assertEquals(record.get("cpu", 1), 1)
+        self.assertEquals(list(record.vector("cpu")), [2, 1, 0, 0])
+        self.assertEquals(list(record.fraction_vector("cpu", 2)),
+                          [0.02, 0.01])
+
+    def testWraparound(self):
+        """
+        Once full, the oldest sample is dropped and vectors stay newest
+        first across the end of the ring
+        """
+        record = self._make_record()
+        _fill(record, range(1, 11))
+
+        self.assertEquals(len(record), 4)
+        self.assertEquals(record.get("cpu", 3), 7)
+        self.assertRaises(IndexError, record.get, "cpu", 4)
+        self.assertEquals(list(record.vector("cpu")), [10, 9, 8, 7])
+        self.assertEquals(list(record.vector("rx", 2)), [100, 90])
+        self.assertEquals(record.max_value("tx"), 200)
+
+        record.set("cpu", 50, idx=1)
+        self.assertEquals(list(record.vector("cpu")), [10, 50, 8, 7])
+        self.assertEquals(record.fraction_vector("cpu")[1], 0.5)
+
+        record.clear()
+        self.assertEquals(len(record), 0)
+        self.assertEquals(list(record.vector("cpu")), [0, 0, 0, 0])
+        self.assertEquals(record.max_value("cpu"), 0)
+
+    def testVectorViews(self):
+        """
+        Views read the record lazily and don't move on append
+        """
+        record = self._make_record(capacity=8)
+        _fill(record, [1, 2, 3])
+
+        view = record.vector("cpu", 3)
+        _fill(record, [4])
+        self.assertEquals(list(view), [3, 2, 1])
+        self.assertEquals(view[-1], 1)
+        self.assertEquals(view[0:2], [3, 2])
+        self.assertRaises(IndexError, lambda: view[3])
+
+        inout = record.in_out_vector("rx", "tx", 10, length=2)
+        self.assertEquals(len(inout), 4)
+        self.assertEquals(list(inout), [4, 3, 8, 6])
+
+        avg = record.in_out_vector("rx", "tx", 10, length=2, average=True)
+        self.assertEquals(len(avg), 2)
+        self.assertEquals(list(avg), [6, 4.5])
+
+    def testDataVersion(self):
+        """
+        View data versions only change when the record does
+        """
+        record = self._make_record()
+        _fill(record, [1])
+
+        version = record.vector("cpu", 2).get_data_version()
+        self.assertEquals(record.vector("cpu", 2).get_data_version(),
+                          version)
+        self.assertNotEquals(record.vector("cpu", 3).get_data_version(),
+                             version)
+
+        record.set("cpu", 5)
+        self.assertNotEquals(record.vector("cpu", 2).get_data_version(),
+                             version)
@@ -0,0 +1,145 @@
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free  Software Foundation; either version 2 of the License, or
+# (at your option)  any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from virtManager import statsstore
+from virtManager.statsstore import vmmStatsStore
+
+
+class TestStatsStore(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp(prefix="virtmanager-stats")
+        self._path = os.path.join(self._dir, "stats", "test.stats")
+        self._known = []
+        self._stores = []
+
+    def tearDown(self):
+        for store in self._stores:
+            store.close()
+        shutil.rmtree(self._dir)
+
+    def _open(self, fields=None):
+        store = vmmStatsStore(self._path, fields or ["cpu", "mem"],
+                              known_uuids_cb=lambda: self._known)
+        self._stores.append(store)
+        return store
+
+    def _cpu(self, store, uuid, resolution):
+        return [(s["timestamp"], s["cpu"])
+                for s in store.history(uuid, resolution)]
+
+    def testRawRing(self):
+        """
+        Raw samples are kept oldest first, up to the ring size
+        """
+        store = self._open()
+        count = store.get_capacity("raw")
+        for idx in range(count + 5):
+            store.append("vm1", {"timestamp": idx, "cpu": idx})
+
+        history = self._cpu(store, "vm1", "raw")
+        self.assertEquals(len(history), count)
+        self.assertEquals(history[0], (5, 5))
+        self.assertEquals(history[-1], (count + 4, count + 4))
+        self.assertEquals(store.history("vm2", "raw"), [])
+        self.assertRaises(ValueError, store.get_capacity, "day")
+
+    def testRollup(self):
+        """
+        A minute record is the average of its samples, written once
+        the next minute starts
+        """
+        store = self._open()
+        for timestamp, cpu in [(60, 10), (90, 20), (119, 60), (120, 5)]:
+            store.append("vm1", {"timestamp": timestamp, "cpu": cpu})
+
+        self.assertEquals(self._cpu(store, "vm1", "minute"), [(60, 30)])
+        self.assertEquals(self._cpu(store, "vm1", "hour"), [])
+
+        store.append("vm1", {"timestamp": 3600, "cpu": 0})
+        self.assertEquals(self._cpu(store, "vm1", "minute"),
+                          [(60, 30), (120, 5)])
+        self.assertEquals(self._cpu(store, "vm1", "hour"), [(0, 23.75)])
+
+    def testReopen(self):
+        """
+        History survives reopening, a field change resets the file
+        """
+        store = self._open()
+        store.append("vm1", {"timestamp": 1, "cpu": 50})
+        store.close()
+
+        store = self._open()
+        self.assertEquals(self._cpu(store, "vm1", "raw"), [(1, 50)])
+        store.close()
+
+        store = self._open(fields=["cpu"])
+        self.assertEquals(store.history("vm1", "raw"), [])
+
+    def testSlotReclaim(self):
+        """
+        New VMs take over the slot of a VM that went away, and nothing
+        is saved for new VMs once the file is full
+        """
+        origmax = statsstore.MAX_SLOTS
+        statsstore.MAX_SLOTS = 2
+        try:
+            store = self._open()
+            self._known = ["vm1", "vm2"]
+            store.append("vm1", {"timestamp": 1, "cpu": 1})
+            store.append("vm2", {"timestamp": 1, "cpu": 2})
+            size = os.path.getsize(self._path)
+
+            self._known = ["vm2", "vm3"]
+            store.append("vm3", {"timestamp": 2, "cpu": 3})
+            self.assertEquals(os.path.getsize(self._path), size)
+            self.assertEquals(store.history("vm1", "raw"), [])
+            self.assertEquals(self._cpu(store, "vm3", "raw"), [(2, 3)])
+            self.assertEquals(self._cpu(store, "vm2", "raw"), [(1, 2)])
+
+            self._known = ["vm2", "vm3", "vm4"]
+            store.append("vm4", {"timestamp": 3, "cpu": 4})
+            self.assertEquals(store.history("vm4", "raw"), [])
+        finally:
+            statsstore.MAX_SLOTS = origmax
+
+    def testReadOnly(self):
+        """
+        A store that can't get the file lock doesn't write anything
+        """
+        store = self._open()
+        store.append("vm1", {"timestamp": 1, "cpu": 1})
+
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                other = vmmStatsStore(self._path, ["cpu", "mem"])
+                other.append("vm1", {"timestamp": 2, "cpu": 2})
+                if [s["cpu"] for s in other.history("vm1", "raw")] == [1]:
+                    status = 0
+                other.close()
+            finally:
+                os._exit(status)
+
+        ignore, status = os.waitpid(pid, 0)
+        self.assertEquals(status, 0)
+        self.assertEquals(self._cpu(store, "vm1", "raw"), [(1, 1)])
@@ -0,0 +1,135 @@
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free  Software Foundation; either version 2 of the License, or
+# (at your option)  any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+import unittest
+
+from virtManager.volumeindex import vmmVolumeIndex
+
+
+class _FakeVolume(object):
+    """
+    Just the vmmStorageVolume bits the index looks at
+    """
+    def __init__(self, name, path, fmt, capacity):
+        self._name = name
+        self._path = path
+        self._format = fmt
+        self._capacity = capacity
+
+    def get_name(self):
+        return self._name
+    def get_target_path(self):
+        return self._path
+    def get_format(self):
+        if self._format is None:
+            raise RuntimeError("volume went away")
+        return self._format
+    def get_capacity(self):
+        return self._capacity
+
+
+def _names(entries):
+    return [e.name for e in entries]
+
+
+class TestVolumeIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = vmmVolumeIndex()
+        self.index.update_pool("pool1", [
+            _FakeVolume("fedora.qcow2", "/images/fedora.qcow2",
+                        "qcow2", 10 * 1024 * 1024 * 1024),
+            _FakeVolume("debian.img", "/images/debian.img",
+                        "raw", 512 * 1024 * 1024),
+        ], [])
+        self.index.update_pool("pool2", [
+            _FakeVolume("data.qcow2", "/srv/data.qcow2",
+                        "qcow2", 1024 * 1024 * 1024 * 2),
+        ], [])
+
+    def testProcessPending(self):
+        """
+        Nothing is indexed until the pending updates are processed
+        """
+        self.assertEquals(len(self.index), 0)
+        self.assertEquals(self.index.search("qcow2"), [])
+
+        self.assertTrue(self.index.process_pending())
+        self.assertFalse(self.index.process_pending())
+        self.assertEquals(len(self.index), 3)
+        self.assertTrue(self.index.has_pool("pool2"))
+
+    def testSearch(self):
+        """
+        Every word has to match the name, path, format or size
+        """
+        self.index.process_pending()
+
+        self.assertEquals(_names(self.index.search("QCOW2")),
+                          ["data.qcow2", "fedora.qcow2"])
+        self.assertEquals(_names(self.index.search("images raw")),
+                          ["debian.img"])
+        self.assertEquals(_names(self.index.search("/srv")),
+                          ["data.qcow2"])
+        self.assertEquals(_names(self.index.search("10.00 gb")),
+                          ["fedora.qcow2"])
+        self.assertEquals(_names(self.index.search("images qcow2 raw")),
+                          [])
+        self.assertEquals(len(self.index.search("", limit=2)), 2)
+
+        entry = self.index.search("debian")[0]
+        self.assertEquals(entry.pool_uuid, "pool1")
+        self.assertEquals(entry.path, "/images/debian.img")
+        self.assertEquals(entry.get_pretty_capacity(), "512.00 MB")
+
+    def testUpdate(self):
+        """
+        Changed volumes replace their entry, removed and broken ones
+        drop out, and removing a pool drops its queued updates
+        """
+        self.index.process_pending()
+        self.index.update_pool("pool1", [
+            _FakeVolume("fedora.qcow2", "/images/fedora.qcow2",
+                        "raw", 1024),
+            _FakeVolume("broken.img", "/images/broken.img", None, 0),
+        ], ["debian.img"])
+        self.index.process_pending()
+
+        self.assertEquals(_names(self.index.search("images")),
+                          ["fedora.qcow2"])
+        self.assertEquals(self.index.search("fedora")[0].format, "raw")
+
+        self.index.update_pool("pool2", [
+            _FakeVolume("new.img", "/srv/new.img", "raw", 1024),
+        ], [])
+        self.index.remove_pool("pool2")
+        self.index.process_pending()
+        self.assertFalse(self.index.has_pool("pool2"))
+        self.assertEquals(_names(self.index.search("")), ["fedora.qcow2"])
+
+    def testUsers(self):
+        self.assertEquals(self.index.get_users("/images/debian.img"), [])
+        self.assertTrue(self.index.set_users({"/images/debian.img":
+                                              ["vm1", "vm2"]}))
+        self.assertFalse(self.index.set_users({"/images/debian.img":
+                                               ["vm1", "vm2"]}))
+        self.assertEquals(self.index.get_users("/images/debian.img"),
+                          ["vm1", "vm2"])
+
+        self.index.enable()
+        self.index.clear()
+        self.assertFalse(self.index.is_enabled())
+        self.assertEquals(self.index.get_users("/images/debian.img"), [])
@@ -0,0 +1,83 @@
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free  Software Foundation; either version 2 of the License, or
+# (at your option)  any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+import threading
+import unittest
+
+from virtManager.workerpool import vmmWorkerPool, CANCELLED
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self._release = threading.Event()
+        self._pools = []
+
+    def tearDown(self):
+        self._release.set()
+        for pool in self._pools:
+            pool.close()
+
+    def _make_pool(self, maxthreads):
+        pool = vmmWorkerPool("test", maxthreads)
+        self._pools.append(pool)
+        return pool
+
+    def _job(self, arg):
+        if arg == "hang":
+            self._release.wait(10)
+        elif arg == "fail":
+            raise ValueError("failed job")
+        return arg * 2
+
+    def testResults(self):
+        """
+        Results are returned in argument order, exceptions with their
+        traceback
+        """
+        pool = self._make_pool(2)
+        results = pool.map(self._job, [1, "fail", 3], 5)
+
+        self.assertEquals(results[0], (True, 2))
+        self.assertEquals(results[2], (True, 6))
+        self.assertFalse(results[1][0])
+        self.assertEquals(results[1][1][0], ValueError)
+        self.assertTrue(results[1][1][2] is not None)
+
+    def testTimeout(self):
+        """
+        A hung call times out without holding up the other jobs
+        """
+        pool = self._make_pool(2)
+        results = pool.map(self._job, ["hang", 1, 2], 0.2)
+        self.assertEquals(results, [None, (True, 2), (True, 4)])
+
+    def testCancel(self):
+        """
+        Jobs queued behind a hung call are cancelled, and nothing is
+        queued while every worker is stuck
+        """
+        pool = self._make_pool(1)
+        results = pool.map(self._job, ["hang", 1], 0.2)
+        self.assertEquals(results, [None, CANCELLED])
+
+        results = pool.map(self._job, [1, 2], 0.2)
+        self.assertEquals(results, [CANCELLED, CANCELLED])
+
+    def testClosed(self):
+        pool = self._make_pool(1)
+        pool.close()
+        self.assertRaises(RuntimeError, pool.map, self._job, [1], 1)
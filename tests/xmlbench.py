@@ -0,0 +1,241 @@
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free  Software Foundation; either version 2 of the License, or
+# (at your option)  any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+# Throughput benchmark of the virtinst XML code, run over the domain
+# XML used by the test suite. This isn't a unittest module, run it
+# with 'python setup.py bench_xml'.
+
+import gc
+import glob
+import json
+import logging
+import time
+
+import virtinst
+
+from tests import utils
+
+# pylint: disable=W0212
+# Access to protected member, needed to unittest stuff
+
+CORPUS = [
+    "tests/xmlparse-xml/*.xml",
+    "tests/xmlconfig-xml/*.xml",
+    "tests/cli-test-xml/*.xml",
+    "tests/cli-test-xml/compare/*.xml",
+]
+
+PHASES = ["parse", "read", "serialize", "install"]
+
+# Default allowed ops/sec drop against a baseline, in percent
+DEFAULT_TOLERANCE = 15
+
+# Documents that get_install_xml works on, filled in by load_corpus
+_install_docs = set()
+
+
+def _read_props(obj):
+    """
+    Read every XML property of obj and of all its sub elements
+    """
+    for name in obj._all_xml_props():
+        getattr(obj, name)
+    for child in obj._all_subelement_props():
+        _read_props(child)
+
+
+def _phase_parse(conn, docs, guests):
+    for idx, (ignore, xml) in enumerate(docs):
+        guests[idx] = virtinst.Guest(conn, parsexml=xml)
+
+
+def _phase_read(conn, docs, guests):
+    ignore = conn
+    ignore = docs
+    for guest in guests:
+        _read_props(guest)
+
+
+def _phase_serialize(conn, docs, guests):
+    ignore = conn
+    ignore = docs
+    for guest in guests:
+        guest.get_xml_config()
+
+
+def _phase_install(conn, docs, guests):
+    ignore = conn
+    for idx, guest in enumerate(guests):
+        if docs[idx][0] in _install_docs:
+            guest.get_install_xml(install=False)
+
+
+def load_corpus(conn):
+    """
+    Return a list of (filename, xml) of every corpus file that parses
+    as a Guest and round trips through get_xml_config
+    """
+    docs = []
+    _install_docs.clear()
+
+    for pattern in CORPUS:
+        for filename in sorted(glob.glob(pattern)):
+            xml = file(filename).read()
+            if not xml.lstrip().startswith("<domain"):
+                continue
+
+            try:
+                virtinst.Guest(conn, parsexml=xml).get_xml_config()
+            except Exception, e:
+                logging.debug("Skipping %s: %s", filename, e)
+                continue
+            docs.append((filename, xml))
+
+            try:
+                virtinst.Guest(conn, parsexml=xml).get_install_xml(
+                                                            install=False)
+                _install_docs.add(filename)
+            except Exception, e:
+                logging.debug("Not using %s for install phase: %s",
+                              filename, e)
+
+    return docs
+
+
+def _phase_ops(phase, docs):
+    if phase == "install":
+        return len(_install_docs)
+    return len(docs)
+
+
+def _count_objects(func, *args):
+    """
+    Return the number of garbage collected objects func leaves behind,
+    with the cycle collector disabled while it runs
+    """
+    gc.collect()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        func(*args)
+        return len(gc.get_objects()) - before
+    finally:
+        gc.enable()
+
+
+def run_benchmark(iterations, conn=None):
+    """
+    Run every phase 'iterations' times over the whole corpus
+
+    @returns: dict of phase name -> dict with 'ops', 'seconds',
+        'ops_per_sec' and 'objects_per_op'
+    """
+    if conn is None:
+        conn = utils.open_testkvmdriver()
+    docs = load_corpus(conn)
+    if not docs:
+        raise RuntimeError("No usable XML found in the benchmark corpus")
+
+    funcs = {
+        "parse": _phase_parse,
+        "read": _phase_read,
+        "serialize": _phase_serialize,
+        "install": _phase_install,
+    }
+    results = {}
+    for phase in PHASES:
+        results[phase] = {"ops": 0, "seconds": 0.0}
+
+    for ignore in range(iterations):
+        guests = [None] * len(docs)
+        for phase in PHASES:
+            start = time.time()
+            funcs[phase](conn, docs, guests)
+            results[phase]["seconds"] += time.time() - start
+            results[phase]["ops"] += _phase_ops(phase, docs)
+
+    # Separate, untimed pass, counting leftover objects slows things down
+    guests = [None] * len(docs)
+    for phase in PHASES:
+        objects = _count_objects(funcs[phase], conn, docs, guests)
+        results[phase]["objects_per_op"] = (float(objects) /
+                                            max(_phase_ops(phase, docs), 1))
+
+    for phase in PHASES:
+        res = results[phase]
+        res["ops_per_sec"] = res["ops"] / max(res["seconds"], 0.000001)
+
+    logging.debug("Benchmarked %d documents, %d usable for install",
+                  len(docs), len(_install_docs))
+    return results
+
+
+def save_baseline(filename, results):
+    fd = open(filename, "w")
+    try:
+        json.dump({"phases": results}, fd, indent=2, sort_keys=True)
+    finally:
+        fd.close()
+
+
+def load_baseline(filename):
+    fd = open(filename)
+    try:
+        return json.load(fd)["phases"]
+    finally:
+        fd.close()
+
+
+def compare_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Return a list of (phase, percent change) for phases whose ops/sec
+    dropped more than tolerance percent compared to baseline
+    """
+    regressions = []
+    for phase in PHASES:
+        if phase not in baseline:
+            continue
+        change = _percent_change(results[phase], baseline[phase])
+        if change < -tolerance:
+            regressions.append((phase, change))
+    return regressions
+
+
+def _percent_change(res, base):
+    if not base["ops_per_sec"]:
+        return 0.0
+    return ((res["ops_per_sec"] - base["ops_per_sec"]) * 100.0 /
+            base["ops_per_sec"])
+
+
+def format_results(results, baseline=None):
+    lines = []
+    lines.append("%-10s %8s %10s %10s %9s %10s" %
+                 ("phase", "ops", "ops/sec", "total ms", "ms/op",
+                  "objs/op") + (baseline and "  vs base" or ""))
+
+    for phase in PHASES:
+        res = results[phase]
+        line = ("%-10s %8d %10.1f %10.1f %9.3f %10.1f" %
+                (phase, res["ops"], res["ops_per_sec"],
+                 res["seconds"] * 1000,
+                 res["seconds"] * 1000 / max(res["ops"], 1),
+                 res["objects_per_op"]))
+        if baseline and phase in baseline:
+            line += "  %+7.1f%%" % _percent_change(res, baseline[phase])
+        lines.append(line)
+
+    return "\n".join(lines)
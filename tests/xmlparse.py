@@ -18,6 +18,8 @@ import glob
 import traceback
 import unittest
 
+import libxml2
+
 import virtinst
 
 from tests import utils
@@ -764,6 +766,88 @@ class XMLParseTest(unittest.TestCase):
 
         self._alter_compare(guest.get_xml_config(), outfile)
 
+    def testXPathCacheInvalidation(self):
+        """
+        Make sure cached xpath lookups don't outlive XML changes
+        """
+        guest = self._get_test_content("add-devices")[0]
+
+        # Setters creating and removing a node that was looked up
+        self.assertEquals(guest.description, None)
+        guest.description = "foo description"
+        self.assertEquals(guest.description, "foo description")
+        guest.description = None
+        self.assertEquals(guest.description, None)
+        self.assertTrue("<description>" not in guest.get_xml_config())
+
+        # Removing a device shifts the xpaths of the ones after it
+        disks = guest.get_devices("disk")
+        self.assertEquals([d.target for d in disks],
+                          ["fda", "vda", "vdb", "hdc"])
+        self.assertEquals([d.driver_type for d in disks],
+                          ["qcow2", "raw", None, None])
+        guest.remove_device(disks[1])
+        self.assertEquals([d.target for d in guest.get_devices("disk")],
+                          ["fda", "vdb", "hdc"])
+        self.assertEquals(disks[1].target, "vda")
+        self.assertEquals(disks[2].driver_type, None)
+        disks[2].driver_type = "qcow2"
+        self.assertEquals(guest.get_devices("disk")[1].driver_type, "qcow2")
+
+        # Adding a device
+        self.assertEquals(guest.get_devices("sound"), [])
+        guest.add_device(virtinst.VirtualAudio(conn,
+            parsexml="""<sound model='pcspk'/>"""))
+        sound = guest.get_devices("sound")[0]
+        self.assertEquals(sound.model, "pcspk")
+        sound.model = "ac97"
+        self.assertEquals(guest.get_devices("sound")[0].model, "ac97")
+        self.assertEquals([d.target for d in guest.get_devices("disk")],
+                          ["fda", "vdb", "hdc"])
+        self.assertTrue("<sound model=\"ac97\"/>" in
+                        guest.get_xml_config())
+
+    def testXMLDigest(self):
+        """
+        Make sure only real XML changes alter the digest
+        """
+        def digest(xml):
+            doc = libxml2.parseDoc(xml)
+            try:
+                return virtinst.util.xml_digest(doc)
+            finally:
+                doc.freeDoc()
+
+        orig = digest("<domain type='kvm'><name>foo</name>"
+                      "<devices><disk type='file' device='disk'/>"
+                      "</devices></domain>")
+
+        # Whitespace and attribute order
+        self.assertEquals(orig, digest("""<domain type="kvm">
+  <name>foo</name>
+  <devices>
+    <disk device="disk" type="file"/>
+  </devices>
+</domain>
+"""))
+
+        self.assertNotEquals(orig,
+                      digest("<domain type='kvm'><name>foo </name>"
+                             "<devices><disk type='file' device='disk'/>"
+                             "</devices></domain>"))
+        self.assertNotEquals(orig,
+                      digest("<domain type='kvm'><name>foo</name>"
+                             "<devices><disk type='block' device='disk'/>"
+                             "</devices></domain>"))
+        self.assertNotEquals(orig,
+                      digest("<domain type='kvm'><devices>"
+                             "<disk type='file' device='disk'/>"
+                             "</devices><name>foo</name></domain>"))
+        self.assertNotEquals(orig,
+                      digest("<domain type='kvm'><name>foo</name>"
+                             "<devices><disk type='file' device='disk'>"
+                             "<readonly/></disk></devices></domain>"))
+
     def testChangeKVMMedia(self):
         guest, outfile = self._get_test_content("change-media", kvm=True)
 
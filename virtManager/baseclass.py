@@ -21,6 +21,8 @@
 import logging
 import os
 import sys
+import threading
+import time
 import traceback
 
 from virtManager import config
@@ -32,10 +34,108 @@ from gi.repository import GObject
 from gi.repository import Gtk
 # pylint: enable=E0611
 
+# Log it if queued signals wait longer than this many seconds
+# for the main loop
+IDLE_EMIT_LATENCY_WARN = 1.0
+
+
+class _IdleEmitQueue(object):
+    """
+    Signals queued by vmmGObject.idle_emit. Everything queued before the
+    main loop gets around to it is delivered in order by a single idle
+    callback, and repeated emits of a coalescing signal on the same
+    object collapse into one delivery with the newest arguments, at the
+    position of the newest emit.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = []
+        # (id(obj), signal) -> queued entry, for coalescing signals
+        self._pending = {}
+        # Coalesced entries left in _queue, to be skipped
+        self._dropped = 0
+        self._queued_at = None
+
+        self.emitted = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.max_latency = 0
+
+    def push(self, obj, signal, args, coalesce):
+        self._lock.acquire()
+        try:
+            self.emitted += 1
+            key = (id(obj), signal)
+            if coalesce and key in self._pending:
+                # Drop the earlier entry rather than updating it in
+                # place, so signals stay in the order they were emitted
+                self._pending[key][0] = None
+                self._dropped += 1
+                self.coalesced += 1
+
+            entry = [obj, signal, args]
+            self._queue.append(entry)
+            if coalesce:
+                self._pending[key] = entry
+            self.max_depth = max(self.max_depth,
+                                 len(self._queue) - self._dropped)
+
+            if self._queued_at is not None:
+                return
+            self._queued_at = time.time()
+        finally:
+            self._lock.release()
+
+        GLib.idle_add(self._flush)
+
+    def _flush(self):
+        self._lock.acquire()
+        try:
+            queue = [e for e in self._queue if e[0] is not None]
+            latency = time.time() - self._queued_at
+            self._queue = []
+            self._pending = {}
+            self._dropped = 0
+            self._queued_at = None
+            self.max_latency = max(self.max_latency, latency)
+        finally:
+            self._lock.release()
+
+        if latency > IDLE_EMIT_LATENCY_WARN:
+            logging.debug("%d queued signals waited %.2f seconds for "
+                          "the main loop", len(queue), latency)
+
+        for obj, signal, args in queue:
+            try:
+                obj.emit(signal, *args)
+            except:
+                print traceback.format_exc()
+        return False
+
+    def get_stats(self):
+        self._lock.acquire()
+        try:
+            return {
+                "depth": len(self._queue) - self._dropped,
+                "emitted": self.emitted,
+                "coalesced": self.coalesced,
+                "max-depth": self.max_depth,
+                "max-latency": self.max_latency,
+            }
+        finally:
+            self._lock.release()
+
+
+_idle_emit_queue = _IdleEmitQueue()
+
 
 class vmmGObject(GObject.GObject):
     _leak_check = True
 
+    # Signals for which repeated idle_emit calls made before the main
+    # loop delivers them collapse into one emission
+    _coalesce_signals = []
+
     @staticmethod
     def idle_add(func, *args, **kwargs):
         """
@@ -146,13 +246,21 @@ class vmmGObject(GObject.GObject):
 
     def idle_emit(self, signal, *args):
         """
-        Safe wrapper for using 'self.emit' with GLib.idle_add
+        Safe wrapper for using 'self.emit' with GLib.idle_add. Signals
+        listed in _coalesce_signals are only emitted once, with the
+        newest arguments, if emitted again before the main loop runs.
         """
-        def emitwrap(_s, *_a):
-            self.emit(_s, *_a)
-            return False
+        _idle_emit_queue.push(self, signal, args,
+                              signal in self._coalesce_signals)
 
-        self.idle_add(emitwrap, signal, *args)
+    @staticmethod
+    def get_idle_emit_stats():
+        """
+        Return a dict describing the idle_emit queue: current 'depth',
+        total 'emitted' and 'coalesced' signals, and the 'max-depth'
+        and 'max-latency' (seconds) seen when flushing it
+        """
+        return _idle_emit_queue.get_stats()
 
     def timeout_add(self, timeout, func, *args):
         """
@@ -19,6 +19,7 @@
 #
 import os
 import logging
+import re
 
 # pylint: disable=E0611
 from gi.repository import Gio
@@ -349,6 +350,16 @@ class vmmConfig(object):
     def on_stats_enable_net_poll_changed(self, cb, row=None):
         return self.conf.notify_add("/stats/enable-net-poll", cb, row)
 
+    # On disk stats history
+    def get_stats_enable_history(self):
+        return self.conf.get("/stats/enable-history")
+    def set_stats_enable_history(self, val):
+        self.conf.set("/stats/enable-history", val)
+    def get_stats_history_path(self, uri):
+        filename = re.sub("[^a-zA-Z0-9_.-]", "_", uri) + ".stats"
+        return os.path.join(os.path.expanduser("~/.virt-manager/stats"),
+                            filename)
+
     # VM Console preferences
     def on_console_accels_changed(self, cb):
         return self.conf.notify_add("/console/enable-accels", cb)
@@ -37,14 +37,73 @@ from virtinst import util
 
 from virtManager import uihelpers
 from virtManager import connectauth
+from virtManager import tickprofile
 from virtManager.baseclass import vmmGObject
-from virtManager.domain import vmmDomain
+from virtManager.domain import vmmDomain, STATS_FIELDS as VM_STATS_FIELDS
 from virtManager.interface import vmmInterface
 from virtManager.mediadev import vmmMediaDevice
 from virtManager.netdev import vmmNetDevice
 from virtManager.network import vmmNetwork
 from virtManager.nodedev import vmmNodeDevice
+from virtManager.statsrecord import vmmStatsRecord
+from virtManager.statsstore import vmmStatsStore
 from virtManager.storagepool import vmmStoragePool
+from virtManager.volumeindex import vmmVolumeIndex
+from virtManager.workerpool import vmmWorkerPool
+
+_STATS_FIELDS = ["timestamp", "memory", "memoryPercent",
+                 "cpuTime", "cpuHostPercent",
+                 "diskRdRate", "diskWrRate", "netRxRate", "netTxRate",
+                 "diskMaxRate", "netMaxRate"]
+_STATS_PERCENT_FIELDS = ["memoryPercent", "cpuHostPercent"]
+
+# Max threads a connection uses to read per device VM stats in parallel
+DEVICE_STATS_THREADS = 8
+
+# Name of the registered libvirt event loop implementation. Domain
+# events are only dispatched if there is one, see register_event_impl
+_event_impl = None
+
+
+def _run_default_event_impl():
+    while True:
+        try:
+            libvirt.virEventRunDefaultImpl()
+        except Exception, e:
+            logging.debug("Error running libvirt event loop: %s", e)
+            time.sleep(1)
+
+
+def register_event_impl():
+    """
+    Register a libvirt event loop implementation. Needs to be called
+    before any connection is opened, otherwise domain events are never
+    dispatched and connections fall back to polling.
+
+    libvirt-glib dispatches events from the GLib main loop. If it isn't
+    available, libvirt's default implementation runs in a daemon thread.
+    Event callbacks only hand work over to the main loop with idle_add,
+    so they are fine with either.
+    """
+    global _event_impl
+    if _event_impl:
+        return
+
+    try:
+        from gi.repository import LibvirtGLib
+        LibvirtGLib.init(None)
+        LibvirtGLib.event_register()
+        _event_impl = "libvirt-glib"
+    except Exception, e:
+        logging.debug("Can't use libvirt-glib event loop: %s", e)
+        libvirt.virEventRegisterDefaultImpl()
+        t = threading.Thread(target=_run_default_event_impl,
+                             name="libvirt event loop")
+        t.daemon = True
+        t.start()
+        _event_impl = "libvirt default"
+
+    logging.debug("Registered %s event loop implementation", _event_impl)
 
 
 class vmmConnection(vmmGObject):
@@ -72,7 +131,9 @@ class vmmConnection(vmmGObject):
         "connect-error": (GObject.SignalFlags.RUN_FIRST, None,
                           [str, str, bool]),
         "priority-tick": (GObject.SignalFlags.RUN_FIRST, None, [object]),
+        "volume-index-changed": (GObject.SignalFlags.RUN_FIRST, None, []),
     }
+    _coalesce_signals = ["resources-sampled", "volume-index-changed"]
 
     STATE_DISCONNECTED = 0
     STATE_CONNECTING = 1
@@ -98,10 +159,18 @@ class vmmConnection(vmmGObject):
         self._storage_capable = None
         self._interface_capable = None
         self._nodedev_capable = None
+        self._bulk_stats_capable = None
+        self._node_stats_capable = None
+        # (busy, total) host CPU time of the previous node stats sample
+        self._prev_node_cputime = None
 
         self._xml_flags = {}
         self._support_dict = {}
 
+        # libvirt domain event callback IDs, see _add_conn_events
+        self._domain_cb_ids = []
+        self.using_domain_events = False
+
         # Physical network interfaces: name -> virtinst.NodeDevice
         self.nodedevs = {}
         # Physical network interfaces: name (eth0) -> vmmNetDevice
@@ -112,13 +181,24 @@ class vmmConnection(vmmGObject):
         self.interfaces = {}
         # Connection Storage pools: UUID -> vmmStoragePool
         self.pools = {}
+        # Search index of the volumes of all pools
+        self._volume_index = vmmVolumeIndex()
         # Virtual networks UUUID -> vmmNetwork object
         self.nets = {}
         # Virtual machines. UUID -> vmmDomain object
         self.vms = {}
         # Resource utilization statistics
-        self.record = []
+        self.record = vmmStatsRecord(_STATS_FIELDS,
+                                self.config.get_stats_history_length() + 1,
+                                percent_fields=_STATS_PERCENT_FIELDS)
         self.hostinfo = None
+        # On disk VM stats history, if enabled
+        self._stats_store = None
+        # Threads reading per device VM stats, see get_device_stats_pool
+        self._device_stats_pool = None
+        # Stats update interval in seconds the engine currently uses
+        # for this connection
+        self.tick_interval = 0
 
         self.netdev_initialized = False
         self.netdev_error = ""
@@ -463,6 +543,25 @@ class vmmConnection(vmmGObject):
                                             self._backend.SUPPORT_CONN_NODEDEV)
         return self._nodedev_capable
 
+    def is_bulk_stats_capable(self):
+        if self._bulk_stats_capable is None:
+            self._bulk_stats_capable = self.check_conn_support(
+                            self._backend.SUPPORT_CONN_GETALLDOMAINSTATS)
+            logging.debug("Connection bulk domain stats support: %s",
+                          self._bulk_stats_capable)
+        return self._bulk_stats_capable
+
+    def is_node_stats_capable(self):
+        if self._node_stats_capable is None:
+            self._node_stats_capable = (
+                self.check_conn_support(
+                        self._backend.SUPPORT_CONN_NODE_CPU_STATS) and
+                self.check_conn_support(
+                        self._backend.SUPPORT_CONN_NODE_MEMORY_STATS))
+            logging.debug("Connection node stats support: %s",
+                          self._node_stats_capable)
+        return self._node_stats_capable
+
     def _get_flags_helper(self, obj, key, check_func):
         ignore = obj
         flags_dict = self._xml_flags.get(key)
@@ -703,6 +802,44 @@ class vmmConnection(vmmGObject):
                     return vol
         return None
 
+    def get_volume_index(self):
+        return self._volume_index
+
+    def get_device_stats_pool(self):
+        """
+        Return the vmmWorkerPool VMs of this connection use to read
+        per device stats. Every connection has its own, so hung calls
+        to one host don't hold up the others.
+        """
+        if not self._device_stats_pool:
+            self._device_stats_pool = vmmWorkerPool(
+                "Device stats %s" % self.get_uri(), DEVICE_STATS_THREADS)
+        return self._device_stats_pool
+
+    def enable_volume_index(self):
+        """
+        Start indexing the volumes of all active pools. The index is
+        filled in by the following ticks, and 'volume-index-changed'
+        is emitted whenever its content changes.
+        """
+        if self._volume_index.is_enabled():
+            return
+        self._volume_index.enable()
+        self.schedule_priority_tick(pollpool=True)
+
+    def search_volumes(self, text, limit=None):
+        """
+        Search the volumes of all active pools, see vmmVolumeIndex.search
+        """
+        return self._volume_index.search(text, limit=limit)
+
+    def get_volume_users(self, path):
+        """
+        Return the names of VMs using path as a disk, as last seen by
+        the volume index
+        """
+        return self._volume_index.get_users(path)
+
     def list_vm_uuids(self):
         return self.vms.keys()
     def list_net_uuids(self):
@@ -820,8 +957,14 @@ class vmmConnection(vmmGObject):
             for dev in devs.values():
                 dev.cleanup()
 
+        self._remove_conn_events()
+        self._close_stats_store()
+        if self._device_stats_pool:
+            self._device_stats_pool.close()
+            self._device_stats_pool = None
         self._backend.close()
-        self.record = []
+        self.record.clear()
+        self._prev_node_cputime = None
 
         cleanup(self.nodedevs)
         self.nodedevs = {}
@@ -837,6 +980,7 @@ class vmmConnection(vmmGObject):
 
         cleanup(self.pools)
         self.pools = {}
+        self._volume_index.clear()
 
         cleanup(self.nets)
         self.nets = {}
@@ -943,6 +1087,8 @@ class vmmConnection(vmmGObject):
         if self.state == self.STATE_ACTIVE:
             logging.debug("%s capabilities:\n%s",
                           self.get_uri(), self.caps.xml)
+            self._add_conn_events()
+            self._open_stats_store()
             self.schedule_priority_tick(stats_update=True,
                                         pollvm=True, pollnet=True,
                                         pollpool=True, polliface=True,
@@ -954,6 +1100,119 @@ class vmmConnection(vmmGObject):
             self.connectError = None
 
 
+    ######################
+    # Stats history file #
+    ######################
+
+    def _open_stats_store(self):
+        if self._stats_store or not self.config.get_stats_enable_history():
+            return
+
+        try:
+            self._stats_store = vmmStatsStore(
+                self.config.get_stats_history_path(self.get_uri()),
+                VM_STATS_FIELDS,
+                known_uuids_cb=lambda: self.vms.keys())
+        except Exception, e:
+            logging.debug("Error opening stats history for %s: %s",
+                          self.get_uri(), e)
+
+    def _close_stats_store(self):
+        if not self._stats_store:
+            return
+        self._stats_store.close()
+        self._stats_store = None
+
+    def get_stats_store(self):
+        """
+        Return the vmmStatsStore VM stats history is saved to, or None
+        if on disk history is disabled
+        """
+        return self._stats_store
+
+
+    #################
+    # Domain events #
+    #################
+
+    def _domain_lifecycle_event(self, conn, domain, event, reason, userdata):
+        ignore = conn
+        ignore = userdata
+        logging.debug("Domain lifecycle event: domain=%s event=%s "
+                      "reason=%s", domain.name(), event, reason)
+        self.idle_add(self._handle_lifecycle_event,
+                      domain.UUIDString(), event)
+
+    def _handle_lifecycle_event(self, uuid, event):
+        obj = self.vms.get(uuid, None)
+
+        if obj:
+            obj.force_update_status()
+            if event == libvirt.VIR_DOMAIN_EVENT_DEFINED:
+                obj.refresh_xml()
+
+        # Domain list only changes on define/undefine, or when
+        # a transient domain stops
+        if (not obj or
+            event in [libvirt.VIR_DOMAIN_EVENT_DEFINED,
+                      libvirt.VIR_DOMAIN_EVENT_UNDEFINED,
+                      libvirt.VIR_DOMAIN_EVENT_STOPPED]):
+            self.schedule_priority_tick(pollvm=True, force=True)
+
+    def _domain_xml_event(self, conn, domain, *args):
+        ignore = conn
+        ignore = args
+        logging.debug("Domain XML event: domain=%s", domain.name())
+        self.idle_add(self._handle_xml_event, domain.UUIDString())
+
+    def _handle_xml_event(self, uuid):
+        obj = self.vms.get(uuid, None)
+        if not obj:
+            return
+        obj.refresh_xml()
+
+    def _add_conn_events(self):
+        if not _event_impl:
+            logging.debug("No libvirt event loop registered, polling "
+                          "domains on %s", self.get_uri())
+            return
+
+        events = [
+            ("VIR_DOMAIN_EVENT_ID_LIFECYCLE", self._domain_lifecycle_event),
+            ("VIR_DOMAIN_EVENT_ID_REBOOT", self._domain_xml_event),
+            ("VIR_DOMAIN_EVENT_ID_DEVICE_ADDED", self._domain_xml_event),
+            ("VIR_DOMAIN_EVENT_ID_DEVICE_REMOVED", self._domain_xml_event),
+        ]
+
+        for eventname, cb in events:
+            try:
+                eventid = getattr(libvirt, eventname)
+                self._domain_cb_ids.append(
+                    self._backend.domainEventRegisterAny(
+                        None, eventid, cb, None))
+            except Exception, e:
+                logging.debug("Error registering domain event %s: %s",
+                              eventname, e)
+
+                # Lifecycle events are required to track define/undefine
+                # and state changes, everything else is a bonus
+                if not self._domain_cb_ids:
+                    break
+
+        self.using_domain_events = bool(self._domain_cb_ids)
+        logging.debug("Using domain events for %s: %s",
+                      self.get_uri(), self.using_domain_events)
+
+    def _remove_conn_events(self):
+        for cbid in self._domain_cb_ids:
+            try:
+                self._backend.domainEventDeregisterAny(cbid)
+            except Exception, e:
+                logging.debug("Error deregistering domain event: %s", e)
+        self._domain_cb_ids = []
+        self.using_domain_events = False
+
+
     #######################
     # Tick/Update methods #
     #######################
@@ -990,6 +1249,37 @@ class vmmConnection(vmmGObject):
                     (lambda obj, key: vmmDomain(self, obj, key)))
 
 
+    def _fetch_all_domain_stats(self):
+        """
+        Fetch stats for every domain with a single getAllDomainStats call.
+        Returns a dict of UUID -> stats dict, or an empty dict if the
+        connection doesn't support it, in which case each vmmDomain
+        samples its own stats.
+        """
+        if not self.is_bulk_stats_capable():
+            return {}
+
+        statflags = (libvirt.VIR_DOMAIN_STATS_STATE |
+                     libvirt.VIR_DOMAIN_STATS_CPU_TOTAL |
+                     libvirt.VIR_DOMAIN_STATS_BALLOON |
+                     libvirt.VIR_DOMAIN_STATS_VCPU)
+        if self.config.get_stats_enable_disk_poll():
+            statflags |= libvirt.VIR_DOMAIN_STATS_BLOCK
+        if self.config.get_stats_enable_net_poll():
+            statflags |= libvirt.VIR_DOMAIN_STATS_INTERFACE
+
+        try:
+            rawstats = self._backend.getAllDomainStats(statflags)
+        except libvirt.libvirtError, e:
+            if util.is_error_nosupport(e):
+                logging.debug("Bulk domain stats not supported: %s", e)
+                self._bulk_stats_capable = False
+            else:
+                logging.debug("Error fetching bulk domain stats: %s", e)
+            return {}
+
+        return dict((dom.UUIDString(), stats) for dom, stats in rawstats)
+
     def _obj_signal_proxy(self, obj, signal, key):
         ignore = obj
         self.emit(signal, key)
@@ -1003,7 +1293,8 @@ class vmmConnection(vmmGObject):
     def tick(self, stats_update,
              pollvm=False, pollnet=False,
              pollpool=False, polliface=False,
-             pollnodedev=False, pollmedia=False):
+             pollnodedev=False, pollmedia=False,
+             force=False):
         """ main update function: polls for new objects, updates stats, ..."""
         if self.state != self.STATE_ACTIVE:
             return
@@ -1011,15 +1302,26 @@ class vmmConnection(vmmGObject):
         if not pollvm:
             stats_update = False
 
+        # With domain events, the VM list is only refetched when an
+        # event asks for it. Regular ticks just sample stats.
+        refreshvms = pollvm and (force or not self.using_domain_events)
+
+        profile = tickprofile.start_tick()
         self.hostinfo = self._backend.getInfo()
+        profile.mark("getInfo")
 
         (goneNets, newNets, nets) = self._update_nets(pollnet)
+        profile.mark("nets")
         (gonePools, newPools, pools) = self._update_pools(pollpool)
+        profile.mark("pools")
         (goneInterfaces,
          newInterfaces, interfaces) = self._update_interfaces(polliface)
+        profile.mark("interfaces")
         (goneNodedevs,
          newNodedevs, nodedevs) = self._update_nodedevs(pollnodedev)
-        (goneVMs, newVMs, vms) = self._update_vms(pollvm)
+        profile.mark("nodedevs")
+        (goneVMs, newVMs, vms) = self._update_vms(refreshvms)
+        profile.mark("vms")
 
         def tick_send_signals():
             """
@@ -1065,6 +1367,7 @@ class vmmConnection(vmmGObject):
 
             # Update storage pool states
             for uuid, obj in gonePools.items():
+                self._volume_index.remove_pool(uuid)
                 self.emit("pool-removed", uuid)
                 obj.cleanup()
             for uuid, obj in newPools.items():
@@ -1099,13 +1402,16 @@ class vmmConnection(vmmGObject):
             ticklist.extend([(o, args) for o in l])
 
         updateVMs = newVMs
+        bulkstats = {}
         if stats_update:
             updateVMs = vms
+            bulkstats = self._fetch_all_domain_stats()
+            profile.mark("bulkstats")
 
         if pollvm:
             for key in vms:
                 if key in updateVMs:
-                    add_to_ticklist([vms[key]], (True,))
+                    add_to_ticklist([vms[key]], (True, bulkstats.get(key)))
                 else:
                     add_to_ticklist([vms[key]], (stats_update,))
         if pollnet:
@@ -1133,22 +1439,99 @@ class vmmConnection(vmmGObject):
                                   "connection doesn't seem to have dropped. "
                                   "Ignoring.")
 
+        profile.mark("objticks")
+
+        self._tick_volume_index(pools, vms)
+        profile.mark("volindex")
+
         if stats_update:
             self._recalculate_stats(updateVMs.values())
+            profile.mark("recalculate")
             self.idle_emit("resources-sampled")
 
+        tickprofile.finish_tick(self.get_uri(), profile)
         return 1
 
+    def _tick_volume_index(self, pools, vms):
+        """
+        Index the volumes of newly seen pools along with any queued
+        volume list changes, and refresh the map of disk users
+        """
+        index = self._volume_index
+        if not index.is_enabled():
+            return
+
+        for uuid, pool in pools.items():
+            if pool.is_active() and not index.has_pool(uuid):
+                index.update_pool(uuid, pool.get_volumes().values(), [])
+        changed = index.process_pending()
+
+        users = {}
+        for vm in vms.values():
+            try:
+                for disk in vm.get_disk_devices(refresh_if_nec=False):
+                    if disk.path:
+                        users.setdefault(disk.path, []).append(vm.get_name())
+            except Exception, e:
+                logging.debug("Error listing disks of '%s': %s",
+                              vm.get_name(), e)
+        changed = index.set_users(users) or changed
+
+        if changed:
+            self.idle_emit("volume-index-changed")
+
+    def _sample_node_stats(self):
+        """
+        Sample host CPU and memory usage with the node stats APIs.
+        This includes load from outside of VMs.
+
+        @returns: (cpuTime, pcentHostCpu, mem, pcentMem), or None if
+            the APIs aren't available and we need to add up VM stats
+        """
+        if not self.is_node_stats_capable():
+            return None
+
+        try:
+            cpustats = self._backend.getCPUStats(
+                                libvirt.VIR_NODE_CPU_STATS_ALL_CPUS, 0)
+            memstats = self._backend.getMemoryStats(
+                                libvirt.VIR_NODE_MEMORY_STATS_ALL_CELLS, 0)
+        except libvirt.libvirtError, e:
+            if util.is_error_nosupport(e):
+                logging.debug("Node stats not supported: %s", e)
+                self._node_stats_capable = False
+            else:
+                logging.debug("Error fetching node stats: %s", e)
+            return None
+
+        cpuTime = 0
+        pcentHostCpu = 0
+        if "idle" in cpustats:
+            busy = cpustats.get("kernel", 0) + cpustats.get("user", 0)
+            total = busy + cpustats["idle"] + cpustats.get("iowait", 0)
+
+            if self._prev_node_cputime:
+                prevbusy, prevtotal = self._prev_node_cputime
+                cpuTime = busy - prevbusy
+                if total > prevtotal:
+                    pcentHostCpu = cpuTime * 100.0 / (total - prevtotal)
+            self._prev_node_cputime = (busy, total)
+        else:
+            # Some drivers only report a utilization percentage
+            pcentHostCpu = cpustats.get("utilization", 0)
+
+        memtotal = memstats.get("total") or self.host_memory_size()
+        mem = (memtotal - memstats.get("free", 0) -
+               memstats.get("buffers", 0) - memstats.get("cached", 0))
+        pcentMem = mem * 100.0 / memtotal
+
+        return cpuTime, pcentHostCpu, mem, pcentMem
+
     def _recalculate_stats(self, vms):
         if not self._backend.is_open():
             return
 
         now = time.time()
-        expected = self.config.get_stats_history_length()
-        current = len(self.record)
-        if current > expected:
-            del self.record[expected:current]
-
         mem = 0
         cpuTime = 0
         rdRate = 0
@@ -1158,25 +1541,33 @@ class vmmConnection(vmmGObject):
         diskMaxRate = self.disk_io_max_rate() or 10.0
         netMaxRate = self.network_traffic_max_rate() or 10.0
 
-        for vm in vms:
-            if not vm.is_active():
-                continue
+        nodestats = self._sample_node_stats()
 
-            cpuTime += vm.cpu_time()
-            mem += vm.stats_memory()
-            rdRate += vm.disk_read_rate()
-            wrRate += vm.disk_write_rate()
-            rxRate += vm.network_rx_rate()
-            txRate += vm.network_tx_rate()
+        # Only walk the VM list if we need to add up their stats
+        if (nodestats is None or
+            self.config.get_stats_enable_disk_poll() or
+            self.config.get_stats_enable_net_poll()):
+            for vm in vms:
+                if not vm.is_active():
+                    continue
 
-            netMaxRate = max(netMaxRate, vm.network_traffic_max_rate())
-            diskMaxRate = max(diskMaxRate, vm.disk_io_max_rate())
+                cpuTime += vm.cpu_time()
+                mem += vm.stats_memory()
+                rdRate += vm.disk_read_rate()
+                wrRate += vm.disk_write_rate()
+                rxRate += vm.network_rx_rate()
+                txRate += vm.network_tx_rate()
+
+                netMaxRate = max(netMaxRate, vm.network_traffic_max_rate())
+                diskMaxRate = max(diskMaxRate, vm.disk_io_max_rate())
 
         pcentHostCpu = 0
         pcentMem = mem * 100.0 / self.host_memory_size()
 
-        if len(self.record) > 0:
-            prevTimestamp = self.record[0]["timestamp"]
+        if nodestats is not None:
+            cpuTime, pcentHostCpu, mem, pcentMem = nodestats
+        elif len(self.record) > 0:
+            prevTimestamp = self.record.get("timestamp")
             host_cpus = self.host_active_processor_count()
 
             pcentHostCpu = ((cpuTime) * 100.0 /
@@ -1200,22 +1591,15 @@ class vmmConnection(vmmGObject):
             "netMaxRate" : netMaxRate,
         }
 
-        self.record.insert(0, newStats)
+        self.record.append(newStats)
 
 
     ########################
     # Stats getter methods #
     ########################
 
-    def _vector_helper(self, record_name):
-        vector = []
-        stats = self.record
-        for i in range(self.config.get_stats_history_length() + 1):
-            if i < len(stats):
-                vector.append(stats[i][record_name] / 100.0)
-            else:
-                vector.append(0)
-        return vector
+    def _vector_helper(self, record_name, limit=None):
+        return self.record.fraction_vector(record_name, limit)
 
     def stats_memory_vector(self):
         return self._vector_helper("memoryPercent")
@@ -1225,10 +1609,7 @@ class vmmConnection(vmmGObject):
     guest_cpu_time_vector = host_cpu_time_vector
 
     def host_cpu_time_vector_limit(self, limit):
-        cpudata = self.host_cpu_time_vector()
-        if len(cpudata) > limit:
-            cpudata = cpudata[0:limit]
-        return cpudata
+        return self._vector_helper("cpuHostPercent", limit)
     guest_cpu_time_vector_limit = host_cpu_time_vector_limit
 
     def disk_io_vector_limit(self, ignore):
@@ -1239,7 +1620,7 @@ class vmmConnection(vmmGObject):
     def _get_record_helper(self, record_name):
         if len(self.record) == 0:
             return 0
-        return self.record[0][record_name]
+        return self.record.get(record_name)
 
     def stats_memory(self):
         return self._get_record_helper("memory")
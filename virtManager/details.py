@@ -385,6 +385,14 @@ class vmmDetails(vmmGObjectUI):
         self.oldhwkey = None
         self.addhwmenu = None
         self.keycombo_menu = None
+
+        # Hardware pages whose widgets have been set up
+        self._hw_pages_built = []
+        # Domain XML the hw list was last populated from
+        self._hw_list_xml = None
+        # Signature of the XML the current hw page was last refreshed from
+        self._hw_page_sig = None
+
         self.init_menus()
         self.init_details()
 
@@ -437,6 +445,7 @@ class vmmDetails(vmmGObjectUI):
             "on_overview_acpi_changed": self.config_acpi_changed,
             "on_overview_apic_changed": self.config_apic_changed,
             "on_overview_clock_changed": lambda *x: self.enable_apply(x, EDIT_CLOCK),
+            "on_overview_history_combo_changed": lambda *x: self.refresh_stats_page(),
             "on_machine_type_changed": lambda *x: self.enable_apply(x, EDIT_MACHTYPE),
             "on_security_label_changed": lambda *x: self.enable_apply(x, EDIT_SECURITY),
             "on_security_relabel_changed": lambda *x: self.enable_apply(x, EDIT_SECURITY),
@@ -787,6 +796,19 @@ class vmmDetails(vmmGObjectUI):
         for offset in ["localtime", "utc"]:
             clock_model.append([offset])
 
+        # Stats history combo
+        history_combo = self.widget("overview-history-combo")
+        # [label, resolution]
+        history_model = Gtk.ListStore(str, str)
+        history_combo.set_model(history_model)
+        text = Gtk.CellRendererText()
+        history_combo.pack_start(text, True)
+        history_combo.add_attribute(text, 'text', 0)
+        history_model.append([_("Recent"), None])
+        history_model.append([_("Last day"), "minute"])
+        history_model.append([_("Last 30 days"), "hour"])
+        history_combo.set_active(0)
+
         arch = self.vm.get_arch()
         caps = self.vm.conn.caps
 
@@ -891,8 +913,6 @@ class vmmDetails(vmmGObjectUI):
         txtCol.add_attribute(text, 'text', BOOT_LABEL)
         txtCol.add_attribute(text, 'sensitive', BOOT_ACTIVE)
 
-        no_default = not self.is_customize_dialog
-
         # CPU features
         caps = self.vm.conn.caps
         cpu_values = None
@@ -956,6 +976,30 @@ class vmmDetails(vmmGObjectUI):
         for name in cpu_names:
             model.append([name, cpu_values.get_cpu(name)])
 
+    def _build_hw_page(self, pagetype):
+        """
+        Set up the widgets of a hardware page the first time it is shown,
+        rather than building every page up front
+        """
+        if pagetype in self._hw_pages_built:
+            return
+        self._hw_pages_built.append(pagetype)
+
+        initfuncs = {
+            HW_LIST_TYPE_DISK: self._init_disk_page,
+            HW_LIST_TYPE_NIC: self._init_network_page,
+            HW_LIST_TYPE_GRAPHICS: self._init_graphics_page,
+            HW_LIST_TYPE_SOUND: self._init_sound_page,
+            HW_LIST_TYPE_VIDEO: self._init_video_page,
+            HW_LIST_TYPE_WATCHDOG: self._init_watchdog_page,
+            HW_LIST_TYPE_SMARTCARD: self._init_smartcard_page,
+            HW_LIST_TYPE_REDIRDEV: self._init_redir_page,
+            HW_LIST_TYPE_CONTROLLER: self._init_controller_page,
+        }
+        if pagetype in initfuncs:
+            initfuncs[pagetype]()
+
+    def _init_disk_page(self):
         # Disk cache combo
         disk_cache = self.widget("disk-cache-combo")
         uihelpers.build_cache_combo(self.vm, disk_cache)
@@ -976,6 +1020,7 @@ class vmmDetails(vmmGObjectUI):
         if not (self.conn.is_qemu() or self.conn.is_test_conn()):
             self.widget("iotune-expander").set_visible(False)
 
+    def _init_network_page(self):
         # Network source
         net_source = self.widget("network-source-combo")
         net_bridge = self.widget("network-bridge-box")
@@ -993,6 +1038,9 @@ class vmmDetails(vmmGObjectUI):
         net_model = self.widget("network-model-combo")
         uihelpers.build_netmodel_combo(self.vm, net_model)
 
+    def _init_graphics_page(self):
+        no_default = not self.is_customize_dialog
+
         # Graphics type
         gfx_type = self.widget("gfx-type-combo")
         model = Gtk.ListStore(str, str)
@@ -1011,14 +1059,23 @@ class vmmDetails(vmmGObjectUI):
         uihelpers.build_vnc_keymap_combo(self.vm, gfx_keymap,
                                          no_default=no_default)
 
+    def _init_sound_page(self):
+        no_default = not self.is_customize_dialog
+
         # Sound model
         sound_dev = self.widget("sound-model-combo")
         uihelpers.build_sound_combo(self.vm, sound_dev, no_default=no_default)
 
+    def _init_video_page(self):
+        no_default = not self.is_customize_dialog
+
         # Video model combo
         video_dev = self.widget("video-model-combo")
         uihelpers.build_video_combo(self.vm, video_dev, no_default=no_default)
 
+    def _init_watchdog_page(self):
+        no_default = not self.is_customize_dialog
+
         # Watchdog model combo
         combo = self.widget("watchdog-model-combo")
         uihelpers.build_watchdogmodel_combo(self.vm, combo,
@@ -1029,14 +1086,17 @@ class vmmDetails(vmmGObjectUI):
         uihelpers.build_watchdogaction_combo(self.vm, combo,
                                              no_default=no_default)
 
+    def _init_smartcard_page(self):
         # Smartcard mode
         sc_mode = self.widget("smartcard-mode-combo")
         uihelpers.build_smartcard_mode_combo(self.vm, sc_mode)
 
+    def _init_redir_page(self):
         # Redirection type
         combo = self.widget("redir-type-combo")
         uihelpers.build_redir_type_combo(self.vm, combo)
 
+    def _init_controller_page(self):
         # Controller model
         combo = self.widget("controller-model-combo")
         model = Gtk.ListStore(str, str)
@@ -1046,7 +1106,6 @@ class vmmDetails(vmmGObjectUI):
         combo.add_attribute(text, 'text', 1)
         combo.set_active(-1)
 
-
     # Helper function to handle the combo/label pattern used for
     # video model, sound model, network model, etc.
     def set_combo_label(self, prefix, value, model_idx=0, label="",
@@ -1210,6 +1269,33 @@ class vmmDetails(vmmGObjectUI):
             self.oldhwkey = newrow[HW_LIST_COL_DEVICE]
             self.hw_selected()
 
+    def _hw_page_signature(self, pagetype):
+        """
+        Return a value that changes whenever the content of the current
+        hardware page would, or None if the page always needs a refresh
+        """
+        if pagetype == HW_LIST_TYPE_STATS:
+            return None
+
+        if pagetype in [HW_LIST_TYPE_GENERAL, HW_LIST_TYPE_CPU,
+                        HW_LIST_TYPE_MEMORY, HW_LIST_TYPE_BOOT]:
+            xml = self.vm.get_xml(refresh_if_nec=False)
+        else:
+            dev = self.get_hw_selection(HW_LIST_COL_DEVICE)
+            if not dev or isinstance(dev, str):
+                return None
+            xml = dev.get_xml_config()
+
+        inspection = None
+        if pagetype == HW_LIST_TYPE_GENERAL:
+            # The overview also shows inspection data, which isn't
+            # part of the XML
+            data = self.vm.inspection
+            inspection = (data.hostname, data.product_name, data.icon,
+                          data.applications)
+
+        return (pagetype, self.vm.status(), xml, inspection)
+
     def hw_selected(self, page=None):
         pagetype = self.force_get_hw_pagetype(page)
 
@@ -1218,6 +1304,8 @@ class vmmDetails(vmmGObjectUI):
         self.widget("hw-panel").show()
 
         try:
+            self._build_hw_page(pagetype)
+
             if pagetype == HW_LIST_TYPE_GENERAL:
                 self.refresh_overview_page()
             elif pagetype == HW_LIST_TYPE_STATS:
@@ -1259,9 +1347,11 @@ class vmmDetails(vmmGObjectUI):
             else:
                 pagetype = -1
         except Exception, e:
+            self._hw_page_sig = None
             self.err.show_err(_("Error refreshing hardware page: %s") % str(e))
             return
 
+        self._hw_page_sig = self._hw_page_signature(pagetype)
         rem = pagetype in remove_pages
         self.disable_apply()
         self.widget("config-remove").set_visible(rem)
@@ -2535,8 +2625,11 @@ class vmmDetails(vmmGObjectUI):
         # changes (not everytime it is refreshed). This saves us from blindly
         # parsing the xml every tick
 
-        # Add / remove new devices
-        self.repopulate_hw_list()
+        # Add / remove new devices, if the device list can have changed
+        xml = self.vm.get_xml(refresh_if_nec=False)
+        if xml != self._hw_list_xml:
+            self.repopulate_hw_list()
+            self._hw_list_xml = xml
 
         pagetype = self.get_hw_selection(HW_LIST_COL_TYPE)
         if pagetype is None:
@@ -2547,6 +2640,11 @@ class vmmDetails(vmmGObjectUI):
             # erase them
             return
 
+        # Only refresh the page if its device actually changed
+        sig = self._hw_page_signature(pagetype)
+        if sig is not None and sig == self._hw_page_sig:
+            return
+
         self.hw_selected(page=pagetype)
 
     def refresh_overview_page(self):
@@ -2684,14 +2782,25 @@ class vmmDetails(vmmGObjectUI):
         self.widget("overview-network-traffic-text").set_markup(net_txt)
         self.widget("overview-disk-usage-text").set_markup(dsk_txt)
 
+        # Graph saved history if requested
+        history = bool(self.vm.conn.get_stats_store())
+        self.widget("overview-history-label").set_visible(history)
+        self.widget("overview-history-combo").set_visible(history)
+
+        record = None
+        combo = self.widget("overview-history-combo")
+        resolution = combo.get_model()[combo.get_active()][1]
+        if history and resolution:
+            record = self.vm.stats_history(resolution)
+
         self.cpu_usage_graph.set_property("data_array",
-                                          self.vm.guest_cpu_time_vector())
+                            self.vm.guest_cpu_time_vector(record=record))
         self.memory_usage_graph.set_property("data_array",
-                                             self.vm.stats_memory_vector())
+                            self.vm.stats_memory_vector(record=record))
         self.disk_io_graph.set_property("data_array",
-                                        self.vm.disk_io_vector())
+                            self.vm.disk_io_vector(record=record))
         self.network_traffic_graph.set_property("data_array",
-                                                self.vm.network_traffic_vector())
+                            self.vm.network_traffic_vector(record=record))
 
     def _refresh_cpu_count(self):
         conn = self.vm.conn
@@ -3434,6 +3543,7 @@ class vmmDetails(vmmGObjectUI):
         add_hw_list_option("Boot Options", HW_LIST_TYPE_BOOT, "system-run")
 
         self.repopulate_hw_list()
+        self._hw_list_xml = self.vm.get_xml(refresh_if_nec=False)
 
     def repopulate_hw_list(self):
         hw_list = self.widget("hw-list")
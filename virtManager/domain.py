@@ -23,6 +23,7 @@ from gi.repository import GObject
 # pylint: enable=E0611
 
 import logging
+import sys
 import time
 import threading
 
@@ -32,6 +33,19 @@ from virtinst import util
 
 from virtManager import uihelpers
 from virtManager.libvirtobject import vmmLibvirtObject
+from virtManager.statsrecord import vmmStatsRecord
+from virtManager import workerpool
+
+STATS_FIELDS = ["timestamp", "cpuTime", "cpuTimeAbs",
+                "cpuHostPercent", "cpuGuestPercent",
+                "curmem", "currMemPercent",
+                "diskRdKB", "diskWrKB", "netRxKB", "netTxKB",
+                "diskRdRate", "diskWrRate", "netRxRate", "netTxRate"]
+STATS_PERCENT_FIELDS = ["cpuHostPercent", "cpuGuestPercent",
+                        "currMemPercent"]
+
+# Seconds a single device stats call may take before we skip the device
+DEVICE_STATS_TIMEOUT = 5
 
 
 def compare_device(origdev, newdev, idx):
@@ -179,6 +193,8 @@ class vmmDomain(vmmLibvirtObject):
         "inspection-changed": (GObject.SignalFlags.RUN_FIRST, None, []),
         "pre-startup": (GObject.SignalFlags.RUN_FIRST, None, [object]),
     }
+    _coalesce_signals = (vmmLibvirtObject._coalesce_signals +
+                         ["resources-sampled", "inspection-changed"])
 
     def __init__(self, conn, backend, key):
         vmmLibvirtObject.__init__(self, conn, backend, key)
@@ -186,7 +202,13 @@ class vmmDomain(vmmLibvirtObject):
         self.uuid = key
         self.cloning = False
 
-        self.record = []
+        self.record = vmmStatsRecord(STATS_FIELDS,
+                                self.config.get_stats_history_length() + 1,
+                                percent_fields=STATS_PERCENT_FIELDS)
+        # Samples in self.record taken by this run. CPU usage and rates
+        # are only computed against those, not against history restored
+        # from disk, which may be from before a long gap.
+        self._live_samples = 0
         self.maxRecord = {
             "diskRdRate" : 10.0,
             "diskWrRate" : 10.0,
@@ -276,6 +298,7 @@ class vmmDomain(vmmLibvirtObject):
         (self._inactive_xml_flags,
          self._active_xml_flags) = self.conn.get_dom_flags(self._backend)
 
+        self._load_stats_history()
         self.toggle_sample_network_traffic()
         self.toggle_sample_disk_io()
 
@@ -1382,9 +1405,9 @@ class vmmDomain(vmmLibvirtObject):
         pcentHostCpu = 0
         pcentGuestCpu = 0
 
-        if len(self.record) > 0:
-            prevTimestamp = self.record[0]["timestamp"]
-            prevCpuTime = self.record[0]["cpuTimeAbs"]
+        if self._live_samples > 0:
+            prevTimestamp = self.record.get("timestamp")
+            prevCpuTime = self.record.get("cpuTimeAbs")
 
         if not (info[0] in [libvirt.VIR_DOMAIN_SHUTOFF,
                             libvirt.VIR_DOMAIN_CRASHED]):
@@ -1404,11 +1427,11 @@ class vmmDomain(vmmLibvirtObject):
         return cpuTime, cpuTimeAbs, pcentHostCpu, pcentGuestCpu
 
     def _get_cur_rate(self, what):
-        if len(self.record) > 1:
-            ret = (float(self.record[0][what] -
-                         self.record[1][what]) /
-                   float(self.record[0]["timestamp"] -
-                         self.record[1]["timestamp"]))
+        if self._live_samples > 1:
+            ret = (float(self.record.get(what, 0) -
+                         self.record.get(what, 1)) /
+                   float(self.record.get("timestamp", 0) -
+                         self.record.get("timestamp", 1)))
         else:
             ret = 0.0
         return max(ret, 0, 0)  # avoid negative values at poweroff
@@ -1422,56 +1445,47 @@ class vmmDomain(vmmLibvirtObject):
     def _get_record_helper(self, record_name):
         if len(self.record) == 0:
             return 0
-        return self.record[0][record_name]
-
-    def _vector_helper(self, record_name):
-        vector = []
-        stats = self.record
-        for i in range(self.config.get_stats_history_length() + 1):
-            if i < len(stats):
-                vector.append(stats[i][record_name] / 100.0)
-            else:
-                vector.append(0)
-        return vector
+        return self.record.get(record_name)
 
-    def _in_out_vector_helper(self, name1, name2, ceil):
-        vector = []
-        stats = self.record
-        if ceil is None:
-            ceil = self._get_max_rate(name1, name2)
-        maxlen = self.config.get_stats_history_length()
+    def _vector_helper(self, record_name, limit=None, record=None):
+        if record is None:
+            record = self.record
+        return record.fraction_vector(record_name, limit)
 
-        for n in [name1, name2]:
-            for i in range(maxlen + 1):
-                if i < len(stats):
-                    vector.append(float(stats[i][n]) / ceil)
-                else:
-                    vector.append(0.0)
-        return vector
+    def _in_out_vector_helper(self, name1, name2, ceil, record=None,
+                              limit=None):
+        """
+        Return a view of both metrics scaled to ceil, one after the
+        other. With a limit, only the average of the newest 'limit'
+        values of both.
+        """
+        if record is None:
+            record = self.record
 
-    def in_out_vector_limit(self, data, limit):
-        l = len(data) / 2
-        end = min(l, limit)
-        if l > limit:
-            data = data[0:end] + data[l:l + end]
+        if ceil is None:
+            ceil = self._get_max_rate(name1, name2)
+            if record is not self.record:
+                ceil = max(ceil, record.max_value(name1),
+                           record.max_value(name2))
 
-        return [(x + y) / 2 for x, y in zip(data[0:end], data[end:end * 2])]
+        return record.in_out_vector(name1, name2, ceil, length=limit,
+                                    average=limit is not None)
 
     def toggle_sample_network_traffic(self):
         self._enable_net_poll = self.config.get_stats_enable_net_poll()
 
-        if self._enable_net_poll and len(self.record) > 1:
+        if self._enable_net_poll and self._live_samples > 1:
             rxBytes, txBytes = self._sample_network_traffic()
-            self.record[0]["netRxKB"] = rxBytes / 1024
-            self.record[0]["netTxKB"] = txBytes / 1024
+            self.record.set("netRxKB", rxBytes / 1024)
+            self.record.set("netTxKB", txBytes / 1024)
 
     def toggle_sample_disk_io(self):
         self._enable_disk_poll = self.config.get_stats_enable_disk_poll()
 
-        if self._enable_disk_poll and len(self.record) > 1:
+        if self._enable_disk_poll and self._live_samples > 1:
             rdBytes, wrBytes = self._sample_disk_io()
-            self.record[0]["diskRdKB"] = rdBytes / 1024
-            self.record[0]["diskWrKB"] = wrBytes / 1024
+            self.record.set("diskRdKB", rdBytes / 1024)
+            self.record.set("diskWrKB", wrBytes / 1024)
 
 
     ###################
@@ -1509,32 +1523,31 @@ class vmmDomain(vmmLibvirtObject):
     def disk_io_max_rate(self):
         return self._get_max_rate("diskRdRate", "diskWrRate")
 
-    def host_cpu_time_vector(self):
-        return self._vector_helper("cpuHostPercent")
-    def guest_cpu_time_vector(self):
-        return self._vector_helper("cpuGuestPercent")
-    def stats_memory_vector(self):
-        return self._vector_helper("currMemPercent")
-    def network_traffic_vector(self, ceil=None):
-        return self._in_out_vector_helper("netRxRate", "netTxRate", ceil)
-    def disk_io_vector(self, ceil=None):
-        return self._in_out_vector_helper("diskRdRate", "diskWrRate", ceil)
+    # The vector functions take an optional record as returned by
+    # stats_history(), to graph stored history instead of recent samples
+    def host_cpu_time_vector(self, record=None):
+        return self._vector_helper("cpuHostPercent", record=record)
+    def guest_cpu_time_vector(self, record=None):
+        return self._vector_helper("cpuGuestPercent", record=record)
+    def stats_memory_vector(self, record=None):
+        return self._vector_helper("currMemPercent", record=record)
+    def network_traffic_vector(self, ceil=None, record=None):
+        return self._in_out_vector_helper("netRxRate", "netTxRate",
+                                          ceil, record)
+    def disk_io_vector(self, ceil=None, record=None):
+        return self._in_out_vector_helper("diskRdRate", "diskWrRate",
+                                          ceil, record)
 
     def host_cpu_time_vector_limit(self, limit):
-        cpudata = self.host_cpu_time_vector()
-        if len(cpudata) > limit:
-            cpudata = cpudata[0:limit]
-        return cpudata
+        return self._vector_helper("cpuHostPercent", limit)
     def guest_cpu_time_vector_limit(self, limit):
-        cpudata = self.guest_cpu_time_vector()
-        if len(cpudata) > limit:
-            cpudata = cpudata[0:limit]
-        return cpudata
+        return self._vector_helper("cpuGuestPercent", limit)
     def network_traffic_vector_limit(self, limit, ceil=None):
-        return self.in_out_vector_limit(self.network_traffic_vector(ceil),
-                                        limit)
+        return self._in_out_vector_helper("netRxRate", "netTxRate",
+                                          ceil, limit=limit)
     def disk_io_vector_limit(self, limit, ceil=None):
-        return self.in_out_vector_limit(self.disk_io_vector(ceil), limit)
+        return self._in_out_vector_helper("diskRdRate", "diskWrRate",
+                                          ceil, limit=limit)
 
 
     ###################
@@ -1682,7 +1695,85 @@ class vmmDomain(vmmLibvirtObject):
     # Polling helpers #
     ###################
 
-    def _sample_network_traffic(self):
+    def _sample_bulk_dev_stats(self, bulkstats, prefix,
+                               key1, key2, skiplist):
+        """
+        Sum up per device counters from getAllDomainStats output, ex.
+        block.0.name, block.0.rd.bytes, ...
+        """
+        val1 = 0
+        val2 = 0
+        for idx in range(bulkstats.get("%s.count" % prefix, 0)):
+            base = "%s.%d." % (prefix, idx)
+            if bulkstats.get(base + "name") in skiplist:
+                continue
+            val1 += bulkstats.get(base + key1, 0)
+            val2 += bulkstats.get(base + key2, 0)
+        return val1, val2
+
+    def _skip_stats_dev(self, dev, skiplist):
+        if self.is_active():
+            logging.debug("Adding %s to skip list", dev)
+            skiplist.append(dev)
+        else:
+            logging.debug("Aren't running, don't add to skiplist")
+
+    def _sample_device_stats(self, kind, devs, statsfunc, skiplist):
+        """
+        Call statsfunc(dev) for every device not in skiplist. With
+        multiple devices the calls are made in parallel from the
+        connection's device stats pool. Devices whose call errors or
+        times out are added to skiplist, devices whose call was
+        cancelled before it ran are just tried again next time.
+
+        @returns: (list of non empty stats results, False if the
+            stats API isn't supported)
+        """
+        devs = [dev for dev in devs if dev and dev not in skiplist]
+        if len(devs) > 1:
+            results = self.conn.get_device_stats_pool().map(statsfunc,
+                                            devs, DEVICE_STATS_TIMEOUT)
+        else:
+            results = []
+            for dev in devs:
+                try:
+                    results.append((True, statsfunc(dev)))
+                except Exception:
+                    results.append((False, sys.exc_info()))
+
+        ret = []
+        supported = True
+        for dev, result in zip(devs, results):
+            if result is workerpool.CANCELLED:
+                continue
+            if result is None:
+                logging.error("Timed out reading %s stats for '%s' dev '%s'",
+                              kind, self.get_name(), dev)
+                self._skip_stats_dev(dev, skiplist)
+                continue
+
+            success, val = result
+            if success:
+                if val:
+                    ret.append(val)
+                continue
+
+            err = val[1]
+            if not isinstance(err, libvirt.libvirtError):
+                raise val[0], val[1], val[2]
+            if util.is_error_nosupport(err):
+                logging.debug("%s stats not supported: %s",
+                              kind.capitalize(), err)
+                supported = False
+            else:
+                logging.error("Error reading %s stats for "
+                              "'%s' dev '%s': %s",
+                              kind, self.get_name(), dev, err)
+                self._skip_stats_dev(dev, skiplist)
+
+        return ret, supported
+
+    def _sample_network_traffic(self, bulkstats=None):
         rx = 0
         tx = 0
         if (not self._stats_net_supported or
@@ -1690,36 +1781,25 @@ class vmmDomain(vmmLibvirtObject):
             not self.is_active()):
             return rx, tx
 
-        for netdev in self.get_network_devices(refresh_if_nec=False):
-            dev = netdev.target_dev
-            if not dev:
-                continue
-
-            if dev in self._stats_net_skip:
-                continue
-
-            try:
-                io = self._backend.interfaceStats(dev)
-                if io:
-                    rx += io[0]
-                    tx += io[4]
-            except libvirt.libvirtError, err:
-                if util.is_error_nosupport(err):
-                    logging.debug("Net stats not supported: %s", err)
-                    self._stats_net_supported = False
-                else:
-                    logging.error("Error reading net stats for "
-                                  "'%s' dev '%s': %s",
-                                  self.get_name(), dev, err)
-                    if self.is_active():
-                        logging.debug("Adding %s to skip list", dev)
-                        self._stats_net_skip.append(dev)
-                    else:
-                        logging.debug("Aren't running, don't add to skiplist")
-
+        if bulkstats is not None:
+            return self._sample_bulk_dev_stats(bulkstats, "net",
+                                               "rx.bytes", "tx.bytes",
+                                               self._stats_net_skip)
+
+        devs = [netdev.target_dev for netdev in
+                self.get_network_devices(refresh_if_nec=False)]
+        allio, supported = self._sample_device_stats("net", devs,
+                                self._backend.interfaceStats,
+                                self._stats_net_skip)
+        if not supported:
+            self._stats_net_supported = False
+
+        for io in allio:
+            rx += io[0]
+            tx += io[4]
         return rx, tx
 
-    def _sample_disk_io(self):
+    def _sample_disk_io(self, bulkstats=None):
         rd = 0
         wr = 0
         if (not self._stats_disk_supported or
@@ -1727,53 +1807,62 @@ class vmmDomain(vmmLibvirtObject):
             not self.is_active()):
             return rd, wr
 
-        for disk in self.get_disk_devices(refresh_if_nec=False):
-            dev = disk.target
-            if not dev:
-                continue
-
-            if dev in self._stats_disk_skip:
-                continue
+        if bulkstats is not None:
+            return self._sample_bulk_dev_stats(bulkstats, "block",
+                                               "rd.bytes", "wr.bytes",
+                                               self._stats_disk_skip)
+
+        devs = [disk.target for disk in
+                self.get_disk_devices(refresh_if_nec=False)]
+        allio, supported = self._sample_device_stats("disk", devs,
+                                self._backend.blockStats,
+                                self._stats_disk_skip)
+        if not supported:
+            self._stats_disk_supported = False
+
+        for io in allio:
+            rd += io[1]
+            wr += io[3]
+        return rd, wr
 
-            try:
-                io = self._backend.blockStats(dev)
-                if io:
-                    rd += io[1]
-                    wr += io[3]
-            except libvirt.libvirtError, err:
-                if util.is_error_nosupport(err):
-                    logging.debug("Disk stats not supported: %s", err)
-                    self._stats_disk_supported = False
-                else:
-                    logging.error("Error reading disk stats for "
-                                  "'%s' dev '%s': %s",
-                                  self.get_name(), dev, err)
-                    if self.is_active():
-                        logging.debug("Adding %s to skip list", dev)
-                        self._stats_disk_skip.append(dev)
-                    else:
-                        logging.debug("Aren't running, don't add to skiplist")
+    def _info_from_bulk_stats(self, bulkstats):
+        """
+        Build a virDomain.info() style list from getAllDomainStats output
+        """
+        return [bulkstats.get("state.state", libvirt.VIR_DOMAIN_NOSTATE),
+                bulkstats.get("balloon.maximum", self.maximum_memory()),
+                bulkstats.get("balloon.current", 0),
+                bulkstats.get("vcpu.current", self.vcpu_count()),
+                bulkstats.get("cpu.time", 0)]
 
-        return rd, wr
+    def tick(self, stats_update=True, bulkstats=None):
+        """
+        @param bulkstats: Stats dict for this domain from the connection's
+            getAllDomainStats call. If None, sample stats ourselves
+        """
+        # With domain events, status and XML changes are pushed to us
+        # by the connection, so the tick is only needed for stats
+        using_events = self.conn.using_domain_events
+        if using_events and not stats_update:
+            return
 
-    def tick(self, stats_update=True):
-        self._invalidate_xml()
-        info = self._backend.info()
+        if not using_events:
+            self._invalidate_xml()
+        if bulkstats is not None:
+            info = self._info_from_bulk_stats(bulkstats)
+        else:
+            info = self._backend.info()
 
         if stats_update:
-            self._tick_stats(info)
+            self._tick_stats(info, bulkstats)
 
-        self._update_status(info[0])
+        if not using_events:
+            self._update_status(info[0])
 
         if stats_update:
             self.idle_emit("resources-sampled")
 
-    def _tick_stats(self, info):
-        expected = self.config.get_stats_history_length()
-        current = len(self.record)
-        if current > expected:
-            del self.record[expected:current]
-
+    def _tick_stats(self, info, bulkstats=None):
         # Xen reports complete crap for Dom0 max memory
         # (ie MAX_LONG) so lets clamp it to the actual
         # physical RAM in machine which is the effective
@@ -1786,8 +1875,8 @@ class vmmDomain(vmmLibvirtObject):
         (cpuTime, cpuTimeAbs,
          pcentHostCpu, pcentGuestCpu) = self._sample_cpu_stats(info, now)
         pcentCurrMem, curmem = self._sample_mem_stats(info)
-        rdBytes, wrBytes = self._sample_disk_io()
-        rxBytes, txBytes = self._sample_network_traffic()
+        rdBytes, wrBytes = self._sample_disk_io(bulkstats)
+        rxBytes, txBytes = self._sample_network_traffic(bulkstats)
 
         newStats = {
             "timestamp": now,
@@ -1807,7 +1896,42 @@ class vmmDomain(vmmLibvirtObject):
             newStats[r + "Rate"] = self._get_cur_rate(r + "KB")
             self._set_max_rate(newStats, r + "Rate")
 
-        self.record.insert(0, newStats)
+        self.record.append(newStats)
+        self._live_samples += 1
+
+        store = self.conn.get_stats_store()
+        if store:
+            store.append(self.get_uuid(), newStats)
+
+    def _load_stats_history(self):
+        """
+        Prefill the stats record with samples saved by a previous run.
+        They are only shown in the graphs, see _live_samples
+        """
+        store = self.conn.get_stats_store()
+        if not store or len(self.record):
+            return
+
+        capacity = self.config.get_stats_history_length() + 1
+        for sample in store.history(self.get_uuid(), "raw")[-capacity:]:
+            self.record.append(sample)
+
+    def stats_history(self, resolution):
+        """
+        Return a vmmStatsRecord of the stats history saved to disk,
+        averaged to 'resolution' ('minute' or 'hour'). None if on disk
+        history isn't enabled
+        """
+        store = self.conn.get_stats_store()
+        if not store:
+            return None
+
+        record = vmmStatsRecord(STATS_FIELDS,
+                                store.get_capacity(resolution),
+                                percent_fields=STATS_PERCENT_FIELDS)
+        for sample in store.history(self.get_uuid(), resolution):
+            record.append(sample)
+        return record
 
 
 ########################
@@ -26,13 +26,14 @@ from gi.repository import Gtk
 
 import logging
 import re
-import Queue
 import threading
+import time
 
 import libvirt
 from virtinst import util
 
 from virtManager import packageutils
+from virtManager import tickprofile
 from virtManager import uihelpers
 from virtManager.about import vmmAbout
 from virtManager.baseclass import vmmGObject
@@ -58,8 +59,162 @@ DETAILS_PERF = 1
 DETAILS_CONFIG = 2
 DETAILS_CONSOLE = 3
 
-(PRIO_HIGH,
- PRIO_LOW) = range(1, 3)
+# A busy connection's timer interval can be stretched up to this many
+# times the configured stats update interval
+TICK_MAX_BACKOFF = 16
+# Connections without any visible window are polled this many times
+# less often
+TICK_HIDDEN_BACKOFF = 5
+# Seconds between debug logs of the tick worker statistics
+TICK_STATS_LOG_INTERVAL = 300
+
+
+class _vmmTickWorker(object):
+    """
+    Tick thread for a single connection. Every connection gets its own
+    worker, so a slow or unreachable host can't delay stats and state
+    updates for any other connection.
+
+    Tick requests that arrive while another one is still pending are
+    merged into it by ORing their poll flags, so a burst of requests
+    results in a single conn.tick call.
+    """
+    def __init__(self, conn, tick_cb):
+        self.conn = conn
+        self._tick_cb = tick_cb
+        self._cond = threading.Condition()
+        self._pending = None
+        self._pending_count = 0
+        self._slow = False
+        self._stopped = False
+
+        # Duration in seconds of the last and slowest completed tick
+        self.last_duration = 0
+        self.max_duration = 0
+
+        # Tick requests folded into an already pending tick, and
+        # conn.tick calls actually made
+        self.merged_count = 0
+        self.executed_count = 0
+
+        # Effective timer tick interval in seconds. _load_interval is
+        # the part adapted to how long ticks take
+        self.interval = 0
+        self._load_interval = 0
+        self._last_timer_tick = 0
+
+        self._thread = threading.Thread(
+                                name="Tick thread %s" % conn.get_uri(),
+                                target=self._handle_tick_queue,
+                                args=())
+        self._thread.daemon = True
+        self._thread.start()
+
+    def queue_depth(self):
+        return self._pending_count
+
+    def timer_tick_due(self, now, base, visible):
+        """
+        Decide if the engine's periodic timer should tick this connection.
+        The interval backs off while ticks take more than half of it,
+        and shrinks back towards the configured interval once they
+        take less than a quarter.
+
+        @param base: Configured stats update interval in seconds
+        @param visible: Whether any window showing this connection is
+            visible. If not, poll less often
+        """
+        self.interval = max(base, self._load_interval)
+        if not visible:
+            self.interval *= TICK_HIDDEN_BACKOFF
+
+        # Allow for some timer jitter
+        if now - self._last_timer_tick < self.interval - base / 2.0:
+            return False
+        self._last_timer_tick = now
+
+        load = max(base, self._load_interval)
+        if self.last_duration > load * .5:
+            load *= 2
+        elif self.last_duration < load * .25:
+            load /= 2.0
+        load = max(base, min(load, base * TICK_MAX_BACKOFF))
+
+        if load != self._load_interval and self._load_interval:
+            logging.debug("Tick interval for %s is now %ss",
+                          self.conn.get_uri(), load)
+        self._load_interval = load
+        return True
+
+    def add_tick(self, isprio, kwargs):
+        self._cond.acquire()
+        try:
+            if self._pending is None:
+                self._pending = dict(kwargs)
+                self._pending_count = 1
+                self._cond.notify()
+                return
+
+            # A timer tick landing on top of another one means the
+            # previous tick is still running
+            if (not isprio and
+                self._pending.get("stats_update") and
+                not self._slow):
+                logging.debug("Tick for %s is slow, not running at "
+                              "requested rate.", self.conn.get_uri())
+                self._slow = True
+
+            for key, val in kwargs.items():
+                self._pending[key] = bool(self._pending.get(key) or val)
+            self._pending_count += 1
+            self.merged_count += 1
+        finally:
+            self._cond.release()
+
+    def stop(self):
+        self._cond.acquire()
+        try:
+            self._stopped = True
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def _get_pending(self):
+        self._cond.acquire()
+        try:
+            while self._pending is None and not self._stopped:
+                self._cond.wait()
+
+            kwargs = self._pending
+            self._pending = None
+            self._pending_count = 0
+            return kwargs
+        finally:
+            self._cond.release()
+
+    def _handle_tick_queue(self):
+        while True:
+            kwargs = self._get_pending()
+            if self._stopped:
+                break
+
+            start = time.time()
+            self._tick_cb(self.conn, kwargs)
+            self.last_duration = time.time() - start
+            self.max_duration = max(self.max_duration, self.last_duration)
+            self.executed_count += 1
+
+            self._cond.acquire()
+            try:
+                caught_up = self._pending is None
+            finally:
+                self._cond.release()
+            if self._slow and caught_up:
+                logging.debug("Tick for %s caught up", self.conn.get_uri())
+                self._slow = False
+
+        self.conn = None
+        self._tick_cb = None
 
 
 class vmmEngine(vmmGObject):
@@ -83,6 +238,7 @@ class vmmEngine(vmmGObject):
 
         self.timer = None
         self.last_timeout = 0
+        self._last_tick_stats_log = time.time()
 
         self.systray = None
         self.delete_dialog = None
@@ -92,14 +248,6 @@ class vmmEngine(vmmGObject):
         self.application.connect("activate", self._activate)
         self._appwindow = Gtk.Window()
 
-        self._tick_counter = 0
-        self._tick_thread_slow = False
-        self._tick_thread = threading.Thread(name="Tick thread",
-                                            target=self._handle_tick_queue,
-                                            args=())
-        self._tick_thread.daemon = True
-        self._tick_queue = Queue.PriorityQueue(100)
-
         self.inspection = None
         self._create_inspection_thread()
 
@@ -123,8 +271,8 @@ class vmmEngine(vmmGObject):
 
         self.schedule_timer()
         self.load_stored_uris()
+        tickprofile.set_tick_stats_cb(self.get_all_tick_stats)
 
-        self._tick_thread.start()
         self.tick()
 
 
@@ -275,34 +423,74 @@ class vmmEngine(vmmGObject):
         self.timer = self.timeout_add(interval, self.tick)
 
     def _add_obj_to_tick_queue(self, obj, isprio, **kwargs):
-        if self._tick_queue.full():
-            if not self._tick_thread_slow:
-                logging.debug("Tick is slow, not running at requested rate.")
-                self._tick_thread_slow = True
+        if obj.get_uri() not in self.conns:
             return
-
-        self._tick_counter += 1
-        self._tick_queue.put((isprio and PRIO_HIGH or PRIO_LOW,
-                              self._tick_counter,
-                              obj, kwargs))
+        worker = self.conns[obj.get_uri()]["tickWorker"]
+        worker.add_tick(isprio, kwargs)
 
     def _schedule_priority_tick(self, conn, kwargs):
         self._add_obj_to_tick_queue(conn, True, **kwargs)
 
+    def _conn_is_visible(self, uri):
+        if self.windowManager and self.windowManager.is_visible():
+            return True
+        if (self.conns[uri]["windowHost"] and
+            self.conns[uri]["windowHost"].is_visible()):
+            return True
+        for win in self.conns[uri]["windowDetails"].values():
+            if win.is_visible():
+                return True
+        return False
+
     def tick(self):
+        now = time.time()
+        base = self.config.get_stats_update_interval()
+
         for uri in self.conns.keys():
             conn = self.conns[uri]["conn"]
+            worker = self.conns[uri]["tickWorker"]
+
+            due = worker.timer_tick_due(now, base,
+                                        self._conn_is_visible(uri))
+            conn.tick_interval = worker.interval
+            if not due:
+                continue
+
             self._add_obj_to_tick_queue(conn, False,
                                         stats_update=True, pollvm=True)
-        return 1
 
-    def _handle_tick_queue(self):
-        while True:
-            ignore1, ignore2, obj, kwargs = self._tick_queue.get()
-            self._tick_single_conn(obj, kwargs)
-            self._tick_queue.task_done()
+        if now - self._last_tick_stats_log >= TICK_STATS_LOG_INTERVAL:
+            self._last_tick_stats_log = now
+            allstats = self.get_all_tick_stats()
+            for uri in sorted(allstats.keys()):
+                stats = allstats[uri]
+                logging.debug("%s", tickprofile.format_tick_stats(uri, stats))
         return 1
 
+    def get_tick_stats(self, uri):
+        """
+        Return a dict of tick statistics for the connection's tick worker:
+        last and slowest tick duration in seconds, number of tick requests
+        currently pending, and counts of merged versus executed ticks.
+        """
+        worker = self.conns[uri]["tickWorker"]
+        return {
+            "lastDuration": worker.last_duration,
+            "maxDuration": worker.max_duration,
+            "queueDepth": worker.queue_depth(),
+            "merged": worker.merged_count,
+            "executed": worker.executed_count,
+        }
+
+    def get_all_tick_stats(self):
+        """
+        Return a dict of uri -> get_tick_stats(uri) for every connection
+        """
+        ret = {}
+        for uri in self.conns:
+            ret[uri] = self.get_tick_stats(uri)
+        return ret
+
     def _tick_single_conn(self, conn, kwargs):
         try:
             conn.tick(**kwargs)
@@ -359,6 +547,7 @@ class vmmEngine(vmmGObject):
 
         if self.timer is not None:
             GLib.source_remove(self.timer)
+        tickprofile.set_tick_stats_cb(None)
 
         if self.systray:
             self.systray.cleanup()
@@ -404,6 +593,8 @@ class vmmEngine(vmmGObject):
             # Already in cleanup
             return
 
+        # Dump before cleanup tears down the connection tick workers
+        tickprofile.dump()
         self.cleanup()
 
         if debug_ref_leaks:
@@ -455,7 +646,8 @@ class vmmEngine(vmmGObject):
             "windowHost": None,
             "windowDetails": {},
             "windowClone": None,
-            "probeConnection": probe
+            "probeConnection": probe,
+            "tickWorker": _vmmTickWorker(conn, self._tick_single_conn),
         }
 
         conn.connect("vm-removed", self._do_vm_removed)
@@ -493,6 +685,7 @@ class vmmEngine(vmmGObject):
 
     def cleanup_conn(self, uri):
         try:
+            self.conns[uri]["tickWorker"].stop()
             if self.conns[uri]["windowHost"]:
                 self.conns[uri]["windowHost"].cleanup()
             if self.conns[uri]["windowClone"]:
@@ -15,8 +15,11 @@
 # MA 02110-1301 USA.
 #
 
+import collections
+
 # pylint: disable=E0611
 from gi.repository import GObject
+from gi.repository import Gdk
 from gi.repository import Gtk
 # pylint: enable=E0611
 
@@ -101,6 +104,9 @@ def draw_fill(cairo_ct, x, y, w, h, points, taper=False):
 
 
 class CellRendererSparkline(Gtk.CellRenderer):
+    # Max number of rows whose last rendered graph we keep around
+    CACHE_SIZE = 64
+
     __gproperties__ = {
         # 'name' : (GObject.TYPE_*,
         #           nickname, long desc, (type related args), mode)
@@ -112,17 +118,37 @@ class CellRendererSparkline(Gtk.CellRenderer):
         'reversed': (GObject.TYPE_BOOLEAN, "Reverse data",
                      "Process data from back to front.",
                      0, GObject.PARAM_READWRITE),
+        'data_key': (GObject.TYPE_PYOBJECT, "Data key",
+                     "Identifies the row being graphed, for caching",
+                     GObject.PARAM_READWRITE),
     }
 
     def __init__(self):
         Gtk.CellRenderer.__init__(self)
 
         self.data_array = []
+        self.data_key = None
         self.num_sets = 0
         self.filled = True
         self.reversed = False
         self.rgb = None
 
+        # data_key -> (render key, cairo pattern) of the last graph
+        # rendered for every row
+        self._cache = collections.OrderedDict()
+
+    def _cache_key(self, cell_area):
+        get_version = getattr(self.data_array, "get_data_version", None)
+        if get_version:
+            version = get_version()
+        else:
+            version = tuple(self.data_array)
+
+        return (version,
+                cell_area.width, cell_area.height,
+                self.reversed, self.filled, self.num_sets,
+                tuple(self.rgb or []))
+
     def do_render(self, cr, widget, background_area, cell_area,
                   flags):
         # cr                : Cairo context
@@ -136,6 +162,44 @@ class CellRendererSparkline(Gtk.CellRenderer):
         ignore = background_area
         ignore = flags
 
+        # The graph is rendered once into a group at the cell origin,
+        # and the resulting pattern is reused until the data version,
+        # the cell size, or the style changes
+        key = self._cache_key(cell_area)
+        pattern = None
+        entry = self._cache.pop(self.data_key, None)
+        if entry and entry[0] == key:
+            pattern = entry[1]
+
+        cr.save()
+        cr.translate(cell_area.x, cell_area.y)
+
+        if not pattern:
+            area = Gdk.Rectangle()
+            area.x = 0
+            area.y = 0
+            area.width = cell_area.width
+            area.height = cell_area.height
+
+            cr.push_group()
+            self._render_graph(cr, area)
+            pattern = cr.pop_group()
+
+        cr.set_source(pattern)
+        cr.paint()
+
+        # Only cache the graph if it wasn't clipped while rendering
+        x1, y1, x2, y2 = cr.clip_extents()
+        if (self.data_key is not None and
+            x1 <= 0 and y1 <= 0 and
+            x2 >= cell_area.width and y2 >= cell_area.height):
+            self._cache[self.data_key] = (key, pattern)
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+        cr.restore()
+
+    def _render_graph(self, cr, cell_area):
         # Indent of the gray border around the graph
         BORDER_PADDING = 2
         # Indent of graph from border
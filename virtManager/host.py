@@ -286,11 +286,14 @@ class vmmHost(vmmGObjectUI):
         self.widget("overview-arch").set_text(arch)
         self.widget("config-autoconnect").set_active(auto)
 
+        # The stats vectors are newest first
         self.cpu_usage_graph = Sparkline()
+        self.cpu_usage_graph.set_property("reversed", True)
         self.cpu_usage_graph.show()
         self.widget("performance-table").attach(self.cpu_usage_graph,                                                           1, 2, 0, 1)
 
         self.memory_usage_graph = Sparkline()
+        self.memory_usage_graph.set_property("reversed", True)
         self.memory_usage_graph.show()
         self.widget("performance-table").attach(self.memory_usage_graph,
                                                 1, 2, 1, 2)
@@ -379,9 +382,6 @@ class vmmHost(vmmGObjectUI):
         cpu_vector = self.conn.host_cpu_time_vector()
         memory_vector = self.conn.stats_memory_vector()
 
-        cpu_vector.reverse()
-        memory_vector.reverse()
-
         self.widget("performance-cpu").set_text("%d %%" %
                                         self.conn.host_cpu_time_percentage())
         self.widget("performance-memory").set_text(
@@ -391,6 +391,11 @@ class vmmHost(vmmGObjectUI):
         self.cpu_usage_graph.set_property("data_array", cpu_vector)
         self.memory_usage_graph.set_property("data_array", memory_vector)
 
+        interval = (self.conn.tick_interval or
+                    self.config.get_stats_update_interval())
+        self.widget("performance-interval").set_text(
+                            _("%(interval)d sec") % {"interval": interval})
+
     def conn_state_changed(self, ignore1=None):
         conn_active = (self.conn.get_state() == vmmConnection.STATE_ACTIVE)
         self.widget("menu_file_restore_saved").set_sensitive(conn_active)
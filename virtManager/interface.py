@@ -51,7 +51,7 @@ class vmmInterface(vmmLibvirtObject):
 
     def xpath(self, *args, **kwargs):
         # Must use this function for ALL XML parsing
-        ret = util.xpath(self.get_xml(), *args, **kwargs)
+        ret = self._xpath(*args, **kwargs)
         if ret:
             return ret
         if not self.is_active():
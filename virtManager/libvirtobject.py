@@ -24,14 +24,17 @@ from gi.repository import GObject
 
 import difflib
 import logging
+import threading
 
 import libxml2
 
+from virtinst import util
+
 from virtManager.baseclass import vmmGObject
 
 
-def _sanitize_xml(xml):
-    xml = libxml2.parseDoc(xml).serialize()
+def _serialize_doc(doc):
+    xml = doc.serialize()
     # Strip starting <?...> line
     if xml.startswith("<?"):
         ignore, xml = xml.split("\n", 1)
@@ -40,12 +43,62 @@ def _sanitize_xml(xml):
     return xml
 
 
+def _sanitize_xml(xml):
+    doc = libxml2.parseDoc(xml)
+    try:
+        return _serialize_doc(doc)
+    finally:
+        doc.freeDoc()
+
+
+class _ParsedXML(object):
+    """
+    libxml2 document and xpath context of an XML string. The document
+    is freed when the last reference goes away, so hold on to this
+    object while using any nodes from it.
+
+    xpath contexts aren't thread safe, so only evaluate on ctx with
+    'lock' held, or use xpath_eval.
+    """
+    def __init__(self, xml):
+        self.xml = xml
+        self.doc = None
+        self.ctx = None
+        self._digest = None
+        self.lock = threading.Lock()
+
+        self.doc = libxml2.parseDoc(xml)
+        self.ctx = self.doc.xpathNewContext()
+
+    def __del__(self):
+        if self.ctx:
+            self.ctx.xpathFreeContext()
+        if self.doc:
+            self.doc.freeDoc()
+
+    def xpath_eval(self, path):
+        self.lock.acquire()
+        try:
+            return self.ctx.xpathEval(path)
+        finally:
+            self.lock.release()
+
+    def get_digest(self):
+        """
+        Return the (cached) util.xml_digest of the document
+        """
+        if self._digest is None:
+            self._digest = util.xml_digest(self.doc)
+        return self._digest
+
+
 class vmmLibvirtObject(vmmGObject):
     __gsignals__ = {
         "config-changed": (GObject.SignalFlags.RUN_FIRST, None, []),
         "started": (GObject.SignalFlags.RUN_FIRST, None, []),
         "stopped": (GObject.SignalFlags.RUN_FIRST, None, []),
     }
+    _coalesce_signals = ["config-changed"]
 
     def __init__(self, conn, backend, key):
         vmmGObject.__init__(self)
@@ -55,6 +108,7 @@ class vmmLibvirtObject(vmmGObject):
 
         self._xml = None
         self._is_xml_valid = False
+        self._parsed_xml = None
 
         # These should be set by the child classes if necessary
         self._inactive_xml_flags = 0
@@ -119,6 +173,7 @@ class vmmLibvirtObject(vmmGObject):
 
         origxml = self._xml
         self._invalidate_xml()
+        self._parsed_xml = None
         self._xml = self._XMLDesc(self._active_xml_flags)
         self._is_xml_valid = True
 
@@ -126,6 +181,44 @@ class vmmLibvirtObject(vmmGObject):
             self.idle_emit("config-changed")
 
 
+    def _get_parsed_xml(self):
+        """
+        Return a _ParsedXML of get_xml(). The parsed document is reused
+        by all callers until the XML string changes.
+        """
+        xml = self.get_xml()
+        parsed = self._parsed_xml
+        if not parsed or parsed.xml != xml:
+            parsed = _ParsedXML(xml)
+            self._parsed_xml = parsed
+        return parsed
+
+    def _xpath(self, path=None, func=None):
+        """
+        Like util.xpath(self.get_xml(), ...), but without reparsing
+        the XML on every call
+        """
+        if not func and not path:
+            raise ValueError("'path' or 'func' is required.")
+
+        # The tick thread and the main thread both use the cached
+        # context, so hold its lock for the whole evaluation
+        parsed = self._get_parsed_xml()
+        parsed.lock.acquire()
+        try:
+            if func:
+                return func(parsed.ctx)
+
+            ret = parsed.ctx.xpathEval(path)
+            if type(ret) is list:
+                if not ret:
+                    return None
+                return ret[0].content
+            return ret
+        finally:
+            parsed.lock.release()
+
+
     ######################################
     # Internal XML cache/update routines #
     ######################################
@@ -143,19 +236,31 @@ class vmmLibvirtObject(vmmGObject):
         return _sanitize_xml(self.get_xml(inactive=True))
 
     def _redefine_helper(self, origxml, newxml):
-        origxml = _sanitize_xml(origxml)
-        newxml  = _sanitize_xml(newxml)
-        if origxml != newxml:
-            diff = "".join(difflib.unified_diff(origxml.splitlines(1),
-                                                newxml.splitlines(1),
-                                                fromfile="Original XML",
-                                                tofile="New XML"))
-            logging.debug("Redefining '%s' with XML diff:\n%s",
-                          self.get_name(), diff)
-
-            self._define(newxml)
-        else:
+        if origxml == newxml:
+            logging.debug("Redefine requested, but XML didn't change!")
+            return
+
+        # Reuse the cached parse when origxml is the current XML
+        origparsed = self._parsed_xml
+        if not origparsed or origparsed.xml != origxml:
+            origparsed = _ParsedXML(origxml)
+        newparsed = _ParsedXML(newxml)
+
+        if origparsed.get_digest() == newparsed.get_digest():
             logging.debug("Redefine requested, but XML didn't change!")
+            return
+
+        # Sanitize from the documents parsed above, not the strings
+        origxml = _serialize_doc(origparsed.doc)
+        newxml = _serialize_doc(newparsed.doc)
+        diff = "".join(difflib.unified_diff(origxml.splitlines(1),
+                                            newxml.splitlines(1),
+                                            fromfile="Original XML",
+                                            tofile="New XML"))
+        logging.debug("Redefining '%s' with XML diff:\n%s",
+                      self.get_name(), diff)
+
+        self._define(newxml)
 
         # Make sure we have latest XML
         self.refresh_xml(forcesignal=True)
@@ -24,7 +24,6 @@ import logging
 from gi.repository import GObject
 from gi.repository import Gtk
 from gi.repository import Gdk
-from gi.repository import GdkPixbuf
 # pylint: enable=E0611
 
 from virtinst import util
@@ -39,18 +38,18 @@ import libvirt
 # Number of data points for performance graphs
 GRAPH_LEN = 40
 
-# fields in the tree model data set
+# fields in the tree model data set. Markup, icons and hints aren't
+# stored, they are computed when a row is drawn
 (ROW_HANDLE,
 ROW_SORT_KEY,
-ROW_MARKUP,
-ROW_STATUS_ICON,
-ROW_HINT,
 ROW_IS_CONN,
 ROW_IS_CONN_CONNECTED,
 ROW_IS_VM,
 ROW_IS_VM_RUNNING,
-ROW_COLOR,
-ROW_INSPECTION_OS_ICON) = range(11)
+ROW_SORT_GUEST_CPU,
+ROW_SORT_HOST_CPU,
+ROW_SORT_DISK,
+ROW_SORT_NETWORK) = range(10)
 
 # Columns in the tree view
 (COL_NAME,
@@ -60,6 +59,17 @@ COL_DISK,
 COL_NETWORK) = range(5)
 
 
+# Bit flags of what needs doing for a queued row update, besides
+# redrawing it
+ROW_UPDATE_CONFIG = 1 << 0
+# Only for connection rows: refresh the stats sort keys of all its rows
+ROW_UPDATE_SORT_KEYS = 1 << 1
+
+# Model columns the stats columns sort on
+STATS_SORT_COLUMNS = [ROW_SORT_GUEST_CPU, ROW_SORT_HOST_CPU,
+                      ROW_SORT_DISK, ROW_SORT_NETWORK]
+
+
 def _style_get_prop(widget, propname):
     value = GObject.Value()
     value.init(GObject.TYPE_INT)
@@ -67,24 +77,6 @@ def _style_get_prop(widget, propname):
     return value.get_int()
 
 
-def _get_inspection_icon_pixbuf(vm, w, h):
-    # libguestfs gives us the PNG data as a string.
-    png_data = vm.inspection.icon
-    if png_data is None:
-        return None
-
-    try:
-        pb = GdkPixbuf.PixbufLoader()
-        pb.set_size(w, h)
-        pb.write(png_data)
-        pb.close()
-        return pb.get_pixbuf()
-    except:
-        logging.exception("Error loading inspection icon data")
-        vm.inspection.icon = None
-        return None
-
-
 class vmmManager(vmmGObjectUI):
     __gsignals__ = {
         "action-show-connect": (GObject.SignalFlags.RUN_FIRST, None, []),
@@ -120,6 +112,23 @@ class vmmManager(vmmGObjectUI):
         # allow O(1) access instead of O(n)
         self.rows = {}
 
+        # Row key -> ROW_UPDATE_* flags for rows that need updating.
+        # Flushed once per main loop iteration, see _queue_row_update
+        self._pending_rows = {}
+        self._pending_rows_queued = False
+        # Set while sorting is suspended to batch model changes
+        self._sort_suspended = False
+
+        # VM rows are only built for expanded connections. Collapsed
+        # connections with VMs get a single placeholder child row, so
+        # they still show an expander.
+        # URIs of connections with VM rows
+        self._populated_conns = set()
+        # URIs of connections the user collapsed
+        self._collapsed_conns = set()
+        # Row key -> VM, for VM rows to add with the next row flush
+        self._pending_vms = {}
+
         w, h = self.config.get_manager_window_size()
         self.topwin.set_default_size(w or 550, h or 550)
         self.prev_position = None
@@ -229,6 +238,8 @@ class vmmManager(vmmGObjectUI):
 
     def _cleanup(self):
         self.rows = None
+        self._pending_rows = {}
+        self._pending_vms = {}
 
         self.diskcol = None
         self.guestcpucol = None
@@ -389,19 +400,21 @@ class vmmManager(vmmGObjectUI):
         rowtypes = []
         rowtypes.insert(ROW_HANDLE, object)  # backing object
         rowtypes.insert(ROW_SORT_KEY, str)  # object name
-        rowtypes.insert(ROW_MARKUP, str)  # row markup text
-        rowtypes.insert(ROW_STATUS_ICON, str)  # status icon name
-        rowtypes.insert(ROW_HINT, str)  # row tooltip
         rowtypes.insert(ROW_IS_CONN, bool)  # if object is a connection
         rowtypes.insert(ROW_IS_CONN_CONNECTED, bool)  # if conn is connected
         rowtypes.insert(ROW_IS_VM, bool)  # if row is VM
         rowtypes.insert(ROW_IS_VM_RUNNING, bool)  # if VM is running
-        rowtypes.insert(ROW_COLOR, str)  # row markup color string
-        rowtypes.insert(ROW_INSPECTION_OS_ICON, GdkPixbuf.Pixbuf)  # OS icon
+        rowtypes.insert(ROW_SORT_GUEST_CPU, float)  # stats column sort keys
+        rowtypes.insert(ROW_SORT_HOST_CPU, float)
+        rowtypes.insert(ROW_SORT_DISK, float)
+        rowtypes.insert(ROW_SORT_NETWORK, float)
 
         model = Gtk.TreeStore(*rowtypes)
         vmlist.set_model(model)
-        vmlist.set_tooltip_column(ROW_HINT)
+        vmlist.set_has_tooltip(True)
+        vmlist.connect("query-tooltip", self.vmlist_query_tooltip)
+        vmlist.connect("test-expand-row", self.vmlist_test_expand_row)
+        vmlist.connect("row-collapsed", self.vmlist_row_collapsed)
         vmlist.set_headers_visible(True)
         vmlist.set_level_indentation(
                 -(_style_get_prop(vmlist, "expander-size") + 3))
@@ -416,26 +429,25 @@ class vmmManager(vmmGObjectUI):
         status_icon = Gtk.CellRendererPixbuf()
         status_icon.set_property("stock-size", Gtk.IconSize.DND)
         nameCol.pack_start(status_icon, False)
-        nameCol.add_attribute(status_icon, 'icon-name', ROW_STATUS_ICON)
+        nameCol.set_cell_data_func(status_icon, self.status_icon_data, None)
         nameCol.add_attribute(status_icon, 'visible', ROW_IS_VM)
 
         inspection_os_icon = Gtk.CellRendererPixbuf()
         nameCol.pack_start(inspection_os_icon, False)
-        nameCol.add_attribute(inspection_os_icon, 'pixbuf',
-                                ROW_INSPECTION_OS_ICON)
+        nameCol.set_cell_data_func(inspection_os_icon,
+                                   self.inspection_os_icon_data, None)
         nameCol.add_attribute(inspection_os_icon, 'visible', ROW_IS_VM)
 
         name_txt = Gtk.CellRendererText()
         nameCol.pack_start(name_txt, True)
-        nameCol.add_attribute(name_txt, 'markup', ROW_MARKUP)
-        nameCol.add_attribute(name_txt, 'foreground', ROW_COLOR)
+        nameCol.set_cell_data_func(name_txt, self.name_markup_data, None)
 
         self.spacer_txt = Gtk.CellRendererText()
         self.spacer_txt.set_property("ypad", 4)
         self.spacer_txt.set_property("visible", False)
         nameCol.pack_end(self.spacer_txt, False)
 
-        def make_stats_column(title, colnum):
+        def make_stats_column(title, sortcol):
             col = Gtk.TreeViewColumn(title)
             col.set_min_width(140)
 
@@ -451,21 +463,21 @@ class vmmManager(vmmGObjectUI):
             col.pack_start(img, True)
             col.add_attribute(img, 'visible', ROW_IS_VM)
 
-            col.set_sort_column_id(colnum)
+            # Sorted natively by the model, on keys stored once per tick
+            col.set_sort_column_id(sortcol)
             vmlist.append_column(col)
             return col
 
-        self.guestcpucol = make_stats_column(_("CPU usage"), COL_GUEST_CPU)
-        self.hostcpucol = make_stats_column(_("Host CPU usage"), COL_HOST_CPU)
-        self.diskcol = make_stats_column(_("Disk I/O"), COL_DISK)
-        self.netcol = make_stats_column(_("Network I/O"), COL_NETWORK)
+        self.guestcpucol = make_stats_column(_("CPU usage"),
+                                             ROW_SORT_GUEST_CPU)
+        self.hostcpucol = make_stats_column(_("Host CPU usage"),
+                                            ROW_SORT_HOST_CPU)
+        self.diskcol = make_stats_column(_("Disk I/O"), ROW_SORT_DISK)
+        self.netcol = make_stats_column(_("Network I/O"), ROW_SORT_NETWORK)
 
         model.set_sort_func(COL_NAME, self.vmlist_name_sorter)
-        model.set_sort_func(COL_GUEST_CPU, self.vmlist_guest_cpu_usage_sorter)
-        model.set_sort_func(COL_HOST_CPU, self.vmlist_host_cpu_usage_sorter)
-        model.set_sort_func(COL_DISK, self.vmlist_disk_io_sorter)
-        model.set_sort_func(COL_NETWORK, self.vmlist_network_usage_sorter)
         model.set_sort_column_id(COL_NAME, Gtk.SortType.ASCENDING)
+        model.connect("sort-column-changed", self.vmlist_sort_column_changed)
 
     ##################
     # Helper methods #
@@ -698,14 +710,16 @@ class vmmManager(vmmGObjectUI):
     def vm_removed(self, conn, vmuuid):
         vmlist = self.widget("vm-list")
         model = vmlist.get_model()
+        uri = conn.get_uri()
 
-        parent = self.rows[conn.get_uri()].iter
-        for row in range(model.iter_n_children(parent)):
-            vm = model.get_value(model.iter_nth_child(parent, row), ROW_HANDLE)
-            if vm.get_uuid() == vmuuid:
-                model.remove(model.iter_nth_child(parent, row))
-                del self.rows[self.vm_row_key(vm)]
-                break
+        row_key = vmuuid + ":" + uri
+        row = self.rows.pop(row_key, None)
+        self._pending_vms.pop(row_key, None)
+        if row is not None:
+            model.remove(row.iter)
+        elif uri not in self._populated_conns and not conn.vms:
+            # Drop the placeholder
+            self._remove_conn_children(uri)
 
     def _build_conn_hint(self, conn):
         hint = conn.get_uri()
@@ -737,37 +751,30 @@ class vmmManager(vmmGObjectUI):
         return domtext + "\n" + statetext
 
     def _build_row(self, conn, vm):
+        obj = conn or vm
         if conn:
             name = conn.get_pretty_desc_inactive(False)
-            markup = self._build_conn_markup(conn, name)
-            status = ("<span size='smaller'>%s</span>" %
-                      conn.get_state_text())
-            status_icon = None
-            hint = self._build_conn_hint(conn)
-            color = self._build_conn_color(conn)
-            os_icon = None
-        else:
+        elif vm:
             name = vm.get_name()
-            status = vm.run_status()
-            markup = self._build_vm_markup(name, status)
-            status_icon = vm.run_status_icon_name()
-            hint = vm.get_description()
-            color = None
-            os_icon = _get_inspection_icon_pixbuf(vm, 16, 16)
+        else:
+            # Placeholder row of a collapsed connection
+            name = ""
 
         row = []
-        row.insert(ROW_HANDLE, conn or vm)
+        row.insert(ROW_HANDLE, obj)
         row.insert(ROW_SORT_KEY, name)
-        row.insert(ROW_MARKUP, markup)
-        row.insert(ROW_STATUS_ICON, status_icon)
-        row.insert(ROW_HINT, util.xml_escape(hint))
         row.insert(ROW_IS_CONN, bool(conn))
         row.insert(ROW_IS_CONN_CONNECTED,
                    bool(conn) and conn.state != conn.STATE_DISCONNECTED)
         row.insert(ROW_IS_VM, bool(vm))
         row.insert(ROW_IS_VM_RUNNING, bool(vm) and vm.is_active())
-        row.insert(ROW_COLOR, color)
-        row.insert(ROW_INSPECTION_OS_ICON, os_icon)
+        row.insert(ROW_SORT_GUEST_CPU,
+                   obj and obj.guest_cpu_time_percentage() or 0.0)
+        row.insert(ROW_SORT_HOST_CPU,
+                   obj and obj.host_cpu_time_percentage() or 0.0)
+        row.insert(ROW_SORT_DISK, obj and obj.disk_io_rate() or 0.0)
+        row.insert(ROW_SORT_NETWORK,
+                   obj and obj.network_traffic_rate() or 0.0)
 
         return row
 
@@ -776,15 +783,68 @@ class vmmManager(vmmGObjectUI):
         if row_key in self.rows:
             return
 
-        row = self._build_row(None, vm)
-        parent = self.rows[conn.get_uri()].iter
+        uri = conn.get_uri()
+        if uri in self._populated_conns:
+            # Added together with the other rows queued meanwhile
+            self._pending_vms[row_key] = vm
+            self._queue_row_update(uri)
+            return
+
+        parent = self.rows[uri].iter
+        if not model.iter_has_child(parent):
+            model.append(parent, self._build_row(None, None))
+
+        # Expand a connection when adding a vm to it, unless the user
+        # collapsed it. That builds all its VM rows.
+        if uri not in self._collapsed_conns:
+            self.widget("vm-list").expand_row(model.get_path(parent), False)
+
+    def _append_vm_rows(self, model, uri, vms):
+        """
+        Add rows for the passed VMs of a connection, with sorting
+        suspended so the model is only resorted once
+        """
+        parent = self.rows[uri].iter
+        sortcol, order = model.get_sort_column_id()
 
-        _iter = model.append(parent, row)
-        path = model.get_path(_iter)
-        self.rows[row_key] = model[path]
+        # _build_row fills in the sort keys of the new rows
+        self._sort_suspended = True
+        model.set_sort_column_id(
+            Gtk.TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID, order)
+        try:
+            for vm in vms:
+                row_key = self.vm_row_key(vm)
+                if row_key in self.rows:
+                    continue
+                _iter = model.append(parent, self._build_row(None, vm))
+                self.rows[row_key] = model[model.get_path(_iter)]
+        finally:
+            model.set_sort_column_id(sortcol, order)
+            self._sort_suspended = False
+
+    def _populate_conn_rows(self, uri):
+        model = self.widget("vm-list").get_model()
+        conn = self.rows[uri][ROW_HANDLE]
+
+        self._remove_conn_children(uri)
+        self._populated_conns.add(uri)
+        self._append_vm_rows(model, uri, conn.vms.values())
+
+    def _remove_conn_children(self, uri):
+        """
+        Remove all VM rows (or the placeholder) of a connection
+        """
+        model = self.widget("vm-list").get_model()
+        parent = self.rows[uri].iter
+        self._populated_conns.discard(uri)
 
-        # Expand a connection when adding a vm to it
-        self.widget("vm-list").expand_row(model.get_path(parent), False)
+        child = model.iter_children(parent)
+        while child is not None:
+            vm = model.get_value(child, ROW_HANDLE)
+            if vm is not None:
+                self.rows.pop(self.vm_row_key(vm), None)
+            model.remove(child)
+            child = model.iter_children(parent)
 
     def _append_conn(self, model, conn):
         row = self._build_row(conn, None)
@@ -836,66 +896,126 @@ class vmmManager(vmmGObjectUI):
         if parent is None:
             return
 
-        child = model.iter_children(parent)
-        while child is not None:
-            del self.rows[self.vm_row_key(model.get_value(child, ROW_HANDLE))]
-            model.remove(child)
-            child = model.iter_children(parent)
+        self._remove_conn_children(uri)
         model.remove(parent)
 
         del self.rows[uri]
+        self._collapsed_conns.discard(uri)
 
 
     #############################
     # State/UI updating methods #
     #############################
 
-    def vm_row_updated(self, vm):
-        row = self.rows.get(self.vm_row_key(vm), None)
-        if row is None:
+    def _queue_row_update(self, row_key, update=None):
+        """
+        Mark a row as needing a redraw, and optionally a ROW_UPDATE_*
+        content refresh. All rows queued while handling one batch of
+        signals (like a connection tick) are updated together from a
+        single idle callback.
+        """
+        if self.rows is None or row_key not in self.rows:
             return
-        self.widget("vm-list").get_model().row_changed(row.path, row.iter)
 
-    def vm_config_changed(self, vm):
-        row = self.rows.get(self.vm_row_key(vm), None)
-        if row is None:
+        self._pending_rows[row_key] = (self._pending_rows.get(row_key, 0) |
+                                       (update or 0))
+
+        if not self._pending_rows_queued:
+            self._pending_rows_queued = True
+            self.idle_add(self._flush_row_updates)
+
+    def _get_visible_range(self):
+        vmlist = self.widget("vm-list")
+        ret = vmlist.get_visible_range()
+        if ret and len(ret) == 3:
+            # Older pygobject doesn't strip the return code
+            ret = ret[0] and ret[1:] or None
+        return ret
+
+    def _row_is_visible(self, row, visible_range):
+        if not visible_range:
+            return False
+
+        path = row.path
+        start, end = visible_range
+        if path.compare(start) < 0 or path.compare(end) > 0:
+            return False
+
+        if path.get_depth() > 1:
+            parent = path.copy()
+            parent.up()
+            return self.widget("vm-list").row_expanded(parent)
+        return True
+
+    def _flush_row_updates(self):
+        self._pending_rows_queued = False
+        if self.rows is None:
             return
 
-        try:
-            name = vm.get_name()
-            status = vm.run_status()
+        pending = self._pending_rows
+        self._pending_rows = {}
 
-            row[ROW_SORT_KEY] = name
-            row[ROW_STATUS_ICON] = vm.run_status_icon_name()
-            row[ROW_IS_VM_RUNNING] = vm.is_active()
-            row[ROW_MARKUP] = self._build_vm_markup(name, status)
+        model = self.widget("vm-list").get_model()
+
+        newvms = {}
+        for vm in self._pending_vms.values():
+            uri = vm.conn.get_uri()
+            if uri in self._populated_conns:
+                newvms.setdefault(uri, []).append(vm)
+        self._pending_vms = {}
+        for uri, vms in newvms.items():
+            self._append_vm_rows(model, uri, vms)
+
+        # A config change (start, stop, rename) alters a VM's stats
+        # independent of its connection's next sample
+        sortrows = [self.rows[key] for key, updates in pending.items()
+                    if key in self.rows and
+                    updates & (ROW_UPDATE_SORT_KEYS | ROW_UPDATE_CONFIG)]
+        if sortrows and self._stats_sort_active():
+            self._update_sort_keys(sortrows)
+
+        visible_range = self._get_visible_range()
+        for row_key, updates in pending.items():
+            row = self.rows.get(row_key, None)
+            if row is None:
+                continue
 
-            desc = vm.get_description()
-            if not uihelpers.can_set_row_none:
-                desc = desc or ""
-            row[ROW_HINT] = util.xml_escape(desc)
+            if updates & ROW_UPDATE_CONFIG:
+                self._update_vm_row_config(row)
+
+            # Rows outside of the view are redrawn from scratch
+            # when they are scrolled back in
+            if self._row_is_visible(row, visible_range):
+                model.row_changed(row.path, row.iter)
+
+    def _set_row_value(self, row, col, value):
+        # Every set emits row-changed, so skip unchanged values
+        if row[col] != value:
+            row[col] = value
+
+    def _update_vm_row_config(self, row):
+        vm = row[ROW_HANDLE]
+        try:
+            self._set_row_value(row, ROW_SORT_KEY, vm.get_name())
+            self._set_row_value(row, ROW_IS_VM_RUNNING, vm.is_active())
         except libvirt.libvirtError, e:
             if uihelpers.exception_is_libvirt_error(e, "VIR_ERR_NO_DOMAIN"):
                 return
             raise
 
-        self.vm_row_updated(vm)
+    def vm_row_updated(self, vm):
+        self._queue_row_update(self.vm_row_key(vm))
+
+    def vm_config_changed(self, vm):
+        self._queue_row_update(self.vm_row_key(vm), ROW_UPDATE_CONFIG)
 
     def vm_status_changed(self, vm, oldstatus, newstatus):
         ignore = newstatus
         ignore = oldstatus
-        parent = self.rows[vm.conn.get_uri()].iter
         vmlist = self.widget("vm-list")
         model = vmlist.get_model()
 
-        missing = True
-        for row in range(model.iter_n_children(parent)):
-            _iter = model.iter_nth_child(parent, row)
-            if model.get_value(_iter, ROW_HANDLE) == vm:
-                missing = False
-                break
-
-        if missing:
+        if self.vm_row_key(vm) not in self.rows:
             self._append_vm(model, vm, vm.conn)
 
         # Update run/shutdown/pause button states
@@ -903,50 +1023,30 @@ class vmmManager(vmmGObjectUI):
         self.vm_config_changed(vm)
 
     def vm_inspection_changed(self, vm):
-        row = self.rows.get(self.vm_row_key(vm), None)
-        if row is None:
-            return
-
-        new_icon = _get_inspection_icon_pixbuf(vm, 16, 16)
-        if not uihelpers.can_set_row_none:
-            new_icon = new_icon or ""
-        row[ROW_INSPECTION_OS_ICON] = new_icon
-
-        self.vm_row_updated(vm)
+        self._queue_row_update(self.vm_row_key(vm))
 
     def conn_state_changed(self, conn, newname=None):
         row = self.rows[conn.get_uri()]
         if newname:
             row[ROW_SORT_KEY] = newname
-        row[ROW_MARKUP] = self._build_conn_markup(conn, row[ROW_SORT_KEY])
-        row[ROW_IS_CONN_CONNECTED] = conn.state != conn.STATE_DISCONNECTED
-        row[ROW_COLOR] = self._build_conn_color(conn)
-        row[ROW_HINT] = self._build_conn_hint(conn)
+        self._set_row_value(row, ROW_IS_CONN_CONNECTED,
+                            conn.state != conn.STATE_DISCONNECTED)
 
         if conn.get_state() in [vmmConnection.STATE_DISCONNECTED,
                                 vmmConnection.STATE_CONNECTING]:
             # Connection went inactive, delete any VM child nodes
-            parent = row.iter
-            if parent is not None:
-                model = self.widget("vm-list").get_model()
-                child = model.iter_children(parent)
-                while child is not None:
-                    vm = model[child][ROW_HANDLE]
-                    del self.rows[self.vm_row_key(vm)]
-                    model.remove(child)
-                    child = model.iter_children(parent)
+            if row.iter is not None:
+                self._remove_conn_children(conn.get_uri())
 
         self.conn_row_updated(conn)
         self.update_current_selection()
 
     def conn_row_updated(self, conn):
-        row = self.rows[conn.get_uri()]
-
         self.max_disk_rate = max(self.max_disk_rate, conn.disk_io_max_rate())
         self.max_net_rate = max(self.max_net_rate,
                                 conn.network_traffic_max_rate())
 
-        self.widget("vm-list").get_model().row_changed(row.path, row.iter)
+        self._queue_row_update(conn.get_uri(), ROW_UPDATE_SORT_KEYS)
 
     def change_run_text(self, can_restore):
         if can_restore:
@@ -1049,6 +1149,89 @@ class vmmManager(vmmGObjectUI):
             self.connmenu.popup(None, None, None, None, 0, event.time)
 
 
+    def vmlist_test_expand_row(self, vmlist, _iter, path_ignore):
+        model = vmlist.get_model()
+        if not model.get_value(_iter, ROW_IS_CONN):
+            return False
+
+        uri = model.get_value(_iter, ROW_HANDLE).get_uri()
+        self._collapsed_conns.discard(uri)
+        if uri not in self._populated_conns:
+            self._populate_conn_rows(uri)
+        return False
+
+    def vmlist_row_collapsed(self, vmlist, _iter, path_ignore):
+        model = vmlist.get_model()
+        if not model.get_value(_iter, ROW_IS_CONN):
+            return
+
+        # Drop the VM rows, they are rebuilt when expanding again
+        conn = model.get_value(_iter, ROW_HANDLE)
+        uri = conn.get_uri()
+        self._collapsed_conns.add(uri)
+        self._remove_conn_children(uri)
+        if conn.vms:
+            model.append(_iter, self._build_row(None, None))
+
+    def vmlist_query_tooltip(self, vmlist, x, y, keyboard_mode, tooltip):
+        ret = vmlist.get_tooltip_context(x, y, keyboard_mode)
+        if len(ret) == 6:
+            # Newer pygobject prepends the return code
+            if not ret[0]:
+                return False
+            ret = ret[1:]
+
+        model, path, _iter = ret[2:]
+        if _iter is None:
+            return False
+
+        obj = model.get_value(_iter, ROW_HANDLE)
+        if obj is None:
+            return False
+        if model.get_value(_iter, ROW_IS_CONN):
+            hint = self._build_conn_hint(obj)
+        else:
+            hint = obj.get_description()
+        if not hint:
+            return False
+
+        tooltip.set_text(hint)
+        vmlist.set_tooltip_row(tooltip, path)
+        return True
+
+    def status_icon_data(self, column_ignore, cell, model, _iter, data):
+        if not model.get_value(_iter, ROW_IS_VM):
+            return
+
+        vm = model.get_value(_iter, ROW_HANDLE)
+        cell.set_property("icon-name", vm.run_status_icon_name())
+
+    def inspection_os_icon_data(self, column_ignore, cell, model, _iter,
+                                data):
+        icon = None
+        if model.get_value(_iter, ROW_IS_VM):
+            vm = model.get_value(_iter, ROW_HANDLE)
+            icon = uihelpers.get_inspection_icon_pixbuf(vm, 16, 16)
+        cell.set_property("pixbuf", icon)
+
+    def name_markup_data(self, column_ignore, cell, model, _iter, data):
+        obj = model.get_value(_iter, ROW_HANDLE)
+        markup = ""
+        color = None
+
+        if obj is None:
+            pass
+        elif model.get_value(_iter, ROW_IS_CONN):
+            markup = self._build_conn_markup(obj,
+                                    model.get_value(_iter, ROW_SORT_KEY))
+            color = self._build_conn_color(obj)
+        else:
+            markup = self._build_vm_markup(obj.get_name(), obj.run_status())
+
+        cell.set_property("markup", markup)
+        cell.set_property("foreground", color)
+
+
     #################
     # Stats methods #
     #################
@@ -1057,31 +1240,52 @@ class vmmManager(vmmGObjectUI):
         return cmp(model.get_value(iter1, ROW_SORT_KEY),
                    model.get_value(iter2, ROW_SORT_KEY))
 
-    def vmlist_guest_cpu_usage_sorter(self, model, iter1, iter2, ignore):
-        obj1 = model.get_value(iter1, ROW_HANDLE)
-        obj2 = model.get_value(iter2, ROW_HANDLE)
-
-        return cmp(obj1.guest_cpu_time_percentage(),
-                   obj2.guest_cpu_time_percentage())
-
-    def vmlist_host_cpu_usage_sorter(self, model, iter1, iter2, ignore):
-        obj1 = model.get_value(iter1, ROW_HANDLE)
-        obj2 = model.get_value(iter2, ROW_HANDLE)
-
-        return cmp(obj1.host_cpu_time_percentage(),
-                   obj2.host_cpu_time_percentage())
-
-    def vmlist_disk_io_sorter(self, model, iter1, iter2, ignore):
-        obj1 = model.get_value(iter1, ROW_HANDLE)
-        obj2 = model.get_value(iter2, ROW_HANDLE)
-
-        return cmp(obj1.disk_io_rate(), obj2.disk_io_rate())
+    def _stats_sort_active(self):
+        model = self.widget("vm-list").get_model()
+        return model.get_sort_column_id()[0] in STATS_SORT_COLUMNS
+
+    def _set_sort_keys(self, row):
+        obj = row[ROW_HANDLE]
+        self._set_row_value(row, ROW_SORT_GUEST_CPU,
+                            obj.guest_cpu_time_percentage())
+        self._set_row_value(row, ROW_SORT_HOST_CPU,
+                            obj.host_cpu_time_percentage())
+        self._set_row_value(row, ROW_SORT_DISK, obj.disk_io_rate())
+        self._set_row_value(row, ROW_SORT_NETWORK,
+                            obj.network_traffic_rate())
+
+    def _update_sort_keys(self, rows):
+        """
+        Store the current stats of the passed rows, and of the VM rows
+        of any connection row among them, as sort keys. Sorting is
+        suspended meanwhile, so the model is resorted once rather than
+        for every changed key.
+        """
+        model = self.widget("vm-list").get_model()
+        sortcol, order = model.get_sort_column_id()
 
-    def vmlist_network_usage_sorter(self, model, iter1, iter2, ignore):
-        obj1 = model.get_value(iter1, ROW_HANDLE)
-        obj2 = model.get_value(iter2, ROW_HANDLE)
+        self._sort_suspended = True
+        model.set_sort_column_id(
+            Gtk.TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID, order)
+        try:
+            for row in rows:
+                self._set_sort_keys(row)
+                if not row[ROW_IS_CONN]:
+                    continue
+                for child in row.iterchildren():
+                    if child[ROW_HANDLE] is not None:
+                        self._set_sort_keys(child)
+        finally:
+            model.set_sort_column_id(sortcol, order)
+            self._sort_suspended = False
 
-        return cmp(obj1.network_traffic_rate(), obj2.network_traffic_rate())
+    def vmlist_sort_column_changed(self, model):
+        # Sort keys are only maintained while sorting on stats,
+        # so bring them up to date when switching to a stats column
+        if self._sort_suspended or not self._stats_sort_active():
+            return
+        self._update_sort_keys([row for row in self.rows.values()
+                                if row[ROW_IS_CONN]])
 
     def enable_polling(self, column):
         if column == COL_DISK:
@@ -1168,6 +1372,7 @@ class vmmManager(vmmGObjectUI):
 
         data = obj.guest_cpu_time_vector_limit(GRAPH_LEN)
         cell.set_property('data_array', data)
+        cell.set_property('data_key', obj)
 
     def host_cpu_usage_img(self, column_ignore, cell, model, _iter, data):
         obj = model[_iter][ROW_HANDLE]
@@ -1176,6 +1381,7 @@ class vmmManager(vmmGObjectUI):
 
         data = obj.host_cpu_time_vector_limit(GRAPH_LEN)
         cell.set_property('data_array', data)
+        cell.set_property('data_key', obj)
 
     def disk_io_img(self, column_ignore, cell, model, _iter, data):
         obj = model[_iter][ROW_HANDLE]
@@ -1184,6 +1390,7 @@ class vmmManager(vmmGObjectUI):
 
         data = obj.disk_io_vector_limit(GRAPH_LEN, self.max_disk_rate)
         cell.set_property('data_array', data)
+        cell.set_property('data_key', obj)
 
     def network_traffic_img(self, column_ignore, cell, model, _iter, data):
         obj = model[_iter][ROW_HANDLE]
@@ -1192,3 +1399,4 @@ class vmmManager(vmmGObjectUI):
 
         data = obj.network_traffic_vector_limit(GRAPH_LEN, self.max_net_rate)
         cell.set_property('data_array', data)
+        cell.set_property('data_key', obj)
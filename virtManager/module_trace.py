@@ -42,38 +42,42 @@ def generate_wrapper(origfunc, name, do_tb):
     return newfunc
 
 
-def wrap_func(module, funcobj, tb):
+def wrap_func(module, funcobj, tb, wrapgen=generate_wrapper):
     name = funcobj.__name__
     logging.debug("wrapfunc %s %s", funcobj, name)
 
-    newfunc = generate_wrapper(funcobj, name, tb)
+    newfunc = wrapgen(funcobj, name, tb)
     setattr(module, name, newfunc)
 
 
-def wrap_method(classobj, methodobj, tb):
+def wrap_method(classobj, methodobj, tb, wrapgen=generate_wrapper):
     name = methodobj.__name__
     fullname = classobj.__name__ + "." + name
     logging.debug("wrapmeth %s", fullname)
 
-    newfunc = generate_wrapper(methodobj, fullname, tb)
+    newfunc = wrapgen(methodobj, fullname, tb)
     setattr(classobj, name, newfunc)
 
 
-def wrap_class(classobj, tb):
+def wrap_class(classobj, tb, wrapgen=generate_wrapper):
     logging.debug("wrapclas %s %s", classobj, classobj.__name__)
 
     for name in dir(classobj):
         obj = getattr(classobj, name)
         if type(obj) is MethodType:
-            wrap_method(classobj, obj, tb)
+            wrap_method(classobj, obj, tb, wrapgen)
 
 
-def wrap_module(module, regex=None, tb=False):
+def wrap_module(module, regex=None, tb=False, wrapgen=generate_wrapper):
+    """
+    @param wrapgen: Function building the wrapper, called with
+        (origfunc, name, tb). Defaults to logging every call
+    """
     for name in dir(module):
         if regex and not re.match(regex, name):
             continue
         obj = getattr(module, name)
         if type(obj) is FunctionType:
-            wrap_func(module, obj, tb)
+            wrap_func(module, obj, tb, wrapgen)
         if type(obj) is ClassType or type(obj) is type:
-            wrap_class(obj, tb)
+            wrap_class(obj, tb, wrapgen)
@@ -19,9 +19,6 @@
 #
 
 import ipaddr
-import libxml2
-
-from virtinst import util
 
 from virtManager.libvirtobject import vmmLibvirtObject
 
@@ -130,13 +127,11 @@ class vmmNetwork(vmmLibvirtObject):
     ########################
 
     def get_ipv4_static_route(self):
-        doc = None
         ret = None
         routeAddr = None
         routeVia = None
-        xml = self.get_xml()
-        doc = libxml2.parseDoc(xml)
-        nodes = doc.xpathEval('//route')
+        parsed = self._get_parsed_xml()
+        nodes = parsed.xpath_eval('//route')
         for node in nodes:
             family = node.xpathEval('string(./@family)')
             if not family or family == 'ipv4':
@@ -156,8 +151,6 @@ class vmmNetwork(vmmLibvirtObject):
                 routeVia = str(ipaddr.IPAddress(str(gatewayStr)))
                 break
 
-        if doc:
-            doc.freeDoc()
         if routeAddr and routeVia:
             ret = [routeAddr, routeVia]
         else:
@@ -165,14 +158,12 @@ class vmmNetwork(vmmLibvirtObject):
         return ret
 
     def get_ipv4_network(self):
-        doc = None
         ret = None
         goodNode = None
         dhcpstart = None
         dhcpend = None
-        xml = self.get_xml()
-        doc = libxml2.parseDoc(xml)
-        nodes = doc.xpathEval('//ip')
+        parsed = self._get_parsed_xml()
+        nodes = parsed.xpath_eval('//ip')
         for node in nodes:
             family = node.xpathEval('string(./@family)')
             if not family or family == 'ipv4':
@@ -203,8 +194,6 @@ class vmmNetwork(vmmLibvirtObject):
                 ret = str(ipaddr.IPNetwork(str(network) + "/" + str(netmask)).masked())
             else:
                 ret = str(ipaddr.IPNetwork(str(addrStr)))
-        if doc:
-            doc.freeDoc()
         if dhcpstart and dhcpend:
             dhcp = [str(ipaddr.IPAddress(dhcpstart)), str(ipaddr.IPAddress(dhcpend))]
         else:
@@ -213,13 +202,11 @@ class vmmNetwork(vmmLibvirtObject):
         return [ret, dhcp, route]
 
     def get_ipv6_static_route(self):
-        doc = None
         ret = None
         routeAddr = None
         routeVia = None
-        xml = self.get_xml()
-        doc = libxml2.parseDoc(xml)
-        nodes = doc.xpathEval('//route')
+        parsed = self._get_parsed_xml()
+        nodes = parsed.xpath_eval('//route')
         for node in nodes:
             family = node.xpathEval('string(./@family)')
             if family and family == 'ipv6':
@@ -234,8 +221,6 @@ class vmmNetwork(vmmLibvirtObject):
                 routeVia = str(ipaddr.IPAddress(str(gatewayStr)))
                 break
 
-        if doc:
-            doc.freeDoc()
         if routeAddr and routeVia:
             ret = [routeAddr, routeVia]
         else:
@@ -243,14 +228,12 @@ class vmmNetwork(vmmLibvirtObject):
         return ret
 
     def get_ipv6_network(self):
-        doc = None
         ret = None
         goodNode = None
         dhcpstart = None
         dhcpend = None
-        xml = self.get_xml()
-        doc = libxml2.parseDoc(xml)
-        nodes = doc.xpathEval('//ip')
+        parsed = self._get_parsed_xml()
+        nodes = parsed.xpath_eval('//ip')
         for node in nodes:
             family = node.xpathEval('string(./@family)')
             if family and family == 'ipv6':
@@ -276,8 +259,6 @@ class vmmNetwork(vmmLibvirtObject):
                 ret = str(ipaddr.IPNetwork(str(addrStr) + "/" + str(prefix)).masked())
             else:
                 ret = str(ipaddr.IPNetwork(str(addrStr)))
-        if doc:
-            doc.freeDoc()
         if dhcpstart and dhcpend:
             dhcp = [str(ipaddr.IPAddress(dhcpstart)), str(ipaddr.IPAddress(dhcpend))]
         else:
@@ -286,19 +267,16 @@ class vmmNetwork(vmmLibvirtObject):
         return [ret, dhcp, route]
 
     def get_name_domain(self):
-        xml = self.get_xml()
-        name_domain = util.xpath(xml, "/network/domain/@name")
+        name_domain = self._xpath("/network/domain/@name")
         return name_domain
 
     def get_ipv6_routing(self):
-        xml = self.get_xml()
-        ipv6_routing = util.xpath(xml, "/network/@ipv6")
+        ipv6_routing = self._xpath("/network/@ipv6")
         return ipv6_routing
 
     def get_ipv4_forward(self):
-        xml = self.get_xml()
-        fw = util.xpath(xml, "/network/forward/@mode")
-        forwardDev = util.xpath(xml, "/network/forward/@dev")
+        fw = self._xpath("/network/forward/@mode")
+        forwardDev = self._xpath("/network/forward/@dev")
         return [fw, forwardDev]
 
     def pretty_forward_mode(self):
@@ -306,8 +284,7 @@ class vmmNetwork(vmmLibvirtObject):
         return vmmNetwork.pretty_desc(forward, forwardDev)
 
     def can_pxe(self):
-        xml = self.get_xml()
         forward = self.get_ipv4_forward()[0]
         if forward and forward != "nat":
             return True
-        return bool(util.xpath(xml, "/network/ip/dhcp/bootp/@file"))
+        return bool(self._xpath("/network/ip/dhcp/bootp/@file"))
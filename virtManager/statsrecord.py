@@ -0,0 +1,208 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+import array
+
+
+class vmmStatsVector(object):
+    """
+    Read only view of 'length' values of one or more stats record
+    columns, starting at index 'start', with every value divided by
+    'scale'. Nothing is copied: values are read from the columns when
+    indexed. Multiple columns are concatenated, or with average=True
+    averaged element wise.
+
+    Appending to the record doesn't move existing samples, so a view
+    keeps returning the samples it was created for. Only a view of a
+    full capacity slice sees its oldest value replaced.
+    """
+    __slots__ = ["_columns", "_start", "_length", "_scale", "_average",
+                 "_version"]
+
+    def __init__(self, columns, start, length, scale=1.0, average=False,
+                 version=None):
+        self._columns = columns
+        self._start = start
+        self._length = length
+        self._scale = float(scale)
+        self._average = average
+        self._version = version
+
+    def get_data_version(self):
+        """
+        Return a value that only changes when the values of the view
+        may have, for caching anything computed from them
+        """
+        return (self._version, self._start, self._length, self._scale,
+                self._average)
+
+    def __len__(self):
+        if self._average:
+            return self._length
+        return self._length * len(self._columns)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("stats vector index out of range")
+
+        if self._average:
+            total = 0.0
+            for column in self._columns:
+                total += column[self._start + idx]
+            return total / len(self._columns) / self._scale
+
+        col, idx = divmod(idx, self._length)
+        return self._columns[col][self._start + idx] / self._scale
+
+    def __iter__(self):
+        for idx in xrange(len(self)):
+            yield self[idx]
+
+
+class vmmStatsRecord(object):
+    """
+    Fixed capacity stats history, newest sample first. Each metric is
+    kept in its own array of doubles used as a ring buffer, so adding a
+    sample doesn't allocate anything.
+
+    Every value is written twice, at idx and idx + capacity, and the
+    ring is filled backwards. That way the newest N samples of a metric
+    are always a contiguous, newest first slice of its array, with
+    never written slots reading as 0. The vector functions return
+    vmmStatsVector views of those slices.
+    """
+    def __init__(self, fields, capacity, percent_fields=None):
+        """
+        @param fields: List of metric names
+        @param capacity: Number of samples to keep
+        @param percent_fields: Metrics reported in percent, which we
+            also keep as 0.0 - 1.0 fractions for graphing
+        """
+        self._capacity = capacity
+        self._percent_fields = percent_fields or []
+        self._columns = {}
+        self._fractions = {}
+        self._head = 0
+        self._len = 0
+        # Bumped whenever any value changes
+        self.version = 0
+
+        for name in fields:
+            self._columns[name] = self._new_column()
+        for name in self._percent_fields:
+            self._fractions[name] = self._new_column()
+
+    def _new_column(self):
+        return array.array("d", [0.0]) * (self._capacity * 2)
+
+    def __len__(self):
+        return self._len
+
+    def clear(self):
+        for name in self._columns:
+            self._columns[name] = self._new_column()
+        for name in self._fractions:
+            self._fractions[name] = self._new_column()
+        self._head = 0
+        self._len = 0
+        self.version += 1
+
+    def _write(self, column, idx, value):
+        column[idx] = value
+        column[idx + self._capacity] = value
+
+    def append(self, sample):
+        """
+        Add a new sample. sample is a dict of metric name -> value,
+        missing metrics are stored as 0
+        """
+        self._head = (self._head - 1) % self._capacity
+        self._len = min(self._len + 1, self._capacity)
+        self.version += 1
+
+        for name, column in self._columns.items():
+            self._write(column, self._head, sample.get(name, 0))
+        for name, column in self._fractions.items():
+            self._write(column, self._head, sample.get(name, 0) / 100.0)
+
+    def _index(self, idx):
+        if idx >= self._len:
+            raise IndexError("stats record index out of range")
+        return self._head + idx
+
+    def get(self, name, idx=0):
+        """
+        Return metric 'name' of the idx'th newest sample
+        """
+        return self._columns[name][self._index(idx)]
+
+    def set(self, name, value, idx=0):
+        """
+        Overwrite metric 'name' of the idx'th newest sample
+        """
+        idx = self._index(idx) % self._capacity
+        self.version += 1
+        self._write(self._columns[name], idx, value)
+        if name in self._fractions:
+            self._write(self._fractions[name], idx, value / 100.0)
+
+    def _view(self, columns, length, scale=1.0, average=False):
+        if length is None:
+            length = self._capacity
+        length = min(length, self._capacity)
+        return vmmStatsVector(columns, self._head, length,
+                              scale=scale, average=average,
+                              version=self.version)
+
+    def vector(self, name, length=None):
+        """
+        Return a view of the newest 'length' values of metric 'name',
+        newest first and padded with 0 up to 'length'. Defaults to the
+        whole capacity.
+        """
+        return self._view([self._columns[name]], length)
+
+    def fraction_vector(self, name, length=None):
+        """
+        Like vector(), but for a percent metric scaled to 0.0 - 1.0
+        """
+        return self._view([self._fractions[name]], length)
+
+    def in_out_vector(self, name1, name2, scale, length=None,
+                      average=False):
+        """
+        Return a view of the vectors of two metrics divided by scale,
+        one after the other, or with average=True their element wise
+        mean
+        """
+        return self._view([self._columns[name1], self._columns[name2]],
+                          length, scale=scale, average=average)
+
+    def max_value(self, name):
+        """
+        Return the largest value of metric 'name' in the record
+        """
+        if not self._len:
+            return 0.0
+        return max(self._columns[name][self._head:self._head + self._len])
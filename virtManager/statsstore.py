@@ -0,0 +1,333 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+# On disk VM stats history, one file per connection.
+#
+# The file is a header followed by one fixed size slot per VM. A slot
+# has a small header (VM uuid, ring positions and rollup accumulators)
+# and one ring of fixed size records per resolution. A record is the
+# sample timestamp followed by one double per stats field. The file
+# is accessed through mmap, so appending a sample is a couple of
+# memory writes.
+#
+# Only one process writes to the file, the one holding the lock on
+# <path>.lock. Others map it read only and just show the history stored
+# by that process. The lock can't be taken on the file itself, as
+# closing an old mapping when the file grows would drop it.
+
+import errno
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+
+_MAGIC = "VMMSTAT1"
+_HEADER = struct.Struct("<8sII")
+_HEADER_SIZE = 64
+
+# Don't let the file grow unbounded if VMs come and go
+MAX_SLOTS = 256
+
+# (name, seconds averaged into one record (0 for every sample), records)
+RESOLUTIONS = [
+    ("raw", 0, 240),
+    ("minute", 60, 24 * 60),
+    ("hour", 60 * 60, 30 * 24),
+]
+
+
+class vmmStatsStore(object):
+    """
+    Memory mapped stats history file for the VMs of a single connection
+    """
+    def __init__(self, path, fields, known_uuids_cb=None):
+        """
+        @param path: Path of the history file, created if needed
+        @param fields: Stats field names to store besides 'timestamp'
+        @param known_uuids_cb: Function returning the UUIDs of all VMs
+            that still exist. Slots of other VMs are reused for new ones
+        """
+        self._path = path
+        self._fields = [f for f in fields if f != "timestamp"]
+        self._known_uuids_cb = known_uuids_cb
+        self._lock = threading.Lock()
+        self._full_logged = False
+        self._readonly = False
+
+        self._fd = None
+        self._lockfd = None
+        self._map = None
+        self._nslots = 0
+        # uuid -> slot offset in the file
+        self._slots = {}
+
+        nfields = len(self._fields)
+        self._uuid = struct.Struct("<40s")
+        self._state = struct.Struct("<dd")
+        self._acc = struct.Struct("<%dd" % (nfields + 2))
+        self._record = struct.Struct("<%dd" % (nfields + 1))
+
+        offset = self._uuid.size
+        self._state_offsets = []
+        self._acc_offsets = []
+        self._ring_offsets = []
+        for ignore in RESOLUTIONS:
+            self._state_offsets.append(offset)
+            offset += self._state.size
+        for ignore, period, ignore in RESOLUTIONS:
+            self._acc_offsets.append(period and offset or None)
+            if period:
+                offset += self._acc.size
+        for ignore, ignore, count in RESOLUTIONS:
+            self._ring_offsets.append(offset)
+            offset += count * self._record.size
+        self._slot_size = offset
+
+        self._open()
+
+    def _open(self):
+        dirname = os.path.dirname(self._path)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname, 0700)
+
+        self._lockfd = os.open(self._path + ".lock",
+                               os.O_RDWR | os.O_CREAT, 0600)
+        try:
+            fcntl.lockf(self._lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError, e:
+            if e.errno not in [errno.EACCES, errno.EAGAIN]:
+                raise
+            logging.debug("Stats history %s is in use by another process, "
+                          "opening it read only", self._path)
+            self._readonly = True
+
+        if self._readonly:
+            self._fd = os.open(self._path, os.O_RDONLY)
+        else:
+            self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0600)
+        size = os.fstat(self._fd).st_size
+
+        valid = False
+        if size >= _HEADER_SIZE:
+            magic, nfields, nslots = _HEADER.unpack(
+                os.read(self._fd, _HEADER.size))
+            valid = (magic == _MAGIC and
+                     nfields == len(self._fields) and
+                     size == _HEADER_SIZE + nslots * self._slot_size)
+
+        if not valid and self._readonly:
+            # Not ours to reset, the owner already rewrote it if needed
+            logging.debug("Stats history %s is invalid, ignoring it",
+                          self._path)
+            return
+
+        if not valid:
+            if size:
+                logging.debug("Stats history %s is invalid, resetting",
+                              self._path)
+            os.ftruncate(self._fd, 0)
+            os.ftruncate(self._fd, _HEADER_SIZE)
+            nslots = 0
+
+        self._map_file(nslots)
+        if not valid:
+            self._write_header()
+
+        for idx in range(self._nslots):
+            offset = _HEADER_SIZE + idx * self._slot_size
+            uuid = self._uuid.unpack_from(self._map, offset)[0]
+            self._slots[uuid.rstrip("\0")] = offset
+
+        logging.debug("Opened stats history %s with %d VMs",
+                      self._path, self._nslots)
+
+    def _map_file(self, nslots):
+        if self._map:
+            self._map.close()
+        self._nslots = nslots
+        access = self._readonly and mmap.ACCESS_READ or mmap.ACCESS_WRITE
+        self._map = mmap.mmap(self._fd,
+                              _HEADER_SIZE + nslots * self._slot_size,
+                              access=access)
+
+    def _write_header(self):
+        _HEADER.pack_into(self._map, 0,
+                          _MAGIC, len(self._fields), self._nslots)
+
+    def _reclaim_slot(self, uuid):
+        """
+        Hand the slot of a VM that doesn't exist anymore over to uuid,
+        wiping its history. Returns None if there isn't any such slot.
+        """
+        if not self._known_uuids_cb:
+            return None
+
+        known = self._known_uuids_cb()
+        for olduuid, offset in self._slots.items():
+            if olduuid in known:
+                continue
+
+            logging.debug("Reusing stats history slot of removed VM %s "
+                          "for %s", olduuid, uuid)
+            self._map[offset:offset + self._slot_size] = (
+                "\0" * self._slot_size)
+            self._uuid.pack_into(self._map, offset, uuid)
+            del(self._slots[olduuid])
+            self._slots[uuid] = offset
+            return offset
+        return None
+
+    def _get_slot(self, uuid):
+        if uuid in self._slots:
+            return self._slots[uuid]
+
+        offset = self._reclaim_slot(uuid)
+        if offset is not None:
+            return offset
+
+        if self._nslots >= MAX_SLOTS:
+            if not self._full_logged:
+                logging.debug("Stats history %s is full with %d VMs, not "
+                              "saving history of new VMs",
+                              self._path, MAX_SLOTS)
+                self._full_logged = True
+            return None
+
+        offset = _HEADER_SIZE + self._nslots * self._slot_size
+        os.ftruncate(self._fd, offset + self._slot_size)
+        self._map_file(self._nslots + 1)
+        self._uuid.pack_into(self._map, offset, uuid)
+        self._write_header()
+
+        self._slots[uuid] = offset
+        return offset
+
+    def _add_record(self, slot, residx, values):
+        count = RESOLUTIONS[residx][2]
+        stateoff = slot + self._state_offsets[residx]
+        head, used = self._state.unpack_from(self._map, stateoff)
+        head = int(head)
+
+        self._record.pack_into(self._map,
+            slot + self._ring_offsets[residx] + head * self._record.size,
+            *values)
+        self._state.pack_into(self._map, stateoff,
+                              (head + 1) % count, min(used + 1, count))
+
+    def _rollup(self, slot, residx, values):
+        period = RESOLUTIONS[residx][1]
+        accoff = slot + self._acc_offsets[residx]
+        acc = self._acc.unpack_from(self._map, accoff)
+        bucket = values[0] - (values[0] % period)
+
+        start, nsamples, sums = acc[0], acc[1], list(acc[2:])
+        if start != bucket:
+            if nsamples:
+                self._add_record(slot, residx,
+                                 [start] + [s / nsamples for s in sums])
+            start = bucket
+            nsamples = 0
+            sums = [0.0] * len(sums)
+
+        sums = [s + v for s, v in zip(sums, values[1:])]
+        self._acc.pack_into(self._map, accoff, start, nsamples + 1, *sums)
+
+
+    ##############
+    # Public API #
+    ##############
+
+    def get_capacity(self, resolution):
+        for name, ignore, count in RESOLUTIONS:
+            if name == resolution:
+                return count
+        raise ValueError("Unknown stats resolution '%s'" % resolution)
+
+    def append(self, uuid, sample):
+        """
+        Store a new stats sample for VM uuid
+
+        @param sample: dict of field name -> value, with a 'timestamp'
+        """
+        values = [float(sample["timestamp"])]
+        values += [float(sample.get(name, 0)) for name in self._fields]
+
+        self._lock.acquire()
+        try:
+            if not self._map or self._readonly:
+                return
+            slot = self._get_slot(uuid)
+            if slot is None:
+                return
+
+            for residx in range(len(RESOLUTIONS)):
+                if RESOLUTIONS[residx][1]:
+                    self._rollup(slot, residx, values)
+                else:
+                    self._add_record(slot, residx, values)
+        finally:
+            self._lock.release()
+
+    def history(self, uuid, resolution):
+        """
+        Return stored samples of VM uuid at 'resolution' as a list
+        of dicts, oldest first
+        """
+        count = self.get_capacity(resolution)
+        residx = [r[0] for r in RESOLUTIONS].index(resolution)
+        ret = []
+
+        self._lock.acquire()
+        try:
+            slot = self._slots.get(uuid)
+            if not self._map or slot is None:
+                return ret
+
+            head, used = self._state.unpack_from(self._map,
+                                    slot + self._state_offsets[residx])
+            ringoff = slot + self._ring_offsets[residx]
+            for idx in range(int(head - used), int(head)):
+                values = self._record.unpack_from(self._map,
+                            ringoff + (idx % count) * self._record.size)
+                sample = dict(zip(self._fields, values[1:]))
+                sample["timestamp"] = values[0]
+                ret.append(sample)
+        finally:
+            self._lock.release()
+
+        return ret
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            if self._map:
+                if not self._readonly:
+                    self._map.flush()
+                self._map.close()
+            if self._fd is not None:
+                os.close(self._fd)
+            if self._lockfd is not None:
+                os.close(self._lockfd)
+            self._map = None
+            self._fd = None
+            self._lockfd = None
+        finally:
+            self._lock.release()
@@ -21,6 +21,7 @@
 import logging
 
 # pylint: disable=E0611
+from gi.repository import GLib
 from gi.repository import GObject
 from gi.repository import Gtk
 # pylint: enable=E0611
@@ -32,6 +33,11 @@ from virtManager.createvol import vmmCreateVolume
 from virtManager.baseclass import vmmGObjectUI
 from virtManager import uihelpers
 
+# Maximum number of volumes shown when searching all pools
+SEARCH_RESULT_LIMIT = 500
+# Milliseconds without typing before searching
+SEARCH_DELAY = 300
+
 
 class vmmStorageBrowser(vmmGObjectUI):
     __gsignals__ = {
@@ -50,6 +56,8 @@ class vmmStorageBrowser(vmmGObjectUI):
         # Add Volume wizard
         self.addvol = None
 
+        self._search_timer = None
+
         # Name of VM we are choosing storage for, can be used to recommend
         # volume name if creating
         self.vm_name = None
@@ -66,6 +74,7 @@ class vmmStorageBrowser(vmmGObjectUI):
             "on_new_volume_clicked" : self.new_volume,
             "on_choose_volume_clicked" : self.finish,
             "on_vol_list_row_activated" : self.finish,
+            "on_vol_search_entry_changed" : self.vol_search_changed,
         })
         self.bind_escape_key_close()
 
@@ -83,6 +92,7 @@ class vmmStorageBrowser(vmmGObjectUI):
         self.reset_state(conn)
         self.topwin.set_transient_for(parent)
         self.topwin.present()
+        self.conn.enable_volume_index()
         self.conn.schedule_priority_tick(pollpool=True)
 
     def close(self, ignore1=None, ignore2=None):
@@ -96,6 +106,10 @@ class vmmStorageBrowser(vmmGObjectUI):
         self.remove_conn()
         self.conn = None
 
+        if self._search_timer:
+            GLib.source_remove(self._search_timer)
+            self._search_timer = None
+
         if self.addvol:
             self.addvol.cleanup()
             self.addvol = None
@@ -125,9 +139,9 @@ class vmmStorageBrowser(vmmGObjectUI):
         pool_list = self.widget("pool-list")
         host.init_pool_list(pool_list, self.pool_selected)
 
-        # (Key, Name, Cap, Format, Used By, sensitive)
+        # (Key, Name, Cap, Format, Used By, sensitive, pool uuid)
         vol_list = self.widget("vol-list")
-        volListModel = Gtk.ListStore(str, str, str, str, str, bool)
+        volListModel = Gtk.ListStore(str, str, str, str, str, bool, str)
         vol_list.set_model(volListModel)
 
         vol_list.get_selection().connect("changed", self.vol_selected)
@@ -182,12 +196,15 @@ class vmmStorageBrowser(vmmGObjectUI):
                                      self.refresh_storage_pool))
         ids.append(self.conn.connect("pool-stopped",
                                      self.refresh_storage_pool))
+        ids.append(self.conn.connect("volume-index-changed",
+                                     self.volume_index_changed))
         self.conn_signal_ids = ids
 
         # FIXME: Need a connection specific "vol-added" function?
         #        Won't be able to pick that change up from outside?
 
         # Manually trigger vol_selected, so buttons are in the correct state
+        self.widget("vol-search-entry").set_text("")
         self.vol_selected()
         self.pool_selected()
 
@@ -225,16 +242,16 @@ class vmmStorageBrowser(vmmGObjectUI):
         return self.conn.get_pool(row[0])
 
     def current_vol_row(self):
-        if not self.current_pool():
-            return
         return uihelpers.get_list_selection(self.widget("vol-list"))
 
     def current_vol(self):
-        pool = self.current_pool()
         row = self.current_vol_row()
-        if not pool or not row:
+        if not row:
             return
-        return pool.get_volume(row[0])
+        return self.conn.get_pool(row[6]).get_volume(row[0])
+
+    def get_search_text(self):
+        return self.widget("vol-search-entry").get_text().strip()
 
     def refresh_storage_pool(self, src_ignore, uuid):
         pool_list = self.widget("pool-list")
@@ -267,6 +284,27 @@ class vmmStorageBrowser(vmmGObjectUI):
 
         self.populate_storage_volumes()
 
+    def vol_search_changed(self, src_ignore):
+        if self._search_timer:
+            GLib.source_remove(self._search_timer)
+            self._search_timer = None
+
+        if not self.get_search_text():
+            self.populate_storage_volumes()
+            return
+        self._search_timer = GLib.timeout_add(SEARCH_DELAY,
+                                              self._search_timeout)
+
+    def _search_timeout(self):
+        self._search_timer = None
+        self.populate_storage_volumes()
+        return False
+
+    def volume_index_changed(self, ignore):
+        # Pending searches will pick the changes up anyways
+        if self.get_search_text() and not self._search_timer:
+            self.populate_storage_volumes()
+
     def vol_selected(self, ignore=None):
         vol = self.current_vol_row()
         canchoose = bool(vol and vol[5])
@@ -325,10 +363,33 @@ class vmmStorageBrowser(vmmGObjectUI):
 
 
     # Do stuff!
+    def is_vol_sensitive(self, fmt):
+        if self.browse_reason == self.config.CONFIG_DIR_FS:
+            return fmt == "dir"
+        if not self.rhel6_defaults:
+            return fmt != "vmdk"
+        return True
+
+    def populate_search_results(self, text):
+        # Everything shown here was looked up by the tick thread
+        model = self.widget("vol-list").get_model()
+        for entry in self.conn.search_volumes(text,
+                                              limit=SEARCH_RESULT_LIMIT):
+            namestr = ", ".join(self.conn.get_volume_users(entry.path))
+            model.append([entry.key, entry.name,
+                          entry.get_pretty_capacity(), entry.format,
+                          namestr or None,
+                          self.is_vol_sensitive(entry.format),
+                          entry.pool_uuid])
+
     def populate_storage_volumes(self):
         model = self.widget("vol-list").get_model()
         model.clear()
-        dironly = self.browse_reason == self.config.CONFIG_DIR_FS
+
+        text = self.get_search_text()
+        if text:
+            self.populate_search_results(text)
+            return
 
         pool = self.current_pool()
         if not pool:
@@ -337,7 +398,6 @@ class vmmStorageBrowser(vmmGObjectUI):
         vols = pool.get_volumes()
         for key in vols.keys():
             vol = vols[key]
-            sensitive = True
             try:
                 path = vol.get_target_path()
                 fmt = vol.get_format() or ""
@@ -359,14 +419,9 @@ class vmmStorageBrowser(vmmGObjectUI):
                 logging.exception("Failed to determine if storage volume in "
                                   "use.")
 
-            if dironly and fmt != 'dir':
-                sensitive = False
-            elif not self.rhel6_defaults:
-                if fmt == "vmdk":
-                    sensitive = False
-
             model.append([key, vol.get_name(), vol.get_pretty_capacity(),
-                          fmt, namestr, sensitive])
+                          fmt, namestr, self.is_vol_sensitive(fmt),
+                          pool.get_uuid()])
 
     def show_err(self, info, details=None):
         self.err.show_err(info,
@@ -18,6 +18,8 @@
 # MA 02110-1301 USA.
 #
 
+import logging
+
 # pylint: disable=E0611
 from gi.repository import GObject
 # pylint: enable=E0611
@@ -41,7 +43,11 @@ class vmmStoragePool(vmmLibvirtObject):
         self._active = True
 
         self._volumes = {}
+        # volume name -> key, as of the last volume listing
+        self._volume_keys = {}
+        self._last_allocation = None
         self._support_isactive = None
+        self._support_listallvolumes = None
 
         self.tick()
         self.refresh()
@@ -100,14 +106,14 @@ class vmmStoragePool(vmmLibvirtObject):
         return self._backend.autostart()
 
     def get_target_path(self):
-        return util.xpath(self.get_xml(), "/pool/target/path") or ""
+        return self._xpath("/pool/target/path") or ""
 
     def get_allocation(self):
-        return long(util.xpath(self.get_xml(), "/pool/allocation"))
+        return long(self._xpath("/pool/allocation"))
     def get_available(self):
-        return long(util.xpath(self.get_xml(), "/pool/available"))
+        return long(self._xpath("/pool/available"))
     def get_capacity(self):
-        return long(util.xpath(self.get_xml(), "/pool/capacity"))
+        return long(self._xpath("/pool/capacity"))
 
     def get_pretty_allocation(self):
         return util.pretty_bytes(self.get_allocation())
@@ -117,7 +123,7 @@ class vmmStoragePool(vmmLibvirtObject):
         return util.pretty_bytes(self.get_capacity())
 
     def get_type(self):
-        return util.xpath(self.get_xml(), "/pool/@type")
+        return self._xpath("/pool/@type")
 
     def get_volumes(self):
         self.update_volumes()
@@ -151,21 +157,85 @@ class vmmStoragePool(vmmLibvirtObject):
         self._backend.refresh(0)
         self.idle_add(cb)
 
+    def _list_volume_backends(self):
+        """
+        Return a dict of volume name -> virStorageVol. If bulk listing
+        isn't supported the values are None, and the volumes need to
+        be looked up individually.
+        """
+        if self._support_listallvolumes is None:
+            self._support_listallvolumes = self.conn.check_pool_support(
+                                    self._backend,
+                                    self.conn.SUPPORT_STORAGE_LISTALLVOLUMES)
+
+        if not self._support_listallvolumes:
+            return dict([(name, None) for name in
+                         self._backend.listVolumes()])
+        return dict([(vol.name(), vol) for vol in
+                     self._backend.listAllVolumes(0)])
+
+    def _allocation_changed(self):
+        """
+        Check the pool allocation of the refreshed XML against the
+        previous refresh. If it changed, some volume changed size.
+        """
+        try:
+            allocation = self.get_allocation()
+        except Exception, e:
+            logging.debug("Error reading allocation of pool '%s': %s",
+                          self.get_name(), e)
+            return True
+
+        changed = allocation != self._last_allocation
+        self._last_allocation = allocation
+        return changed
+
     def update_volumes(self, refresh=False):
+        """
+        Update the volume list. Volumes are only replaced when their
+        listing changed, so unchanged volumes keep their cached info.
+
+        @param refresh: The pool was just refreshed. If its allocation
+            changed, drop the cached info of all volumes, it's refetched
+            only for volumes that are shown.
+        """
         if not self.is_active():
+            self._update_volume_index([], self._volumes.keys())
             self._volumes = {}
+            self._volume_keys = {}
             return
 
-        vols = self._backend.listVolumes()
         new_vol_list = {}
-
-        for volname in vols:
-            if volname in self._volumes:
+        new_keys = {}
+        added = []
+        resized = refresh and self._allocation_changed()
+
+        for volname, backend in self._list_volume_backends().items():
+            # Bulk listed volumes carry their key, a new key under the
+            # same name means the volume was recreated
+            key = backend and backend.key() or None
+            new_keys[volname] = key
+            if (volname in self._volumes and
+                key == self._volume_keys.get(volname)):
                 new_vol_list[volname] = self._volumes[volname]
-                if refresh:
-                    new_vol_list[volname].refresh_xml()
-            else:
-                new_vol_list[volname] = vmmStorageVolume(self.conn,
-                                self._backend.storageVolLookupByName(volname),
-                                volname)
+                if resized:
+                    new_vol_list[volname].invalidate_info()
+                continue
+
+            if backend is None:
+                backend = self._backend.storageVolLookupByName(volname)
+            new_vol_list[volname] = vmmStorageVolume(self.conn,
+                                                     backend, volname)
+            added.append(new_vol_list[volname])
+
+        removed = [name for name in self._volumes
+                   if name not in new_vol_list]
         self._volumes = new_vol_list
+        self._volume_keys = new_keys
+        self._update_volume_index(added, removed)
+
+    def _update_volume_index(self, changed, removed):
+        index = self.conn.get_volume_index()
+        if not index.is_enabled() or not (changed or removed):
+            return
+        index.update_pool(self.get_uuid(), changed, removed)
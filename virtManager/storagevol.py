@@ -28,6 +28,8 @@ class vmmStorageVolume(vmmLibvirtObject):
         vmmLibvirtObject.__init__(self, conn, backend, key)
 
         self._name = key
+        self._path = None
+        self._info = None
 
     # Required class methods
     def get_name(self):
@@ -36,7 +38,27 @@ class vmmStorageVolume(vmmLibvirtObject):
         return self._backend.XMLDesc(flags)
 
     def get_path(self):
-        return self._backend.path()
+        if self._path is None:
+            self._path = self._backend.path()
+        return self._path
+
+    def _get_info(self):
+        # invalidate_info can run from another thread, so don't read
+        # self._info back after setting it
+        info = self._info
+        if info is None:
+            info = self._backend.info()
+            self._info = info
+        return info
+
+    def invalidate_info(self):
+        """
+        Drop the cached volume info and mark the cached XML as out of
+        date. Both are only refetched when they are next needed, so
+        a pool refresh doesn't cost an RPC per volume.
+        """
+        self._info = None
+        self._invalidate_xml()
 
     def get_pool(self):
         pobj = self._backend.storagePoolLookupByVolume()
@@ -47,15 +69,15 @@ class vmmStorageVolume(vmmLibvirtObject):
         self._backend = None
 
     def get_target_path(self):
-        return util.xpath(self.get_xml(), "/volume/target/path")
+        return self._xpath("/volume/target/path")
 
     def get_format(self):
-        return util.xpath(self.get_xml(), "/volume/target/format/@type")
+        return self._xpath("/volume/target/format/@type")
 
     def get_allocation(self):
-        return long(util.xpath(self.get_xml(), "/volume/allocation"))
+        return long(self._get_info()[2])
     def get_capacity(self):
-        return long(util.xpath(self.get_xml(), "/volume/capacity"))
+        return long(self._get_info()[1])
 
     def get_pretty_capacity(self):
         return util.pretty_bytes(self.get_capacity())
@@ -63,4 +85,4 @@ class vmmStorageVolume(vmmLibvirtObject):
         return util.pretty_bytes(self.get_allocation())
 
     def get_type(self):
-        return util.xpath(self.get_xml(), "/volume/format/@type")
+        return self._xpath("/volume/format/@type")
@@ -18,6 +18,7 @@
 # MA 02110-1301 USA.
 #
 
+import bisect
 import logging
 
 # pylint: disable=E0611
@@ -69,7 +70,12 @@ class vmmSystray(vmmGObject):
         self.err = vmmErrorDialog()
 
         self.conn_menuitems = {}
+        # uri -> uuid -> VM menu item
         self.conn_vm_menuitems = {}
+        # uri -> sorted list of (VM name, uuid) in the conn submenu
+        self.conn_vm_order = {}
+        # uri -> 'No virtual machines' menu item
+        self.conn_placeholders = {}
         self.vm_action_dict = {}
         self.systray_menu = None
         self.systray_icon = None
@@ -171,7 +177,7 @@ class vmmSystray(vmmGObject):
             else:
                 self.systray_icon.set_visible(do_show)
 
-    def build_vm_menu(self, vm):
+    def build_vm_menu(self, vm, menu):
         icon_size = Gtk.IconSize.MENU
 
         pause_item = Gtk.ImageMenuItem.new_with_mnemonic(_("_Pause"))
@@ -254,14 +260,12 @@ class vmmSystray(vmmGObject):
         vm_action_dict["sep"] = sep
         vm_action_dict["open"] = open_item
 
-        menu = Gtk.Menu()
-
         for key in ["run", "pause", "resume", "shutdown_menu", "sep", "open"]:
             item = vm_action_dict[key]
             item.show_all()
             menu.add(vm_action_dict[key])
 
-        return menu, vm_action_dict
+        return vm_action_dict
 
     # Helper functions
     def _get_vm_menu_item(self, vm):
@@ -273,6 +277,36 @@ class vmmSystray(vmmGObject):
                 return self.conn_vm_menuitems[uri][uuid]
         return None
 
+    def _set_conn_placeholder(self, uri):
+        vm_submenu = self.conn_menuitems[uri].get_submenu()
+        placeholder = self.conn_placeholders.pop(uri, None)
+
+        if self.conn_vm_order[uri]:
+            if placeholder:
+                vm_submenu.remove(placeholder)
+                placeholder.destroy()
+            return
+
+        if not placeholder:
+            placeholder = Gtk.MenuItem(_("No virtual machines"))
+            placeholder.set_sensitive(False)
+            placeholder.show()
+            vm_submenu.add(placeholder)
+        self.conn_placeholders[uri] = placeholder
+
+    def _build_vm_action_menu(self, menu_item, vm):
+        """
+        Fill in the action submenu of a VM item the first time it is
+        shown, rather than for every VM up front
+        """
+        uuid = vm.get_uuid()
+        if uuid in self.vm_action_dict:
+            return
+
+        self.vm_action_dict[uuid] = self.build_vm_menu(vm,
+                                                       menu_item.get_submenu())
+        self.vm_state_changed(vm)
+
     def _set_vm_status_icon(self, vm, menu_item):
         image = Gtk.Image()
         image.set_from_icon_name(vm.run_status_icon_name(),
@@ -338,7 +372,10 @@ class vmmSystray(vmmGObject):
         self.systray_menu.remove(menu_item)
         menu_item.destroy()
         del(self.conn_menuitems[uri])
-        self.conn_vm_menuitems[uri] = {}
+        for uuid in self.conn_vm_menuitems.pop(uri, {}):
+            self.vm_action_dict.pop(uuid, None)
+        self.conn_vm_order.pop(uri, None)
+        self.conn_placeholders.pop(uri, None)
 
         self.repopulate_menu_list()
 
@@ -349,53 +386,43 @@ class vmmSystray(vmmGObject):
 
     def populate_vm_list(self, conn):
         uri = conn.get_uri()
-        conn_menu_item = self.conn_menuitems[uri]
-        vm_submenu = conn_menu_item.get_submenu()
+        self.conn_vm_order[uri] = []
 
-        # Empty conn menu
-        for c in vm_submenu.get_children():
-            vm_submenu.remove(c)
-
-        vm_mappings = {}
         for vm in conn.vms.values():
-            vm_mappings[vm.get_name()] = vm.get_uuid()
-
-        vm_names = vm_mappings.keys()
-        vm_names.sort()
-
-        if len(vm_names) == 0:
-            menu_item = Gtk.MenuItem(_("No virtual machines"))
-            menu_item.set_sensitive(False)
-            vm_submenu.insert(menu_item, 0)
-            return
-
-        for i in range(0, len(vm_names)):
-            name = vm_names[i]
-            uuid = vm_mappings[name]
-            if uuid in self.conn_vm_menuitems[uri]:
-                vm_item = self.conn_vm_menuitems[uri][uuid]
-                vm_submenu.insert(vm_item, i)
+            self.vm_added(conn, vm.get_uuid())
+        self._set_conn_placeholder(uri)
 
     def vm_added(self, conn, uuid):
         uri = conn.get_uri()
         vm = conn.get_vm(uuid)
         if not vm:
             return
-        vm.connect("status-changed", self.vm_state_changed)
 
         vm_mappings = self.conn_vm_menuitems[uri]
         if uuid in vm_mappings:
             return
+        vm.connect("status-changed", self.vm_state_changed)
+        vm.connect("config-changed", self.vm_config_changed)
 
-        # Build VM list entry
+        # Build VM list entry. The action submenu is only filled in when
+        # it is first opened, except for app indicators which export the
+        # whole menu up front
         menu_item = build_image_menu_item(vm.get_name())
         vm_mappings[uuid] = menu_item
-        vm_action_menu, vm_action_dict = self.build_vm_menu(vm)
-        menu_item.set_submenu(vm_action_menu)
-        self.vm_action_dict[uuid] = vm_action_dict
+        menu_item.set_submenu(Gtk.Menu())
+        if self.systray_indicator:
+            self._build_vm_action_menu(menu_item, vm)
+        else:
+            menu_item.connect("select", self._build_vm_action_menu, vm)
 
-        # Add VM to menu list
-        self.populate_vm_list(conn)
+        # Insert it at its sorted position
+        order = self.conn_vm_order[uri]
+        entry = (vm.get_name(), uuid)
+        idx = bisect.bisect(order, entry)
+        order.insert(idx, entry)
+        conn_menu = self.conn_menuitems[uri].get_submenu()
+        conn_menu.insert(menu_item, idx)
+        self._set_conn_placeholder(uri)
 
         # Update state
         self.vm_state_changed(vm)
@@ -403,23 +430,47 @@ class vmmSystray(vmmGObject):
 
     def vm_removed(self, conn, uuid):
         uri = conn.get_uri()
-        vm_mappings = self.conn_vm_menuitems[uri]
-        if not vm_mappings:
+        vm_mappings = self.conn_vm_menuitems.get(uri)
+        if not vm_mappings or uuid not in vm_mappings:
             return
 
-        if uuid in vm_mappings:
-            conn_item = self.conn_menuitems[uri]
-            vm_menu_item = vm_mappings[uuid]
-            vm_menu = conn_item.get_submenu()
-            vm_menu.remove(vm_menu_item)
-            vm_menu_item.destroy()
-            del(vm_mappings[uuid])
-
-            if len(vm_menu.get_children()) == 0:
-                placeholder = Gtk.MenuItem(_("No virtual machines"))
-                placeholder.show()
-                placeholder.set_sensitive(False)
-                vm_menu.add(placeholder)
+        vm_menu_item = vm_mappings.pop(uuid)
+        self.conn_menuitems[uri].get_submenu().remove(vm_menu_item)
+        vm_menu_item.destroy()
+        self.vm_action_dict.pop(uuid, None)
+
+        order = self.conn_vm_order[uri]
+        idx = self._get_vm_order_index(order, uuid)
+        if idx is not None:
+            del(order[idx])
+        self._set_conn_placeholder(uri)
+
+    def _get_vm_order_index(self, order, uuid):
+        for idx in range(len(order)):
+            if order[idx][1] == uuid:
+                return idx
+        return None
+
+    def vm_config_changed(self, vm):
+        menu_item = self._get_vm_menu_item(vm)
+        if not menu_item:
+            return
+
+        # Move a renamed VM to its new sorted position
+        uri = vm.conn.get_uri()
+        uuid = vm.get_uuid()
+        name = vm.get_name()
+        order = self.conn_vm_order[uri]
+        idx = self._get_vm_order_index(order, uuid)
+        if idx is None or order[idx][0] == name:
+            return
+
+        del(order[idx])
+        entry = (name, uuid)
+        idx = bisect.bisect(order, entry)
+        order.insert(idx, entry)
+        menu_item.set_label(name)
+        self.conn_menuitems[uri].get_submenu().reorder_child(menu_item, idx)
 
     def vm_state_changed(self, vm, ignore=None, ignore2=None):
         menu_item = self._get_vm_menu_item(vm)
@@ -428,8 +479,10 @@ class vmmSystray(vmmGObject):
 
         self._set_vm_status_icon(vm, menu_item)
 
-        # Update action widget states
-        actions = self.vm_action_dict[vm.get_uuid()]
+        # Update action widget states, if the submenu was built yet
+        actions = self.vm_action_dict.get(vm.get_uuid())
+        if not actions:
+            return
 
         is_paused = vm.is_paused()
         actions["run"].set_sensitive(vm.is_runable())
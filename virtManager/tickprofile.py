@@ -0,0 +1,211 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+# Records how long each phase of vmmConnection.tick takes, and how many
+# libvirt calls it makes. Invoke this with virt-manager --tick-profile,
+# and dump the results with 'kill -USR1' or at app exit. The dump also
+# reports the engine's tick worker statistics and the state of the
+# idle_emit signal queue, to spot main loop starvation.
+
+import collections
+import logging
+import threading
+import time
+
+from virtManager import module_trace
+from virtManager.baseclass import vmmGObject
+
+# Number of ticks per connection we keep around
+HISTORY_LENGTH = 120
+
+# Upper bounds in milliseconds of the histogram buckets
+_BUCKETS = [1, 10, 100, 1000, 10000]
+
+_profiler = None
+_callcount = threading.local()
+_tick_stats_cb = None
+
+
+def _get_call_count():
+    return getattr(_callcount, "count", 0)
+
+
+def _generate_counting_wrapper(origfunc, name, do_tb):
+    ignore = name
+    ignore = do_tb
+
+    def newfunc(*args, **kwargs):
+        _callcount.count = _get_call_count() + 1
+        return origfunc(*args, **kwargs)
+
+    return newfunc
+
+
+class _NullTickRecord(object):
+    def mark(self, phase):
+        ignore = phase
+
+
+class _TickRecord(object):
+    """
+    Phase timings for a single tick. Call mark() at the end of
+    every phase.
+    """
+    def __init__(self):
+        self.phases = []
+        self._start = time.time()
+        self._calls = _get_call_count()
+
+    def mark(self, phase):
+        now = time.time()
+        calls = _get_call_count()
+        self.phases.append((phase, now - self._start, calls - self._calls))
+        self._start = now
+        self._calls = calls
+
+
+class _TickProfiler(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        # uri -> phase name -> deque of (seconds, libvirt calls)
+        self._history = {}
+        # uri -> ordered list of phase names
+        self._phase_order = {}
+
+    def add_record(self, uri, record):
+        self._lock.acquire()
+        try:
+            history = self._history.setdefault(uri, {})
+            order = self._phase_order.setdefault(uri, [])
+            total = (sum([p[1] for p in record.phases]),
+                     sum([p[2] for p in record.phases]))
+
+            for phase, duration, calls in (record.phases +
+                                           [("total",) + total]):
+                if phase not in history:
+                    history[phase] = collections.deque(
+                                            maxlen=HISTORY_LENGTH)
+                    order.append(phase)
+                history[phase].append((duration, calls))
+        finally:
+            self._lock.release()
+
+    def _format_phase(self, phase, samples):
+        buckets = [0] * (len(_BUCKETS) + 1)
+        for duration, ignore in samples:
+            ms = duration * 1000
+            idx = 0
+            while idx < len(_BUCKETS) and ms >= _BUCKETS[idx]:
+                idx += 1
+            buckets[idx] += 1
+
+        avgms = sum([d for d, c in samples]) * 1000 / len(samples)
+        maxms = max([d for d, c in samples]) * 1000
+        avgcalls = float(sum([c for d, c in samples])) / len(samples)
+
+        return ("  %-14s %10.1f %10.1f %9.1f  %s" %
+                (phase, avgms, maxms, avgcalls,
+                 " ".join(["%6d" % b for b in buckets])))
+
+    def dump(self):
+        self._lock.acquire()
+        try:
+            lines = []
+            header = ("  %-14s %10s %10s %9s  %s" %
+                      ("phase", "avg ms", "max ms", "avg calls",
+                       " ".join(["%6s" % ("<%d" % b) for b in _BUCKETS] +
+                                ["%6s" % (">=%d" % _BUCKETS[-1])])))
+
+            for uri in sorted(self._history.keys()):
+                history = self._history[uri]
+                lines.append("Tick profile for %s, last %d ticks:" %
+                             (uri, len(history.get("total", []))))
+                lines.append(header)
+                for phase in self._phase_order[uri]:
+                    lines.append(self._format_phase(phase, history[phase]))
+
+            return "\n".join(lines)
+        finally:
+            self._lock.release()
+
+
+def enable(libvirtmod):
+    """
+    Start profiling connection ticks. Wraps every function in libvirtmod
+    to count libvirt calls made by each tick phase.
+    """
+    global _profiler
+    if _profiler:
+        return
+
+    module_trace.wrap_module(libvirtmod, wrapgen=_generate_counting_wrapper)
+    _profiler = _TickProfiler()
+    logging.debug("Tick profiling enabled")
+
+
+def start_tick():
+    """
+    Return a record to mark tick phases on. If profiling is disabled,
+    the returned object does nothing.
+    """
+    if not _profiler:
+        return _NullTickRecord()
+    return _TickRecord()
+
+
+def finish_tick(uri, record):
+    if not _profiler:
+        return
+    _profiler.add_record(uri, record)
+
+
+def set_tick_stats_cb(cb):
+    """
+    Register a function returning a dict of uri -> tick worker
+    statistics, in the format of vmmEngine.get_tick_stats
+    """
+    global _tick_stats_cb
+    _tick_stats_cb = cb
+
+
+def format_tick_stats(uri, stats):
+    return ("Tick worker for %s: last=%.2fs max=%.2fs pending=%d "
+            "executed=%d merged=%d" %
+            (uri, stats["lastDuration"], stats["maxDuration"],
+             stats["queueDepth"], stats["executed"], stats["merged"]))
+
+
+def dump():
+    """
+    Log the per connection phase statistics collected so far
+    """
+    if not _profiler:
+        return
+    logging.debug("%s", _profiler.dump() or "No ticks profiled yet")
+
+    if _tick_stats_cb:
+        allstats = _tick_stats_cb()
+        for uri in sorted(allstats.keys()):
+            logging.debug("%s", format_tick_stats(uri, allstats[uri]))
+
+    stats = vmmGObject.get_idle_emit_stats()
+    logging.debug("idle_emit queue: depth=%d emitted=%d coalesced=%d "
+                  "max depth=%d max latency=%.2fs",
+                  stats["depth"], stats["emitted"], stats["coalesced"],
+                  stats["max-depth"], stats["max-latency"])
@@ -18,11 +18,13 @@
 # MA 02110-1301 USA.
 #
 
+import collections
 import logging
 import os
 import statvfs
 
 # pylint: disable=E0611
+from gi.repository import GdkPixbuf
 from gi.repository import GObject
 from gi.repository import Gtk
 # pylint: enable=E0611
@@ -30,7 +32,6 @@ from gi.repository import Gtk
 import libvirt
 
 import virtinst
-from virtinst import util
 from virtManager import config
 
 OPTICAL_DEV_PATH = 0
@@ -84,7 +85,7 @@ def host_disk_space(conn):
         # FIXME: make sure not inactive?
         # FIXME: use a conn specific function after we send pool-added
         pool.refresh()
-        avail = int(util.xpath(pool.get_xml(), "/pool/available"))
+        avail = int(pool.get_available())
 
     elif not conn.is_remote() and os.path.exists(path):
         vfs = os.statvfs(os.path.dirname(path))
@@ -1058,6 +1059,48 @@ def build_keycombo_menu(cb):
     return menu
 
 
+####################################
+# Inspection icon pixbuf LRU cache #
+####################################
+
+# Max number of decoded icons we keep around
+INSPECTION_ICON_CACHE_SIZE = 256
+
+# (vm uuid, icon data hash, width, height) -> GdkPixbuf
+_inspection_icon_cache = collections.OrderedDict()
+
+
+def get_inspection_icon_pixbuf(vm, w, h):
+    """
+    Return the VM's inspection icon scaled to w x h, or None if it
+    has none. Decoded icons are cached, so the PNG data is only
+    decoded again if it changes.
+    """
+    # libguestfs gives us the PNG data as a string.
+    png_data = vm.inspection.icon
+    if png_data is None:
+        return None
+
+    key = (vm.get_uuid(), hash(png_data), w, h)
+    pixbuf = _inspection_icon_cache.pop(key, None)
+    if pixbuf is None:
+        try:
+            pb = GdkPixbuf.PixbufLoader()
+            pb.set_size(w, h)
+            pb.write(png_data)
+            pb.close()
+            pixbuf = pb.get_pixbuf()
+        except:
+            logging.exception("Error loading inspection icon data")
+            vm.inspection.icon = None
+            return None
+
+    _inspection_icon_cache[key] = pixbuf
+    while len(_inspection_icon_cache) > INSPECTION_ICON_CACHE_SIZE:
+        _inspection_icon_cache.popitem(last=False)
+    return pixbuf
+
+
 #############
 # Misc bits #
 #############
@@ -0,0 +1,185 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+import logging
+import threading
+
+from virtinst import util
+
+
+class vmmVolumeIndexEntry(object):
+    """
+    Search data of a single storage volume. Building one makes libvirt
+    calls, so entries are only created from the tick thread.
+    """
+    __slots__ = ["pool_uuid", "key", "name", "path", "format", "capacity",
+                 "_searchtext"]
+
+    def __init__(self, pool_uuid, vol):
+        self.pool_uuid = pool_uuid
+        self.key = vol.get_name()
+        self.name = vol.get_name()
+        self.path = vol.get_target_path() or ""
+        self.format = vol.get_format() or ""
+        self.capacity = vol.get_capacity()
+
+        self._searchtext = "\n".join([self.name, self.path, self.format,
+                                      self.get_pretty_capacity()]).lower()
+
+    def get_pretty_capacity(self):
+        return util.pretty_bytes(self.capacity)
+
+    def matches(self, terms):
+        for term in terms:
+            if term not in self._searchtext:
+                return False
+        return True
+
+
+class vmmVolumeIndex(object):
+    """
+    Search index of the volumes of all active storage pools of a
+    connection. Nothing is indexed until enable() is called. After
+    that, pools queue their volume list changes with update_pool, and
+    the connection's tick thread turns them into entries with
+    process_pending. The main thread only ever reads the index.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._enabled = False
+        # pool uuid -> volume name -> vmmVolumeIndexEntry
+        self._pools = {}
+        # List of (pool uuid, changed vmmStorageVolumes, removed names)
+        self._pending = []
+        # disk path -> list of VM names using it
+        self._users = {}
+
+    def is_enabled(self):
+        return self._enabled
+
+    def enable(self):
+        self._enabled = True
+
+    def has_pool(self, pool_uuid):
+        return pool_uuid in self._pools
+
+    def __len__(self):
+        return sum([len(vols) for vols in self._pools.values()])
+
+    def update_pool(self, pool_uuid, changed, removed):
+        """
+        Queue an update of the index entries of a pool. Nothing is
+        looked up until process_pending is called.
+
+        @param changed: vmmStorageVolumes that are new or changed
+        @param removed: Names of volumes that went away
+        """
+        self._lock.acquire()
+        try:
+            self._pending.append((pool_uuid, changed, removed))
+        finally:
+            self._lock.release()
+
+    def process_pending(self):
+        """
+        Build the entries of every queued volume. Only call this from
+        the tick thread.
+
+        @returns: True if the index changed
+        """
+        self._lock.acquire()
+        try:
+            pending = self._pending
+            self._pending = []
+        finally:
+            self._lock.release()
+
+        for pool_uuid, changed, removed in pending:
+            entries = []
+            for vol in changed:
+                try:
+                    entries.append(vmmVolumeIndexEntry(pool_uuid, vol))
+                except Exception, e:
+                    logging.debug("Error indexing volume '%s': %s",
+                                  vol.get_name(), e)
+
+            self._lock.acquire()
+            try:
+                vols = self._pools.setdefault(pool_uuid, {})
+                for name in removed:
+                    vols.pop(name, None)
+                for entry in entries:
+                    vols[entry.key] = entry
+            finally:
+                self._lock.release()
+
+        return bool(pending)
+
+    def set_users(self, users):
+        """
+        Replace the map of disk path -> names of VMs using it
+
+        @returns: True if the map changed
+        """
+        if users == self._users:
+            return False
+        self._users = users
+        return True
+
+    def get_users(self, path):
+        return self._users.get(path, [])
+
+    def remove_pool(self, pool_uuid):
+        self._lock.acquire()
+        try:
+            self._pools.pop(pool_uuid, None)
+            self._pending = [p for p in self._pending if p[0] != pool_uuid]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._pools = {}
+            self._pending = []
+            self._users = {}
+            self._enabled = False
+        finally:
+            self._lock.release()
+
+    def search(self, text, limit=None):
+        """
+        Return entries whose name, path, format or size contain every
+        whitespace separated word of text, sorted by name
+
+        @param limit: Maximum number of entries to return
+        """
+        terms = text.lower().split()
+
+        self._lock.acquire()
+        try:
+            ret = [entry for vols in self._pools.values()
+                   for entry in vols.values() if entry.matches(terms)]
+        finally:
+            self._lock.release()
+
+        ret.sort(key=lambda e: (e.name, e.pool_uuid))
+        if limit is not None:
+            ret = ret[:limit]
+        return ret
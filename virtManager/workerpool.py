@@ -0,0 +1,280 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+import collections
+import logging
+import sys
+import threading
+import time
+
+
+# map() result of a job that was still queued when map() gave up on it
+CANCELLED = object()
+
+
+class _Batch(object):
+    """
+    Results of a single vmmWorkerPool.map call
+    """
+    def __init__(self, count):
+        self.cond = threading.Condition()
+        self.results = [None] * count
+        self.started = [None] * count
+        self.done = [False] * count
+        self.remaining = count
+        self.cancelled = False
+
+    def start_job(self, idx):
+        """
+        Mark job idx as running. Returns False if the batch was
+        cancelled, in which case the job must not be run.
+        """
+        self.cond.acquire()
+        try:
+            if self.cancelled:
+                return False
+            self.started[idx] = time.time()
+            self.cond.notify()
+            return True
+        finally:
+            self.cond.release()
+
+    def set_result(self, idx, result):
+        self.cond.acquire()
+        try:
+            self.results[idx] = result
+            self.done[idx] = True
+            self.remaining -= 1
+            self.cond.notify()
+        finally:
+            self.cond.release()
+
+
+class vmmWorkerPool(object):
+    """
+    Fixed maximum number of daemon threads running short, blocking jobs
+    (like libvirt RPCs) in parallel. Threads are started on demand.
+    """
+    def __init__(self, name, maxthreads):
+        self._name = name
+        self._maxthreads = maxthreads
+        # Queued (batch, idx, func, arg) jobs, or None to stop a worker
+        self._jobs = collections.deque()
+        self._jobs_cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._threads = 0
+        self._idle = 0
+        self._closed = False
+        self._stuck_logged = False
+        # worker thread name -> start time of the call it is running
+        self._busy = {}
+
+    def _start_threads(self, count):
+        self._lock.acquire()
+        try:
+            want = min(count - self._idle, self._maxthreads - self._threads)
+            for ignore in range(max(want, 0)):
+                self._threads += 1
+                t = threading.Thread(target=self._worker,
+                                     name="%s worker %d" %
+                                        (self._name, self._threads))
+                t.daemon = True
+                t.start()
+        finally:
+            self._lock.release()
+
+    def _set_idle(self, delta):
+        self._lock.acquire()
+        try:
+            self._idle += delta
+        finally:
+            self._lock.release()
+
+    def _set_busy(self, started):
+        name = threading.current_thread().name
+        self._lock.acquire()
+        try:
+            if started is None:
+                self._busy.pop(name, None)
+            else:
+                self._busy[name] = started
+        finally:
+            self._lock.release()
+
+    def _count_usable(self, timeout, maxthreads=False):
+        """
+        Number of workers that aren't stuck in a call running for
+        longer than timeout, and so can still pick up queued jobs
+
+        @param maxthreads: Count threads that could still be started too
+        """
+        now = time.time()
+        self._lock.acquire()
+        try:
+            stuck = [s for s in self._busy.values() if now - s >= timeout]
+            total = maxthreads and self._maxthreads or self._threads
+            return total - len(stuck)
+        finally:
+            self._lock.release()
+
+    def _put_job(self, job):
+        self._jobs_cond.acquire()
+        try:
+            self._jobs.append(job)
+            self._jobs_cond.notify()
+        finally:
+            self._jobs_cond.release()
+
+    def _get_job(self):
+        self._jobs_cond.acquire()
+        try:
+            while not self._jobs:
+                self._jobs_cond.wait()
+            return self._jobs.popleft()
+        finally:
+            self._jobs_cond.release()
+
+    def _drop_jobs(self, batch):
+        """
+        Remove the still queued jobs of a cancelled batch, so workers
+        stuck in a hung call don't leave them piling up
+        """
+        self._jobs_cond.acquire()
+        try:
+            self._jobs = collections.deque([job for job in self._jobs
+                                            if job is None or
+                                            job[0] is not batch])
+        finally:
+            self._jobs_cond.release()
+
+    def _worker(self):
+        while True:
+            self._set_idle(1)
+            job = self._get_job()
+            self._set_idle(-1)
+
+            if job is None:
+                self._lock.acquire()
+                try:
+                    self._threads -= 1
+                finally:
+                    self._lock.release()
+                return
+
+            batch, idx, func, arg = job
+            if not batch.start_job(idx):
+                continue
+
+            self._set_busy(time.time())
+            try:
+                result = (True, func(arg))
+            except Exception:
+                result = (False, sys.exc_info())
+            self._set_busy(None)
+            batch.set_result(idx, result)
+
+    def _next_wakeup(self, batch, timeout):
+        """
+        Return how long map() should wait for more results of batch,
+        or None if it's pointless to wait any longer
+        """
+        now = time.time()
+        wakeup = None
+        queued = False
+        for idx, started in enumerate(batch.started):
+            if batch.done[idx]:
+                continue
+            if started is None:
+                queued = True
+                continue
+            if now - started < timeout:
+                left = started + timeout - now
+                wakeup = min(wakeup or left, left)
+
+        if queued and self._count_usable(timeout):
+            # Queued jobs will still get a worker, check back regularly
+            # in case all workers end up stuck
+            wakeup = min(wakeup or 0.5, 0.5)
+        return wakeup
+
+    def map(self, func, args, timeout):
+        """
+        Run func(arg) for every arg in the pool. Every call gets timeout
+        seconds from the moment it starts running. Calls still queued
+        once no running call can finish in time anymore are cancelled.
+
+        @returns: list with an entry per arg: (True, return value),
+            (False, sys.exc_info() of the raised exception), None if
+            the call timed out, or CANCELLED if it never started.
+        """
+        if self._closed:
+            raise RuntimeError("%s: pool is closed" % self._name)
+
+        if not self._count_usable(timeout, maxthreads=True):
+            # Every worker is stuck in a hung call, don't queue jobs
+            # nothing would pick up
+            if not self._stuck_logged:
+                logging.debug("%s: all workers are stuck, not running "
+                              "any jobs", self._name)
+                self._stuck_logged = True
+            return [CANCELLED] * len(args)
+        self._stuck_logged = False
+
+        batch = _Batch(len(args))
+        for idx, arg in enumerate(args):
+            self._put_job((batch, idx, func, arg))
+        self._start_threads(len(args))
+
+        batch.cond.acquire()
+        try:
+            while batch.remaining:
+                wakeup = self._next_wakeup(batch, timeout)
+                if wakeup is None:
+                    break
+                batch.cond.wait(wakeup)
+
+            batch.cancelled = True
+            unfinished = batch.remaining
+            results = batch.results[:]
+            for idx in range(len(args)):
+                if not batch.done[idx] and batch.started[idx] is None:
+                    results[idx] = CANCELLED
+        finally:
+            batch.cond.release()
+
+        self._drop_jobs(batch)
+        if unfinished:
+            logging.debug("%s: %d of %d jobs timed out or were cancelled",
+                          self._name, unfinished, len(args))
+        return results
+
+    def close(self):
+        """
+        Stop the worker threads. Threads stuck in a call exit once
+        it returns.
+        """
+        self._lock.acquire()
+        try:
+            self._closed = True
+            count = self._threads
+        finally:
+            self._lock.release()
+
+        for ignore in range(count):
+            self._put_job(None)
@@ -323,6 +323,12 @@ SUPPORT_CONN_LISTALLINTERFACES = _make(function="virConnect.listAllInterfaces",
 SUPPORT_CONN_VIRTIO_MMIO = _make(version=1001002,
                                  drv_version=[("qemu", 1006000)])
 SUPPORT_CONN_DISK_SD = _make(version=1001002)
+SUPPORT_CONN_GETALLDOMAINSTATS = _make(version=1002008,
+                                function="virConnect.getAllDomainStats")
+SUPPORT_CONN_NODE_CPU_STATS = _make(function="virConnect.getCPUStats",
+                                    args=(-1, 0))
+SUPPORT_CONN_NODE_MEMORY_STATS = _make(function="virConnect.getMemoryStats",
+                                       args=(-1, 0))
 
 
 # Domain checks
@@ -351,6 +357,9 @@ SUPPORT_DOMAIN_LIST_SNAPSHOTS = _make(function="virDomain.listAllSnapshots",
 SUPPORT_STORAGE_CREATEVOLFROM = _make(function="virStoragePool.createXMLFrom",
                                       version=6004)
 SUPPORT_STORAGE_ISACTIVE = _make(function="virStoragePool.isActive", args=())
+SUPPORT_STORAGE_LISTALLVOLUMES = _make(
+                                function="virStoragePool.listAllVolumes",
+                                args=())
 
 # Nodedev checks
 # This can't ever require a nodedev object for back compat reasons
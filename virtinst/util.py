@@ -18,6 +18,7 @@
 # MA 02110-1301 USA.
 #
 
+import hashlib
 import logging
 import os
 import random
@@ -427,6 +428,36 @@ def xpath(xml, path=None, func=None, return_list=False,
                              register_namespace=register_namespace)
 
 
+def xml_digest(doc):
+    """
+    Return a digest of the elements, attributes and text of a parsed
+    XML document. Whitespace only text and attribute order don't alter it,
+    so formatting differences don't count as changes.
+    """
+    digest = hashlib.sha1()
+
+    def walk(node):
+        while node:
+            if node.type == "element":
+                ns = node.ns()
+                digest.update("<%s %s\0" % (ns and ns.content or "",
+                                            node.name))
+                attrs = []
+                prop = node.properties
+                while prop:
+                    attrs.append("@%s=%s\0" % (prop.name, prop.content))
+                    prop = prop.next
+                digest.update("".join(sorted(attrs)))
+                walk(node.children)
+                digest.update(">\0")
+            elif node.type != "text" or node.content.strip():
+                digest.update("%s:%s\0" % (node.type, node.content))
+            node = node.next
+
+    walk(doc.children)
+    return digest.digest()
+
+
 def lookup_pool_by_path(conn, path):
     """
     Return the first pool with matching matching target path.
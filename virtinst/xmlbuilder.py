@@ -260,10 +260,10 @@ class XMLChildProperty(property):
         return "<XMLChildProperty %s %s>" % (str(self.child_classes), id(self))
 
     def _findpropname(self, xmlbuilder):
-        for key, val in xmlbuilder._all_child_props().items():
-            if val is self:
-                return key
-        raise RuntimeError("Didn't find expected property=%s" % self)
+        try:
+            return xmlbuilder._prop_registry().propnames[self]
+        except KeyError:
+            raise RuntimeError("Didn't find expected property=%s" % self)
 
     def _get_list(self, xmlbuilder):
         propname = self._findpropname(xmlbuilder)
@@ -375,10 +375,10 @@ class XMLProperty(property):
         Map the raw property() instance to the param name it's exposed
         as in the XMLBuilder class. This is just for debug purposes.
         """
-        for key, val in xmlbuilder._all_xml_props().items():
-            if val is self:
-                return key
-        raise RuntimeError("Didn't find expected property=%s" % self)
+        try:
+            return xmlbuilder._prop_registry().propnames[self]
+        except KeyError:
+            raise RuntimeError("Didn't find expected property=%s" % self)
 
     def _xpath_for_getter(self, xmlbuilder):
         ret = self._xpath
@@ -400,7 +400,7 @@ class XMLProperty(property):
         """
         Build list of nodes that the passed xpaths reference
         """
-        nodes = _get_xpath_node(xmlbuilder._xmlstate.xml_ctx, xpath)
+        nodes = xmlbuilder._xmlstate.get_xpath_node(xpath)
         return util.listify(nodes)
 
     def _build_clear_list(self, xmlbuilder, setternode):
@@ -413,7 +413,7 @@ class XMLProperty(property):
 
         for cpath in self._setter_clear_these_first:
             cpath = xmlbuilder.fix_relative_xpath(cpath)
-            cnode = _get_xpath_node(xmlbuilder._xmlstate.xml_ctx, cpath)
+            cnode = xmlbuilder._xmlstate.get_xpath_node(cpath)
             if not cnode:
                 continue
             if setternode and setternode.nodePath() == cnode.nodePath():
@@ -554,7 +554,7 @@ class XMLProperty(property):
         Actually fetch the associated value from the backing XML
         """
         xpath = self._xpath_for_getter(xmlbuilder)
-        node = _get_xpath_node(xmlbuilder._xmlstate.xml_ctx, xpath)
+        node = xmlbuilder._xmlstate.get_xpath_node(xpath)
         if not node:
             return None
 
@@ -581,8 +581,9 @@ class XMLProperty(property):
         if root_node is None:
             root_node = xmlbuilder._xmlstate.xml_node
         xpath = self._xpath_for_setter(xmlbuilder)
-        node = _get_xpath_node(xmlbuilder._xmlstate.xml_ctx, xpath)
+        node = xmlbuilder._xmlstate.get_xpath_node(xpath)
         clearlist = self._build_clear_list(xmlbuilder, node)
+        xmlbuilder._xmlstate.invalidate_xpath_cache()
 
         node_map = []
         if clearlist:
@@ -647,6 +648,10 @@ class _XMLState(object):
             # auto free'ing of the doc
             self.xml_node.virtinst_root_doc = self.xml_root_doc
 
+            # Resolved xpath -> node lookups, shared by every object
+            # backed by this document
+            self.xml_node.virtinst_xpath_cache = {}
+
         self.node_top_xpath = self.xml_node.virtinst_node_top_xpath
         self.xml_ctx = _make_xml_context(self.xml_node)
         self.set_root_xpath(self.root_xpath)
@@ -658,6 +663,24 @@ class _XMLState(object):
         self.root_xpath = xpath or ""
         self.dump_xpath = xpath or (self.xml_root_doc and "." or
                                     self.orig_root_xpath)
+        self.invalidate_xpath_cache()
+
+    def get_xpath_node(self, xpath):
+        """
+        Return the first node matching xpath in our document, or None.
+        Lookups are cached until the document is altered.
+        """
+        cache = self.xml_node.virtinst_xpath_cache
+        if xpath not in cache:
+            cache[xpath] = _get_xpath_node(self.xml_ctx, xpath)
+        return cache[xpath]
+
+    def invalidate_xpath_cache(self):
+        """
+        Drop cached xpath lookups. Needs to be called whenever nodes
+        are added to or removed from the document.
+        """
+        self.xml_node.virtinst_xpath_cache.clear()
 
     def fix_relative_xpath(self, xpath):
         if not self.root_xpath:
@@ -674,6 +697,35 @@ class _XMLState(object):
         return _sanitize_libxml_xml(node.serialize())
 
 
+class _XMLPropRegistry(object):
+    """
+    The XMLProperty and XMLChildProperty instances of an XMLBuilder
+    class, including inherited ones. Built once per class.
+    """
+    def __init__(self, cls):
+        # name -> XMLProperty
+        self.xml_props = {}
+        # name -> XMLChildProperty
+        self.child_props = {}
+        # XMLProperty or XMLChildProperty -> name
+        self.propnames = {}
+        # child XMLBuilder class -> XMLChildProperty
+        self.child_class_props = {}
+
+        for c in reversed(type.mro(cls)[:-1]):
+            for key, val in c.__dict__.items():
+                if val.__class__ is XMLProperty:
+                    self.xml_props[key] = val
+                elif val.__class__ is XMLChildProperty:
+                    self.child_props[key] = val
+
+        for key, val in self.xml_props.items() + self.child_props.items():
+            self.propnames[val] = key
+        for val in self.child_props.values():
+            for child_class in val.child_classes:
+                self.child_class_props.setdefault(child_class, val)
+
+
 class XMLBuilder(object):
     """
     Base for all classes which build or parse domain XML
@@ -805,36 +857,40 @@ class XMLBuilder(object):
 
     _xml_node = property(lambda s: s._xmlstate.xml_node)
 
+    @classmethod
+    def _prop_registry(cls):
+        """
+        Return the _XMLPropRegistry of this class, building it on
+        first use. Stored in the class __dict__ so subclasses don't
+        pick up their parent's registry.
+        """
+        registry = cls.__dict__.get("_xml_prop_registry")
+        if registry is None:
+            registry = _XMLPropRegistry(cls)
+            cls._xml_prop_registry = registry
+        return registry
+
     def _all_xml_props(self):
         """
-        Return a list of all XMLProperty instances that this class has.
+        Return a dict of name -> XMLProperty instance for all properties
+        this class has. The dict is shared, don't modify it.
         """
-        ret = {}
-        for c in reversed(type.mro(self.__class__)[:-1]):
-            for key, val in c.__dict__.items():
-                if val.__class__ is XMLProperty:
-                    ret[key] = val
-        return ret
+        return self._prop_registry().xml_props
 
     def _all_child_props(self):
         """
-        Return a list of all XMLChildProperty instances that this class has.
+        Return a dict of name -> XMLChildProperty instance for all child
+        properties this class has. The dict is shared, don't modify it.
         """
-        ret = {}
-        for c in reversed(type.mro(self.__class__)[:-1]):
-            for key, val in c.__dict__.items():
-                if val.__class__ is XMLChildProperty:
-                    ret[key] = val
-        return ret
+        return self._prop_registry().child_props
 
     def _find_child_prop(self, child_class):
-        xmlprops = self._all_child_props()
-        for xmlprop in xmlprops.values():
-            if child_class in xmlprop.child_classes:
-                return xmlprop
-        raise RuntimeError("programming error: "
-                           "Didn't find child property for child_class=%s" %
-                           child_class)
+        try:
+            return self._prop_registry().child_class_props[child_class]
+        except KeyError:
+            raise RuntimeError("programming error: "
+                               "Didn't find child property for "
+                               "child_class=%s" % child_class)
 
     def _add_child(self, obj):
         """
@@ -856,6 +912,7 @@ class XMLBuilder(object):
 
             use_xpath = orig_xpath.rsplit("/", 1)[0]
             newnode = libxml2.parseDoc(xml).children
+            self._xmlstate.invalidate_xpath_cache()
             _build_xpath_node(self._xmlstate.xml_ctx, use_xpath, newnode)
             obj.set_root_xpath(orig_xpath)
         obj._xmlstate._parse(None, self._xmlstate.xml_node)
@@ -872,6 +929,7 @@ class XMLBuilder(object):
         xml = obj.get_xml_config()
         obj.set_root_xpath(None)
         obj._xmlstate._parse(xml, None)
+        self._xmlstate.invalidate_xpath_cache()
         _remove_xpath_node(self._xmlstate.xml_ctx, xpath, dofree=False)
         self._set_child_xpaths()
 